@@ -1,6 +1,7 @@
 from django.db.models import Count, Sum
 from rest_framework import serializers
 
+from courses.api.serializer_fields import ImageVariantsField
 from courses.api.serializers import TagSerializer, CategoryField, ReviewSerializer
 from courses.models import Course, Category, Chapter, Lesson
 from learning.api.serializers import LearnerProgressSerializer
@@ -48,11 +49,12 @@ class SimpleCatalogCourseSerializer(serializers.ModelSerializer):
     enrolled_learners = serializers.IntegerField(read_only=True, source='enrolled_learners_count')
     average_rating = serializers.FloatField(read_only=True, source='avg_rating')
     reviews_no = serializers.IntegerField(read_only=True)
+    image_srcset = ImageVariantsField(image_field='image')
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'intro', 'instructor', 'category', 'level', 'total_hours', 'price', 'image', 'tags',
-                  'average_rating', 'enrolled_learners', 'reviews_no']
+        fields = ['id', 'title', 'intro', 'instructor', 'category', 'level', 'total_hours', 'price', 'image',
+                  'image_srcset', 'tags', 'average_rating', 'enrolled_learners', 'reviews_no']
 
 
 class MobileCatalogCourseSerializer(SimpleCatalogCourseSerializer):
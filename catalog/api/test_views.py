@@ -0,0 +1,372 @@
+import io
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from catalog.models import CoursePopularity
+from catalog.recommendations import build_course_similarities
+from catalog.trending import rebuild_trending_scores
+from courses import cache_utils
+from courses.models import Course, Category, Tag, Chapter, Lesson, BaseLessonStep
+from courses_project import db_routers
+from courses_project.testing import QueryBudgetMixin, query_budget
+from learning.models import CourseEnrollment
+from teaching.models import EngagementAnalytics
+from users.models import User
+
+
+class CatalogCourseFacetsViewTest(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Instructor', 'Test')
+
+        self.development = Category.objects.create(name='Development')
+        self.web = Category.objects.create(name='Web Development', supercategory=self.development)
+        self.design = Category.objects.create(name='Design')
+        self.python = Tag.objects.create(name='Python')
+        self.django = Tag.objects.create(name='Django')
+
+        self.python_course = Course.objects.create(instructor=self.instructor, title='Python Basics', active=True,
+                                                   category=self.development, level='1', price=0)
+        self.python_course.tags.set([self.python])
+        self.django_course = Course.objects.create(instructor=self.instructor, title='Django Web Apps', active=True,
+                                                   category=self.web, level='2', price=60)
+        self.django_course.tags.set([self.python, self.django])
+        Course.objects.create(instructor=self.instructor, title='Design Systems', active=True,
+                              category=self.design, level='1', price=20)
+        # Inactive courses are never counted
+        Course.objects.create(instructor=self.instructor, title='Python Draft', active=False,
+                              category=self.development, level='3', price=200)
+
+        self.url = reverse('catalog-course-facets')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_facets(self):
+        # A query per facet
+        with self.assertQueryBudget(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        categories = {entry['name']: entry['count'] for entry in response.data['categories']}
+        # The supercategory includes the courses of its subcategories
+        self.assertEqual(categories, {'Development': 2, 'Web Development': 1, 'Design': 1})
+
+        tags = {entry['name']: entry['count'] for entry in response.data['tags']}
+        self.assertEqual(tags, {'Python': 2, 'Django': 1})
+
+        levels = {entry['value']: entry['count'] for entry in response.data['levels']}
+        self.assertEqual(levels, {'1': 2, '2': 1, '3': 0})
+
+        price = {entry['key']: entry['count'] for entry in response.data['price']}
+        self.assertEqual(price, {'free': 1, 'under_50': 1, '50_to_100': 1, 'over_100': 0})
+
+    @query_budget(4)
+    def test_get_facets_for_search(self):
+        response = self.client.get(self.url, {'search': 'python'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        tags = {entry['name']: entry['count'] for entry in response.data['tags']}
+        self.assertEqual(tags, {'Python': 2, 'Django': 1})
+
+        levels = {entry['value']: entry['count'] for entry in response.data['levels']}
+        self.assertEqual(levels, {'1': 1, '2': 1, '3': 0})
+
+    def test_get_facets_with_filters(self):
+        response = self.client.get(self.url, {'categories': 'Development', 'price__gte': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        categories = {entry['name']: entry['count'] for entry in response.data['categories']}
+        self.assertEqual(categories, {'Development': 1, 'Web Development': 1})
+
+        price = {entry['key']: entry['count'] for entry in response.data['price']}
+        self.assertEqual(price, {'free': 0, 'under_50': 0, '50_to_100': 1, 'over_100': 0})
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class CourseRecommendationsViewTest(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Instructor', 'Test')
+        self.learner = User.objects.create_user('learner@test.com', 'password', 'Learner', 'Test')
+        self.other_learner = User.objects.create_user('other@test.com', 'password', 'Other', 'Learner')
+
+        self.category = Category.objects.create(name='Development')
+        self.python = Tag.objects.create(name='Python')
+
+        self.python_course = Course.objects.create(instructor=self.instructor, title='Python', active=True)
+        self.django_course = Course.objects.create(instructor=self.instructor, title='Django', active=True)
+        self.flask_course = Course.objects.create(instructor=self.instructor, title='Flask', active=True,
+                                                  category=self.category)
+        self.rust_course = Course.objects.create(instructor=self.instructor, title='Rust', active=True,
+                                                 category=self.category)
+        self.flask_course.tags.set([self.python])
+        self.python_course.tags.set([self.python])
+
+        # Enrollments incrementally refresh the neighbour lists, once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseEnrollment.objects.create(course=self.python_course, learner=self.other_learner)
+            CourseEnrollment.objects.create(course=self.django_course, learner=self.other_learner)
+            CourseEnrollment.objects.create(course=self.python_course, learner=self.learner)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_similar_courses(self):
+        response = self.client.get(reverse('similar-courses-list', kwargs={'pk': self.python_course.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Django shares a learner with the course, Flask only shares the tag
+        self.assertEqual([course['title'] for course in response.data], ['Django', 'Flask'])
+
+    def test_similar_courses_after_rebuild(self):
+        build_course_similarities()
+        response = self.client.get(reverse('similar-courses-list', kwargs={'pk': self.flask_course.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([course['title'] for course in response.data], ['Python', 'Rust'])
+
+    def test_recommended_courses(self):
+        self.client.force_authenticate(user=self.learner)
+        with self.assertQueryBudget(6):
+            response = self.client.get(reverse('recommended-courses-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Already enrolled courses are never recommended
+        self.assertEqual([course['title'] for course in response.data], ['Django', 'Flask'])
+
+    @patch('catalog.signals.refresh_course_similarities')
+    def test_similarities_are_refreshed_after_commit(self, refresh_course_similarities):
+        with self.captureOnCommitCallbacks() as callbacks:
+            CourseEnrollment.objects.create(course=self.flask_course, learner=self.learner)
+        refresh_course_similarities.delay.assert_not_called()
+
+        callbacks[-1]()
+        course_ids = refresh_course_similarities.delay.call_args.args[0]
+        self.assertEqual(set(course_ids), {str(self.python_course.id), str(self.flask_course.id)})
+
+    def test_recommended_courses_unauthenticated(self):
+        response = self.client.get(reverse('recommended-courses-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TrendingCatalogOrderingTest(APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Instructor', 'Test')
+        self.learners = [User.objects.create_user(f'learner{i}@test.com', 'password', 'Learner', str(i))
+                         for i in range(3)]
+
+        self.quiet_course = Course.objects.create(instructor=self.instructor, title='Quiet', active=True)
+        self.popular_course = Course.objects.create(instructor=self.instructor, title='Popular', active=True)
+        self.new_course = Course.objects.create(instructor=self.instructor, title='New', active=True)
+
+        CourseEnrollment.objects.create(course=self.quiet_course, learner=self.learners[0])
+        for learner in self.learners:
+            CourseEnrollment.objects.create(course=self.popular_course, learner=learner)
+
+        self.url = reverse('web-catalog-course-list')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_trending_ordering(self):
+        response = self.client.get(self.url, {'ordering': 'trending'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Courses without any event come last
+        self.assertEqual([course['title'] for course in response.data['results']], ['Popular', 'Quiet', 'New'])
+
+    def test_trending_scores_rebuild(self):
+        incremental_scores = dict(CoursePopularity.objects.values_list('course_id', 'trending_score'))
+        rebuild_trending_scores()
+        rebuilt_scores = dict(CoursePopularity.objects.values_list('course_id', 'trending_score'))
+
+        self.assertEqual(incremental_scores.keys(), rebuilt_scores.keys())
+        for course_id, score in incremental_scores.items():
+            self.assertAlmostEqual(score, rebuilt_scores[course_id], places=3)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_engagement_counted_once_per_step(self):
+        lesson = Lesson.objects.create(chapter=Chapter.objects.create(course=self.quiet_course, title='Chapter'),
+                                       title='Lesson', order=1)
+        step = BaseLessonStep.objects.create(lesson=lesson, order=1)
+        score = CoursePopularity.objects.get(course=self.quiet_course).trending_score
+
+        with self.captureOnCommitCallbacks(execute=True):
+            engagement = EngagementAnalytics.objects.create(learner=self.learners[0], course=self.quiet_course,
+                                                            lesson_step=step, time_spent=timedelta(seconds=10))
+        engaged_score = CoursePopularity.objects.get(course=self.quiet_course).trending_score
+        self.assertGreater(engaged_score, score)
+
+        # The heartbeats of the same step don't make the course trend
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                engagement.time_spent += timedelta(seconds=10)
+                engagement.save()
+        self.assertEqual(CoursePopularity.objects.get(course=self.quiet_course).trending_score, engaged_score)
+
+
+class SearchSuggestionsViewTest(APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Pythia', 'Teacher')
+        self.category = Category.objects.create(name='Python Development')
+        self.course = Course.objects.create(instructor=self.instructor, title='Python for Data Science',
+                                            active=True, category=self.category)
+        self.course.tags.set([Tag.objects.create(name='Pandas')])
+        Course.objects.create(instructor=self.instructor, title='Python Draft', active=False)
+
+        self.url = reverse('search-suggestions')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_suggestions(self):
+        response = self.client.get(self.url, {'q': 'pyt'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        suggestions = {(suggestion['type'], suggestion['text']) for suggestion in response.data}
+        # Inactive courses are not suggested
+        self.assertEqual(suggestions, {('course', 'Python for Data Science'), ('category', 'Python Development'),
+                                       ('instructor', 'Pythia Teacher')})
+
+    def test_get_suggestions_multiple_words(self):
+        response = self.client.get(self.url, {'q': 'data pyth'})
+        self.assertEqual([suggestion['text'] for suggestion in response.data], ['Python for Data Science'])
+
+    def test_get_suggestions_after_content_change(self):
+        self.assertEqual(self.client.get(self.url, {'q': 'rust'}).data, [])
+        Course.objects.create(instructor=self.instructor, title='Rust Basics', active=True)
+
+        response = self.client.get(self.url, {'q': 'rust'})
+        self.assertEqual([suggestion['text'] for suggestion in response.data], ['Rust Basics'])
+
+    def test_get_suggestions_limit(self):
+        response = self.client.get(self.url, {'q': 'p', 'limit': 1})
+        self.assertEqual(len(response.data), 1)
+
+    def test_get_suggestions_after_instructor_change(self):
+        self.assertEqual(self.client.get(self.url, {'q': 'pythia'}).status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.instructor.first_name = 'Ada'
+            self.instructor.save()
+
+        response = self.client.get(self.url, {'q': 'ada'})
+        self.assertEqual([suggestion['text'] for suggestion in response.data], ['Ada Teacher'])
+
+    @patch('catalog.signals.invalidate_suggestion_index')
+    def test_other_user_changes_keep_the_suggestions(self, invalidate_suggestion_index):
+        learner = User.objects.create_user('learner@test.com', 'password', 'Test', 'Learner')
+        with self.captureOnCommitCallbacks(execute=True):
+            # Saved on login
+            self.instructor.last_login = timezone.now()
+            self.instructor.save(update_fields=['last_login'])
+            self.instructor.email = 'pythia@test.com'
+            self.instructor.save()
+            learner.first_name = 'Other'
+            learner.save()
+        invalidate_suggestion_index.assert_not_called()
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class CatalogImageVariantsTest(APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Instructor', 'Test')
+        self.url = reverse('web-catalog-course-list')
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_image(self, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile('logo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_built_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(instructor=self.instructor, title='Course', active=True,
+                                           image=self.create_image(1000, 500))
+
+        course.refresh_from_db()
+        self.assertEqual(course.image_variants['source'], course.image.name)
+        self.assertEqual(set(course.image_variants['webp']), {'160', '320', '640'})
+        with course.image.storage.open(course.image_variants['jpeg']['320']) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 160))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        srcset = response.data['results'][0]['image_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertTrue(srcset['webp'].endswith('_640w.webp 640w'))
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(instructor=self.instructor, title='Course', active=True,
+                                           image=self.create_image(100, 100))
+
+        course.refresh_from_db()
+        self.assertEqual(set(course.image_variants['webp']), {'100'})
+
+    def test_default_image_has_no_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(instructor=self.instructor, title='Course', active=True)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['image_srcset'], {})
+        self.assertEqual(response.data['results'][0]['instructor']['picture_srcset'], {})
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTest(APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Instructor', 'Test')
+        self.learner = User.objects.create_user('learner@test.com', 'password', 'Learner', 'Test')
+        self.course = Course.objects.create(instructor=self.instructor, title='Python', active=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_reads_go_to_the_primary_by_default(self):
+        self.assertEqual(Course.objects.all().db, 'default')
+
+    def test_replica_safe_reads(self):
+        with db_routers.reading_from_replica(self.learner):
+            self.assertEqual(Course.objects.all().db, 'replica')
+        self.assertEqual(Course.objects.all().db, 'default')
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        with db_routers.reading_from_replica(self.learner):
+            self.assertEqual(Tag.objects.create(name='Python')._state.db, 'default')
+            self.assertEqual(Course.objects.all().db, 'default')
+
+    def test_reads_after_a_write_request_go_to_the_primary(self):
+        self.client.force_authenticate(user=self.learner)
+        response = self.client.post(reverse('catalog-course-wishlist', kwargs={'pk': self.course.id}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertTrue(db_routers.is_pinned_to_primary(self.learner.pk))
+        with db_routers.reading_from_replica(self.learner):
+            self.assertEqual(Course.objects.all().db, 'default')
+        # Not the other users
+        with db_routers.reading_from_replica(self.instructor):
+            self.assertEqual(Course.objects.all().db, 'replica')
+
+    def test_shared_caches_are_filled_from_the_primary(self):
+        databases = []
+        with patch('courses.cache_utils.DetailedCatalogCourseSerializer') as serializer:
+            serializer.return_value.data = {}
+            serializer.side_effect = lambda course: databases.append(Course.objects.all().db) or serializer.return_value
+            with db_routers.reading_from_replica(self.learner):
+                cache_utils.get_catalog_course_data(self.course)
+                self.assertEqual(Course.objects.all().db, 'replica')
+        self.assertEqual(databases, ['default'])
+
+    def test_replica_safe_views(self):
+        self.client.force_authenticate(user=self.instructor)
+        with patch('courses_project.db_routers.reading_from_replica', wraps=db_routers.reading_from_replica) as \
+                reading_from_replica, override_settings(REPLICA_DATABASES=[]):
+            self.client.get(reverse('catalog-course-view', kwargs={'pk': self.course.id}))
+            self.client.get(reverse('enrollment-analytics', kwargs={'course_id': self.course.id}))
+        self.assertEqual([call.args[0] for call in reading_from_replica.call_args_list],
+                         [self.instructor, self.instructor])
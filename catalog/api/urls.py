@@ -5,11 +5,16 @@ from catalog.api import views
 urlpatterns = [
     path('web/courses/', views.WebCatalogCourseListView.as_view(), name='web-catalog-course-list'),
     path('mobile/courses/', views.MobileCatalogCourseListView.as_view(), name='mobile-catalog-course-list'),
+    path('courses/facets/', views.CatalogCourseFacetsView.as_view(), name='catalog-course-facets'),
     path('courses/<uuid:pk>/', views.CatalogCourseView.as_view(), name='catalog-course-view'),
     path('courses/<uuid:course_id>/reviews/', views.CourseReviewsListView.as_view(), name='course-reviews-list'),
+    path('courses/<uuid:pk>/similar/', views.SimilarCoursesListView.as_view(), name='similar-courses-list'),
     path('courses/<uuid:pk>/enroll/', views.course_enroll, name='catalog-course-enroll'),
     path('courses/<uuid:pk>/wishlist/', views.course_wishlist, name='catalog-course-wishlist'),
     path('wishlist/', views.get_wishlist, name='catalog-view-wishlist'),
+    path('recommended/', views.RecommendedCoursesListView.as_view(), name='recommended-courses-list'),
+
+    path('suggestions/', views.get_search_suggestions, name='search-suggestions'),
 
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('tags/', views.TagListView.as_view(), name='tag-list'),
@@ -1,43 +1,60 @@
-from django.db.models import Avg, Count, Value, F, OuterRef, Subquery
+from abc import ABCMeta, abstractmethod
+
+from django.db.models import Avg, Count, Value, F, OuterRef, Subquery, Sum
 from django.db.models.functions import Coalesce
 from django_filters import rest_framework as filters
 
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
 
 from catalog.api.filters import MultiFieldSearchFilter, CourseFilter
+from catalog.facets import CourseFacets
+from catalog.models import CourseSimilarity
+from catalog.recommendations import TOP_K
+from catalog.suggestions import get_suggestions, MAX_SUGGESTIONS
 from catalog.api.serializers import DetailedCatalogCourseSerializer, SimpleCatalogCourseSerializer, \
     CategoryListSerializer, MobileCatalogCourseSerializer
 from courses import cache_utils
 from courses.api.serializers import TagSerializer, CourseReviewsSerializer
 from courses.models import Course, Category, Tag, Review
+from courses_project.db_routers import ReplicaSafeMixin
 from learning.models import CourseEnrollment
 
 
-class BaseCatalogCourseListView(generics.ListAPIView):
+def annotate_catalog_courses(queryset):
+    """
+    Annotate a course queryset with the aggregates used by the catalog list serializers.
+    """
+    # Create a subquery to count reviews accurately
+    review_count_subquery = Review.objects.filter(course=OuterRef('pk')).values('course').annotate(
+        count=Count('pk')).values('count')
+
+    return (queryset
+            .annotate(avg_rating=Coalesce(Avg('review__rating'), Value(0.0)))
+            .annotate(enrolled_learners_count=Count('enrolled_learners', distinct=True))
+            .annotate(reviews_no=Coalesce(Subquery(review_count_subquery), Value(0))))
+
+
+class BaseCatalogCourseListView(ReplicaSafeMixin, generics.ListAPIView):
     ordering_fields = ['avg_rating', 'title', 'price', 'enrolled_learners', 'reviews_no']
     filter_backends = [MultiFieldSearchFilter, filters.DjangoFilterBackend, OrderingFilter]
     pagination_class = type('StandardPagination', (PageNumberPagination,), {'page_size': 20})
     filterset_class = CourseFilter
 
     def get_queryset(self):
-        # Create a subquery to count reviews accurately
-        review_count_subquery = Review.objects.filter(course=OuterRef('pk')).values('course').annotate(
-            count=Count('pk')).values('count')
-
-        return (Course.objects.filter(active=True)
-                .annotate(avg_rating=Coalesce(Avg('review__rating'), Value(0.0)))
-                .annotate(enrolled_learners_count=Count('enrolled_learners', distinct=True))
-                .annotate(reviews_no=Coalesce(Subquery(review_count_subquery), Value(0))))
+        return annotate_catalog_courses(Course.objects.filter(active=True))
 
     def filter_queryset(self, queryset):
         queryset = super().filter_queryset(queryset)
         ordering = self.request.query_params.get("ordering", "")
+        if ordering == 'trending':
+            # Most trending first, served by the index on the decayed score; courses without any event go last
+            return queryset.order_by(F('popularity__trending_score').desc(nulls_last=True), 'title')
         if ordering.lstrip('-') == 'enrolled_learners':
             ordering = '-enrolled_learners_count' if ordering.startswith('-') else 'enrolled_learners_count'
         ordering_fields = ['avg_rating', 'title', 'price', 'enrolled_learners_count', 'reviews_no']
@@ -65,7 +82,71 @@ class MobileCatalogCourseListView(BaseCatalogCourseListView):
     pagination_class = type('MobilePagination', (PageNumberPagination,), {'page_size': 10})
 
 
-class CatalogCourseView(generics.RetrieveAPIView):
+class CatalogCourseFacetsView(BaseCatalogCourseListView):
+    """
+    Returns the filter sidebar counts for the current search/filter state of the catalog list views.
+    """
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(CourseFacets.get_facets(queryset))
+
+
+class BaseRecommendedCourseListView(ReplicaSafeMixin, generics.ListAPIView, metaclass=ABCMeta):
+    """
+    Base view for the recommendation lists, which only read the precomputed CourseSimilarity neighbour lists.
+    """
+    serializer_class = SimpleCatalogCourseSerializer
+    default_limit = 10
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, TOP_K))
+
+    @abstractmethod
+    def get_ranked_course_ids(self, limit):
+        """
+        :return: ids of at most limit courses, best ranked first
+        """
+
+    def list(self, request, *args, **kwargs):
+        course_ids = self.get_ranked_course_ids(self.get_limit())
+        courses = annotate_catalog_courses(Course.objects.filter(id__in=course_ids, active=True))
+        # Keep the ranking order of the neighbour lists
+        ranking = {course_id: index for index, course_id in enumerate(course_ids)}
+        courses = sorted(courses, key=lambda course: ranking[course.id])
+
+        serializer = self.get_serializer(courses, many=True)
+        return Response(serializer.data)
+
+
+class SimilarCoursesListView(BaseRecommendedCourseListView):
+    def get_ranked_course_ids(self, limit):
+        course = get_object_or_404(Course, id=self.kwargs['pk'], active=True)
+        return list(CourseSimilarity.objects.filter(course=course)
+                    .values_list('similar_course_id', flat=True)[:limit])
+
+
+class RecommendedCoursesListView(BaseRecommendedCourseListView):
+    permission_classes = [IsAuthenticated]
+
+    def get_ranked_course_ids(self, limit):
+        enrolled_courses = CourseEnrollment.objects.filter(learner=self.request.user).values('course')
+        # Courses close to several of the learner's courses rank higher
+        recommendations = (CourseSimilarity.objects
+                           .filter(course__in=enrolled_courses)
+                           .exclude(similar_course__in=enrolled_courses)
+                           .values('similar_course')
+                           .annotate(total_score=Sum('score'))
+                           .order_by('-total_score')[:limit])
+        return [recommendation['similar_course'] for recommendation in recommendations]
+
+
+class CatalogCourseView(ReplicaSafeMixin, generics.RetrieveAPIView):
     serializer_class = DetailedCatalogCourseSerializer
 
     def get_queryset(self):
@@ -137,17 +218,34 @@ def get_wishlist(request):
     return Response(serializer.data)
 
 
-class CategoryListView(generics.ListAPIView):
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def get_search_suggestions(request):
+    """
+    Typeahead suggestions (course titles, tags, categories and instructors) for the catalog search box.
+    Served from the in-process prefix index, without authentication nor database queries.
+    """
+    query = request.query_params.get('q', '')
+    try:
+        limit = int(request.query_params.get('limit', MAX_SUGGESTIONS))
+    except ValueError:
+        limit = MAX_SUGGESTIONS
+
+    return Response(get_suggestions(query, max(1, limit)))
+
+
+class CategoryListView(ReplicaSafeMixin, generics.ListAPIView):
     queryset = Category.objects.filter(supercategory__isnull=True)  # Top-level categories only
     serializer_class = CategoryListSerializer
 
 
-class TagListView(generics.ListAPIView):
+class TagListView(ReplicaSafeMixin, generics.ListAPIView):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class CourseReviewsListView(generics.ListAPIView):
+class CourseReviewsListView(ReplicaSafeMixin, generics.ListAPIView):
     serializer_class = CourseReviewsSerializer
     filter_backends = [OrderingFilter]
     ordering_fields = ['creation_date', 'rating']
@@ -0,0 +1,85 @@
+from django.db.models import Count, Q
+
+from courses import cache_utils
+from courses.models import Course
+
+# (key, min price, max price), None meaning unbounded
+PRICE_BUCKETS = [
+    ('free', 0, 0),
+    ('under_50', 1, 49),
+    ('50_to_100', 50, 100),
+    ('over_100', 101, None),
+]
+
+
+class CourseFacets:
+    """
+    Computes the filter sidebar counts (categories, tags, levels and price buckets)
+    for an already searched/filtered catalog queryset, with one grouped query per facet family.
+    """
+
+    @classmethod
+    def get_facets(cls, queryset):
+        # Strip the list annotations and ordering, the facet queries only need the matching ids
+        courses = Course.objects.filter(id__in=queryset.order_by().values('id'))
+
+        level_and_price_counts = courses.aggregate(
+            **{f'level_{value}': Count('id', filter=Q(level=value)) for value, _ in Course.DifficultyLevel.choices},
+            **{f'price_{key}': Count('id', filter=cls.get_price_bucket_query(low, high))
+               for key, low, high in PRICE_BUCKETS}
+        )
+
+        return {
+            'categories': cls.get_category_facets(courses),
+            'tags': cls.get_tag_facets(courses),
+            'levels': [
+                {'value': value, 'label': label, 'count': level_and_price_counts[f'level_{value}']}
+                for value, label in Course.DifficultyLevel.choices
+            ],
+            'price': [
+                {'key': key, 'min': low, 'max': high, 'count': level_and_price_counts[f'price_{key}']}
+                for key, low, high in PRICE_BUCKETS
+            ],
+        }
+
+    @staticmethod
+    def get_price_bucket_query(low, high):
+        query = Q(price__gte=low)
+        if high is not None:
+            query &= Q(price__lte=high)
+        return query
+
+    @staticmethod
+    def get_category_facets(courses):
+        """
+        Counts courses per category. Supercategories also include the courses of their subcategories,
+        matching the behaviour of the `categories` filter.
+        """
+        direct_counts = {
+            entry['category']: entry['count']
+            for entry in courses.exclude(category=None).values('category').annotate(count=Count('id'))
+        }
+        if not direct_counts:
+            return []
+
+        categories = cache_utils.get_categories()
+        totals = dict(direct_counts)
+        for category in categories:
+            if category.supercategory_id and category.id in direct_counts:
+                totals[category.supercategory_id] = totals.get(category.supercategory_id, 0) + direct_counts[category.id]
+
+        return [
+            {'id': category.id, 'name': category.name, 'supercategory': category.supercategory_id,
+             'count': totals[category.id]}
+            for category in categories if category.id in totals
+        ]
+
+    @staticmethod
+    def get_tag_facets(courses):
+        tag_counts = (courses.exclude(tags=None)
+                      .values('tags__id', 'tags__name')
+                      .annotate(count=Count('id', distinct=True))
+                      .order_by('-count', 'tags__name'))
+
+        return [{'id': entry['tags__id'], 'name': entry['tags__name'], 'count': entry['count']}
+                for entry in tag_counts]
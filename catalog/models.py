@@ -1,3 +1,33 @@
 from django.db import models
 
-# Create your models here.
+
+class CourseSimilarity(models.Model):
+    """
+    Precomputed top-K neighbour list entry: `similar_course` is one of the most similar courses to `course`,
+    blending co-enrollment and tag/category similarity.
+    """
+    course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, related_name='similarities')
+    similar_course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ['course', 'similar_course']
+        ordering = ['-score']
+
+    def __str__(self):
+        return f'{self.course} -> {self.similar_course}: {self.score:.3f}'
+
+
+class CoursePopularity(models.Model):
+    """
+    Exponentially decayed popularity of a course, see catalog.trending.
+    The score is stored in log space relative to a fixed epoch, so it never has to be decayed in place
+    and ordering by it always gives the current trending order.
+    """
+    course = models.OneToOneField('courses.Course', on_delete=models.CASCADE, primary_key=True,
+                                  related_name='popularity')
+    trending_score = models.FloatField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.course}: {self.trending_score:.3f}'
@@ -0,0 +1,203 @@
+"""
+Offline "similar courses" model.
+
+Course x course similarity is the blend of the co-enrollment Jaccard index (learners who took A also took B)
+and a tag/category Jaccard index, kept as a sparse dict-of-counters matrix since only courses that share
+learners, tags or categories ever get a non-zero score. Only the top-K neighbours of every course are stored,
+so the catalog endpoints just read the precomputed lists.
+"""
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+from operator import itemgetter
+from uuid import UUID
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from catalog.models import CourseSimilarity
+from courses import cache_utils
+from courses.models import Course
+from learning.models import CourseEnrollment
+
+TOP_K = 20
+CO_ENROLLMENT_WEIGHT = 0.7
+CONTENT_WEIGHT = 0.3
+TAG_WEIGHT = 0.7  # share of the content similarity, the rest comes from the category
+CHUNK_SIZE = 2000
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0
+    intersection = len(first & second)
+    return intersection / (len(first) + len(second) - intersection)
+
+
+def get_course_features(queryset):
+    """
+    Return a {course_id: (category_ids, tag_ids)} dict for the active courses in the queryset.
+    The category ids of a course include its supercategory, so sibling categories are partially similar.
+    """
+    categories = {category.id: category for category in cache_utils.get_categories()}
+    features = {}
+    rows = queryset.filter(active=True).order_by().values_list('id', 'category_id', 'tags')
+    for course_id, category_id, tag_id in rows:
+        category_ids, tag_ids = features.setdefault(course_id, (set(), set()))
+        if category_id is not None:
+            category_ids.add(category_id)
+            category = categories.get(category_id)
+            if category and category.supercategory_id:
+                category_ids.add(category.supercategory_id)
+        if tag_id is not None:
+            tag_ids.add(tag_id)
+
+    return features
+
+
+def content_similarity(first_features, second_features):
+    first_categories, first_tags = first_features
+    second_categories, second_tags = second_features
+    return (TAG_WEIGHT * jaccard(first_tags, second_tags)
+            + (1 - TAG_WEIGHT) * jaccard(first_categories, second_categories))
+
+
+def rank_neighbours(course_id, candidate_ids, features, co_enrollment_counts, enrollment_counts):
+    """
+    Return the TOP_K (similar_course_id, score) pairs for a course.
+
+    :param course_id: id of the course to rank the neighbours for
+    :param candidate_ids: ids of the courses sharing learners, tags or categories with the course
+    :param features: course features dict, as returned by get_course_features
+    :param co_enrollment_counts: {other_course_id: number of learners enrolled in both courses}
+    :param enrollment_counts: {course_id: number of enrolled learners}
+    """
+    scores = []
+    for other_id in candidate_ids:
+        if other_id == course_id or other_id not in features:
+            continue
+
+        co_enrolled = co_enrollment_counts.get(other_id, 0)
+        co_enrollment_similarity = 0
+        if co_enrolled:
+            co_enrollment_similarity = co_enrolled / (
+                    enrollment_counts[course_id] + enrollment_counts[other_id] - co_enrolled)
+
+        score = (CO_ENROLLMENT_WEIGHT * co_enrollment_similarity
+                 + CONTENT_WEIGHT * content_similarity(features[course_id], features[other_id]))
+        if score > 0:
+            scores.append((score, other_id))
+
+    return [(other_id, score) for score, other_id in heapq.nlargest(TOP_K, scores)]
+
+
+def build_feature_postings(features):
+    postings = defaultdict(set)
+    for course_id, (category_ids, tag_ids) in features.items():
+        for category_id in category_ids:
+            postings[('category', category_id)].add(course_id)
+        for tag_id in tag_ids:
+            postings[('tag', tag_id)].add(course_id)
+    return postings
+
+
+def get_content_candidates(course_features, postings):
+    category_ids, tag_ids = course_features
+    candidates = set()
+    for category_id in category_ids:
+        candidates |= postings[('category', category_id)]
+    for tag_id in tag_ids:
+        candidates |= postings[('tag', tag_id)]
+    return candidates
+
+
+def iter_learner_courses():
+    """
+    Yield the set of active course ids of every learner, streaming the enrollments ordered by learner.
+    """
+    rows = (CourseEnrollment.objects.filter(course__active=True)
+            .order_by('learner_id')
+            .values_list('learner_id', 'course_id')
+            .iterator(chunk_size=CHUNK_SIZE))
+    for _, learner_rows in groupby(rows, key=itemgetter(0)):
+        yield {course_id for _, course_id in learner_rows}
+
+
+def build_course_similarities():
+    """
+    Rebuild the neighbour lists of every active course from scratch.
+    :return: number of stored CourseSimilarity rows
+    """
+    features = get_course_features(Course.objects.all())
+
+    enrollment_counts = Counter()
+    co_enrollments = defaultdict(Counter)
+    for learner_courses in iter_learner_courses():
+        enrollment_counts.update(learner_courses)
+        for first_id, second_id in combinations(learner_courses, 2):
+            co_enrollments[first_id][second_id] += 1
+            co_enrollments[second_id][first_id] += 1
+
+    postings = build_feature_postings(features)
+
+    similarities = []
+    for course_id, course_features in features.items():
+        candidate_ids = set(co_enrollments[course_id]) | get_content_candidates(course_features, postings)
+        neighbours = rank_neighbours(course_id, candidate_ids, features, co_enrollments[course_id],
+                                     enrollment_counts)
+        similarities.extend(CourseSimilarity(course_id=course_id, similar_course_id=similar_course_id, score=score)
+                            for similar_course_id, score in neighbours)
+
+    with transaction.atomic():
+        CourseSimilarity.objects.all().delete()
+        CourseSimilarity.objects.bulk_create(similarities, batch_size=CHUNK_SIZE)
+
+    return len(similarities)
+
+
+def refresh_course_similarities(course_ids):
+    """
+    Incrementally recompute the neighbour lists of the given courses only, e.g. after an enrollment.
+    """
+    for course_id in course_ids:
+        course_id = UUID(str(course_id))
+        course_features = get_course_features(Course.objects.filter(id=course_id)).get(course_id)
+
+        if course_features is None:
+            # Inactive or deleted course, it shouldn't have recommendations
+            CourseSimilarity.objects.filter(course_id=course_id).delete()
+            continue
+
+        learners = CourseEnrollment.objects.filter(course_id=course_id).values('learner')
+        co_enrollment_counts = dict(
+            CourseEnrollment.objects.filter(learner__in=learners, course__active=True)
+            .exclude(course_id=course_id)
+            .order_by()
+            .values_list('course')
+            .annotate(count=Count('id'))
+        )
+
+        category_ids, tag_ids = course_features
+        content_candidates = (Course.objects.filter(active=True)
+                              .filter(Q(tags__in=tag_ids) | Q(category_id__in=category_ids)
+                                      | Q(category__supercategory_id__in=category_ids))
+                              .values_list('id', flat=True)
+                              .distinct())
+        candidate_ids = set(co_enrollment_counts) | set(content_candidates)
+
+        features = get_course_features(Course.objects.filter(id__in=candidate_ids | {course_id}))
+        enrollment_counts = Counter(dict(
+            CourseEnrollment.objects.filter(course_id__in=set(co_enrollment_counts) | {course_id})
+            .order_by()
+            .values_list('course')
+            .annotate(count=Count('id'))
+        ))
+
+        neighbours = rank_neighbours(course_id, candidate_ids, features, co_enrollment_counts, enrollment_counts)
+
+        with transaction.atomic():
+            CourseSimilarity.objects.filter(course_id=course_id).delete()
+            CourseSimilarity.objects.bulk_create([
+                CourseSimilarity(course_id=course_id, similar_course_id=similar_course_id, score=score)
+                for similar_course_id, score in neighbours
+            ])
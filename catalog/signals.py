@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from courses.models import Review, Course, Tag, Category
+from learning.models import CourseEnrollment
+from teaching.models import EngagementAnalytics
+from users.models import User
+from . import trending
+from .suggestions import invalidate_suggestion_index
+from .tasks import refresh_course_similarities, record_course_event
+
+# The fields of the instructors in the suggestion index, see catalog.suggestions.build_suggestion_index
+SUGGESTED_INSTRUCTOR_FIELDS = ['first_name', 'last_name', 'is_private']
+
+
+@receiver(post_save, sender=CourseEnrollment)
+def handle_enrollment_create(sender, instance, created, **kwargs):
+    if created:
+        refresh_learner_courses_similarities(instance)
+        trending.record_course_event(instance.course_id, trending.ENROLLMENT_WEIGHT)
+
+
+@receiver(post_delete, sender=CourseEnrollment)
+def handle_enrollment_delete(sender, instance, **kwargs):
+    refresh_learner_courses_similarities(instance)
+
+
+@receiver(post_save, sender=Review)
+def handle_review_create(sender, instance, created, **kwargs):
+    if created:
+        trending.record_course_event(instance.course_id, trending.REVIEW_WEIGHT_PER_STAR * instance.rating)
+
+
+@receiver(post_save, sender=EngagementAnalytics)
+def handle_engagement_create(sender, instance, created, **kwargs):
+    # One event per learner and step, as counted by rebuild_trending_scores, however often the step is engaged with.
+    # Not recorded by the request, the row of the course is updated by every engaged learner
+    if created:
+        course_id, timestamp = str(instance.course_id), instance.last_accessed.isoformat()
+        transaction.on_commit(lambda: record_course_event.delay(course_id, trending.ENGAGEMENT_WEIGHT, timestamp))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Course.tags.through)
+def handle_suggestions_content_change(sender, **kwargs):
+    invalidate_suggestion_index()
+
+
+@receiver(pre_save, sender=User)
+def handle_instructor_name_change(sender, instance, update_fields=None, **kwargs):
+    """
+    Users are saved on every login, only the names of the instructors of active courses are suggested.
+    """
+    if instance._state.adding:
+        return
+
+    fields = [field for field in SUGGESTED_INSTRUCTOR_FIELDS if update_fields is None or field in update_fields]
+    if not fields:
+        return
+
+    stored = User.objects.filter(id=instance.id, course__active=True).values(*fields).first()
+    if stored and any(stored[field] != getattr(instance, field) for field in fields):
+        transaction.on_commit(invalidate_suggestion_index)
+
+
+def refresh_learner_courses_similarities(enrollment):
+    # The co-enrollment counts change between the enrollment course and every other course of the learner
+    course_ids = set(CourseEnrollment.objects.filter(learner_id=enrollment.learner_id)
+                     .values_list('course_id', flat=True))
+    course_ids = [str(course_id) for course_id in course_ids | {enrollment.course_id}]
+    transaction.on_commit(lambda: refresh_course_similarities.delay(course_ids))
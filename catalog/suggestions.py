@@ -0,0 +1,143 @@
+"""
+Catalog search box suggestions.
+
+Suggestions are served from a compact in-process prefix index: a sorted list of the words of every active course
+title, tag, category and instructor name, searched with bisect. Each process lazily rebuilds its index when the
+shared version key in the cache is bumped by a content change, so a lookup never touches the database.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from courses.models import Course, Tag, Category
+from users.models import User
+
+VERSION_CACHE_KEY = 'catalog_suggestions_version'
+VERSION_CHECK_INTERVAL = 5  # seconds between two checks of the shared version in the same process
+MAX_INDEX_AGE = 600  # seconds, refreshes the popularity weights even without content changes
+MAX_SUGGESTIONS = 10
+MAX_SCANNED_KEYS = 2000  # bounds the lookup time of very short prefixes
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(TOKEN_PATTERN.findall(text.lower()))
+
+
+class SuggestionIndex:
+    def __init__(self, entries):
+        """
+        :param entries: list of (type, id, text, weight) tuples
+        """
+        self.entries = entries
+        self.entry_tokens = []
+        keys = []
+        for position, (_, _, text, _) in enumerate(entries):
+            tokens = normalize(text).split()
+            self.entry_tokens.append(tokens)
+            keys.extend((token, position) for token in set(tokens))
+
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        query_tokens = normalize(query).split()
+        if not query_tokens:
+            return []
+
+        # Look up the longest token in the index, then check that the other tokens prefix a word of the entry
+        lookup_token = max(query_tokens, key=len)
+        other_tokens = [token for token in query_tokens if token is not lookup_token]
+
+        start = bisect_left(self.keys, lookup_token)
+        end = min(start + MAX_SCANNED_KEYS, len(self.keys))
+        matches = set()
+        for index in range(start, end):
+            if not self.keys[index].startswith(lookup_token):
+                break
+            position = self.positions[index]
+            tokens = self.entry_tokens[position]
+            if all(any(token.startswith(other) for token in tokens) for other in other_tokens):
+                matches.add(position)
+
+        ranked = sorted(matches, key=lambda position: (-self.entries[position][3], self.entries[position][2]))
+        return [
+            {'type': entry_type, 'id': entry_id, 'text': text}
+            for entry_type, entry_id, text, _ in (self.entries[position] for position in ranked[:limit])
+        ]
+
+
+def build_suggestion_index():
+    courses = (Course.objects.filter(active=True)
+               .annotate(weight=Count('enrolled_learners', distinct=True))
+               .values_list('id', 'title', 'weight'))
+    tags = (Tag.objects.filter(course__active=True)
+            .annotate(weight=Count('course', distinct=True))
+            .values_list('id', 'name', 'weight'))
+    categories = (Category.objects.filter(course__active=True)
+                  .annotate(weight=Count('course', distinct=True))
+                  .values_list('id', 'name', 'weight'))
+    # Private profiles are displayed anonymously, so they can't be searched by name
+    instructors = (User.objects.filter(course__active=True, is_private=False)
+                   .annotate(weight=Count('course', distinct=True))
+                   .values_list('id', 'first_name', 'last_name', 'weight'))
+
+    entries = [('course', course_id, title, weight) for course_id, title, weight in courses]
+    entries += [('tag', tag_id, name, weight) for tag_id, name, weight in tags]
+    entries += [('category', category_id, name, weight) for category_id, name, weight in categories]
+    entries += [('instructor', user_id, f'{first_name} {last_name}', weight)
+                for user_id, first_name, last_name, weight in instructors]
+
+    return SuggestionIndex(entries)
+
+
+_index = None
+_index_version = None
+_index_built_at = 0
+_version_checked_at = 0
+_build_lock = threading.Lock()
+
+
+def invalidate_suggestion_index():
+    """
+    Signal all the processes to rebuild their index on their next lookup.
+    """
+    global _version_checked_at
+
+    cache.set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+    # The current process sees its own changes right away, the others on their next version check
+    _version_checked_at = 0
+
+
+def get_suggestion_index():
+    global _index, _index_version, _index_built_at, _version_checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _version_checked_at < VERSION_CHECK_INTERVAL:
+        return _index
+
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_CACHE_KEY, version, timeout=None)
+        version = cache.get(VERSION_CACHE_KEY, version)
+
+    if _index is None or version != _index_version or now - _index_built_at > MAX_INDEX_AGE:
+        with _build_lock:
+            if _index is None or version != _index_version or now - _index_built_at > MAX_INDEX_AGE:
+                _index = build_suggestion_index()
+                _index_version = version
+                _index_built_at = now
+
+    _version_checked_at = now
+    return _index
+
+
+def get_suggestions(query, limit=MAX_SUGGESTIONS):
+    return get_suggestion_index().search(query, min(limit, MAX_SUGGESTIONS))
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+from catalog import recommendations, trending
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def refresh_course_similarities(course_ids):
+    logger.info(f"Refreshing the similar courses of {len(course_ids)} courses...")
+    recommendations.refresh_course_similarities(course_ids)
+
+
+@shared_task
+def record_course_event(course_id, weight, timestamp=None):
+    trending.record_course_event(course_id, weight, datetime.fromisoformat(timestamp) if timestamp else None)
@@ -0,0 +1,105 @@
+"""
+Time-decayed course popularity.
+
+Every enrollment, review or engagement event adds `weight * exp(-decay_rate * age)` to the course popularity.
+Instead of decaying every course periodically, the score is kept relative to a fixed epoch in log space:
+
+    trending_score = log(sum(weight * exp(decay_rate * (event_time - EPOCH))))
+
+All the scores are shifted by the same amount as time passes, so ordering by the stored column is the current
+trending order, and adding an event is a single log-sum-exp UPDATE of one indexed row.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from catalog.models import CoursePopularity
+from courses.models import Review
+from learning.models import CourseEnrollment
+from teaching.models import EngagementAnalytics
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE', 7 * 24 * 3600)  # seconds
+DECAY_RATE = math.log(2) / HALF_LIFE
+
+ENROLLMENT_WEIGHT = 1.0
+REVIEW_WEIGHT_PER_STAR = 0.2
+ENGAGEMENT_WEIGHT = 0.05
+
+
+def get_event_score(weight, timestamp=None):
+    timestamp = timestamp or timezone.now()
+    return math.log(weight) + DECAY_RATE * (timestamp - EPOCH).total_seconds()
+
+
+def log_add_exp(first, second):
+    if first < second:
+        first, second = second, first
+    return first + math.log1p(math.exp(second - first))
+
+
+def record_course_event(course_id, weight, timestamp=None):
+    """
+    Add an event of the given weight to the course popularity.
+    """
+    if weight <= 0:
+        return
+
+    event_score = Value(get_event_score(weight, timestamp))
+    # log(exp(a) + exp(b)) = max(a, b) + log(1 + exp(-|a - b|)), computed in the database to avoid lost updates
+    updated = CoursePopularity.objects.filter(course_id=course_id).update(
+        trending_score=Greatest(F('trending_score'), event_score)
+        + Ln(Value(1.0) + Exp(-Abs(F('trending_score') - event_score))),
+        updated_at=timezone.now()
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            CoursePopularity.objects.create(course_id=course_id, trending_score=event_score.value)
+    except IntegrityError:
+        # Created concurrently by another event
+        record_course_event(course_id, weight, timestamp)
+
+
+def get_current_popularity(trending_score, now=None):
+    """
+    Convert a stored trending score to the decayed popularity at the given time (default: now).
+    """
+    now = now or timezone.now()
+    return math.exp(trending_score - DECAY_RATE * (now - EPOCH).total_seconds())
+
+
+def rebuild_trending_scores():
+    """
+    Recompute every course popularity from the stored enrollments, reviews and engagement rows.
+    Only needed to backfill the scores, events keep them up to date afterwards.
+    :return: number of scored courses
+    """
+    events = [
+        (CourseEnrollment.objects.values_list('course_id', 'enrolled_at', 'id'), lambda _: ENROLLMENT_WEIGHT),
+        (Review.objects.values_list('course_id', 'creation_date', 'rating'),
+         lambda rating: REVIEW_WEIGHT_PER_STAR * rating),
+        (EngagementAnalytics.objects.values_list('course_id', 'last_accessed', 'id'), lambda _: ENGAGEMENT_WEIGHT),
+    ]
+
+    scores = {}
+    for queryset, get_weight in events:
+        for course_id, timestamp, value in queryset.order_by().iterator(chunk_size=2000):
+            event_score = get_event_score(get_weight(value), timestamp)
+            scores[course_id] = log_add_exp(scores[course_id], event_score) if course_id in scores else event_score
+
+    with transaction.atomic():
+        CoursePopularity.objects.all().delete()
+        CoursePopularity.objects.bulk_create(
+            [CoursePopularity(course_id=course_id, trending_score=score) for course_id, score in scores.items()],
+            batch_size=2000
+        )
+
+    return len(scores)
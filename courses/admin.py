@@ -16,3 +16,4 @@ admin.site.register(VideoLessonStep)
 admin.site.register(CodeChallengeLessonStep)
 admin.site.register(CodeChallengeTestCase)
 admin.site.register(ProgrammingLanguage)
+admin.site.register(DirectUpload)
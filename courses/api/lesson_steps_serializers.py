@@ -9,6 +9,7 @@ from courses.models import TextLessonStep, QuizLessonStep, QuizChoice, VideoLess
 from rest_framework import serializers
 from .mixins import LessonStepSerializerMixin, ValidateAllowedFieldsMixin
 from .. import cache_utils
+from ..lesson_steps_sync import pair_children_ids, update_step_children
 
 
 class BaseLessonStepSerializer(serializers.ModelSerializer, ValidateAllowedFieldsMixin):
@@ -99,12 +100,11 @@ class QuizLessonStepSerializer(serializers.ModelSerializer, LessonStepSerializer
                 setattr(base_step, attr, value)
             base_step.save()
 
-        quiz_choices_data = validated_data.pop('quiz_choices', [])
+        quiz_choices_data = validated_data.pop('quiz_choices', None)
         if quiz_choices_data is not None:
-            instance.quizchoice_set.all().delete()  # Clear existing quiz choices
-            for quiz_choice_data in quiz_choices_data:
-                quiz_choice_data.pop('id', None)
-                QuizChoice.objects.create(quiz=instance, **quiz_choice_data)
+            # Only the changed choices are written, so their ids (and the learners' answers) are kept
+            update_step_children(instance, pair_children_ids(self.initial_data.get('quiz_choices'),
+                                                             quiz_choices_data))
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -127,10 +127,14 @@ class QuizLessonStepSerializer(serializers.ModelSerializer, LessonStepSerializer
 
 class VideoLessonStepSerializer(serializers.ModelSerializer, LessonStepSerializerMixin):
     video_file = serializers.SerializerMethodField()
+    hls_manifest = serializers.SerializerMethodField()
+    poster = serializers.ImageField(read_only=True)
+    duration = serializers.SerializerMethodField()
 
     class Meta:
         model = VideoLessonStep
-        fields = ['id', 'order', 'title', 'video_file']
+        fields = ['id', 'order', 'title', 'video_file', 'transcoding_status', 'hls_manifest', 'poster', 'duration']
+        read_only_fields = ['transcoding_status']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -143,6 +147,16 @@ class VideoLessonStepSerializer(serializers.ModelSerializer, LessonStepSerialize
             return obj.video_file.url
         return None
 
+    def get_hls_manifest(self, obj):
+        # The players fall back to the video file until the HLS renditions are ready
+        if obj.hls_manifest and obj.transcoding_status == VideoLessonStep.TranscodingStatus.READY:
+            return obj.video_file.storage.url(obj.hls_manifest)
+        return None
+
+    def get_duration(self, obj):
+        # In seconds
+        return obj.duration.total_seconds() if obj.duration is not None else None
+
     def validate(self, attrs):
         request = self.context.get('request')
         if request and request.method in ['PUT', 'PATCH']:
@@ -217,6 +231,13 @@ class CodeChallengeLessonStepSerializer(serializers.ModelSerializer,
         fields = ['id', 'order', 'title', 'description', 'language_id', 'initial_code', 'proposed_solution',
                   'test_cases']
 
+    def validate_test_cases(self, test_cases):
+        # Unique per step, only checked by the database when the transaction commits
+        inputs = [test_case['input'] for test_case in test_cases]
+        if len(set(inputs)) != len(inputs):
+            raise serializers.ValidationError("The inputs of the test cases must be different.")
+        return test_cases
+
     def create(self, validated_data):
         base_step_data = validated_data.pop('base_step')
         if isinstance(base_step_data, dict):
@@ -261,10 +282,7 @@ class CodeChallengeLessonStepSerializer(serializers.ModelSerializer,
         instance.save()
 
         if test_cases_data is not None:
-            instance.test_cases.all().delete()  # Clear existing test cases
-            for test_case_data in test_cases_data:
-                test_case_data.pop('id', None)
-                CodeChallengeTestCase.objects.create(code_challenge_step=instance, **test_case_data)
+            update_step_children(instance, pair_children_ids(self.initial_data.get('test_cases'), test_cases_data))
 
         # Returning the base step instance to be used in the lesson serializer
         return base_step if base_step_data else instance
@@ -324,12 +342,9 @@ class SortingProblemLessonStepSerializer(serializers.ModelSerializer, LessonStep
                 setattr(base_step, attr, value)
             base_step.save()
 
-        options_data = validated_data.pop('options', [])
+        options_data = validated_data.pop('options', None)
         if options_data is not None:
-            instance.options.all().delete()  # Clear existing quiz choices
-            for option_data in options_data:
-                option_data.pop('id', None)
-                SortingProblemOption.objects.create(sorting_problem=instance, **option_data)
+            update_step_children(instance, pair_children_ids(self.initial_data.get('options'), options_data))
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -1,5 +1,9 @@
+from django.db import transaction
 from rest_framework import serializers
 
+from courses.remote_images import RemoteImage, set_pending_image, cancel_pending_image
+from courses.tasks import ingest_remote_image
+
 
 class LessonStepTypeField(serializers.Field):
     def to_representation(self, obj):
@@ -33,3 +37,32 @@ class ValidateAllowedFieldsMixin:
             )
 
         return super().to_internal_value(data)
+
+
+class RemoteImageMixin:
+    """
+    Saves the object without the images given by URL (see ImageOrUrlField)
+    and schedules their download once the transaction is committed.
+    """
+
+    def save(self, **kwargs):
+        # Imported here, the serializer fields depend on the step serializers which depend on these mixins
+        from courses.api.serializer_fields import ImageOrUrlField
+
+        remote_images = {name: value for name, value in self.validated_data.items() if isinstance(value, RemoteImage)}
+        for name in remote_images:
+            del self.validated_data[name]
+        saved_images = [name for name in self.validated_data if isinstance(self.fields[name], ImageOrUrlField)]
+
+        instance = super().save(**kwargs)
+
+        for name in saved_images:
+            # Not overwritten by an image requested by URL before
+            cancel_pending_image(instance, self.fields[name].source)
+
+        for name, image in remote_images.items():
+            field_name = self.fields[name].source
+            set_pending_image(instance, field_name, image.url)
+            transaction.on_commit(lambda field_name=field_name, url=image.url: ingest_remote_image.delay(
+                instance._meta.label_lower, str(instance.pk), field_name, url))
+        return instance
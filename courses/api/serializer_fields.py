@@ -1,30 +1,47 @@
 import uuid
 
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import URLValidator
 from rest_framework import serializers
-import os
-from urllib.parse import urlparse
-
-import requests
-from django.core.files.base import ContentFile
 
 from courses.api.lesson_steps_serializers import TextLessonStepSerializer, VideoLessonStepSerializer, \
     CodeChallengeLessonStepSerializer, QuizLessonStepSerializer, SortingProblemLessonStepSerializer, \
     TextProblemLessonStepSerializer
-from courses.models import TextLessonStep, QuizLessonStep, VideoLessonStep, CodeChallengeLessonStep, \
-    SortingProblemLessonStep, TextProblemLessonStep
+from courses.lesson_steps_sync import pair_children_ids, select_step_details
+from courses.image_variants import FORMATS, get_variants_field_name
+from courses.remote_images import RemoteImage
+
+STEP_SERIALIZERS = {
+    'text': TextLessonStepSerializer,
+    'quiz': QuizLessonStepSerializer,
+    'video': VideoLessonStepSerializer,
+    'codechallenge': CodeChallengeLessonStepSerializer,
+    'sorting_problem': SortingProblemLessonStepSerializer,
+    'text_problem': TextProblemLessonStepSerializer,
+}
+STEP_CHILDREN_FIELDS = ['quiz_choices', 'test_cases', 'options']
 
 
 class ImageOrUrlField(serializers.Field):
+    """
+    Image given as an uploaded file or as a URL. URLs are only validated here,
+    the image is downloaded in the background once the object is saved, see RemoteImageMixin.
+    """
+    url_validator = URLValidator(schemes=['http', 'https'])
+
     def to_internal_value(self, data):
         if isinstance(data, str):
-            # Assuming it's a URL
-            response = requests.get(data)
-            if response.status_code == 200:
-                parsed_url = urlparse(data)
-                filename = os.path.basename(parsed_url.path)
-                return ContentFile(response.content, name=filename)
-            else:
-                raise serializers.ValidationError("Unable to fetch image from URL")
+            # The representation of the current image sent back unchanged
+            current_image = getattr(self.parent.instance, self.source, None) if self.parent.instance else None
+            if current_image and data == self.to_representation(current_image):
+                raise serializers.SkipField()
+
+            try:
+                self.url_validator(data)
+            except DjangoValidationError:
+                raise serializers.ValidationError("Invalid image URL")
+
+            return RemoteImage(data)
         elif hasattr(data, 'read'):
             # It's a file upload
             return data
@@ -38,9 +55,38 @@ class ImageOrUrlField(serializers.Field):
         return None
 
 
+class ImageVariantsField(serializers.Field):
+    """
+    srcset of the resized variants of an image field for each format, e.g.
+    {'webp': '<url> 160w, <url> 320w', 'jpeg': '...'}. Empty until the variants of the current image are built.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        image = getattr(obj, self.image_field)
+        variants = getattr(obj, get_variants_field_name(self.image_field)) or {}
+        if not image or variants.get('source') != image.name:
+            return {}
+
+        return {
+            format_name: ', '.join(f'{image.storage.url(name)} {width}w'
+                                   for width, name in variants[format_name].items())
+            for format_name in FORMATS if variants.get(format_name)
+        }
+
+
 class LessonStepField(serializers.ListField):
     def to_representation(self, data):
-        iterable = data.all() if hasattr(data, 'all') else data
+        if hasattr(data, 'all'):
+            # The typed steps, their children and the languages of the code challenges in a fixed number of queries
+            iterable = select_step_details(data.all()).select_related('code_challenge_step__language')
+        else:
+            iterable = data
         result = []
         for item in iterable:
             # Determine which serializer to use based on the step type
@@ -63,47 +109,48 @@ class LessonStepField(serializers.ListField):
         return result
 
     def to_internal_value(self, data):
-        # Convert incoming data to a list of lesson step instances
+        """
+        Validate the steps without saving them, see courses.lesson_steps_sync for the saving.
+        """
+        if not isinstance(data, list):
+            raise serializers.ValidationError('Expected a list of lesson steps')
+
+        # The request data belongs to the lesson, not to its steps
+        context = {key: value for key, value in self.context.items() if key != 'request'}
         steps = []
         for item in data:
             step_type = item.get('type')
-            step_id = item.get('id', None)
-
-            if step_type == 'text':
-                serializer_class = TextLessonStepSerializer
-                model_class = TextLessonStep
-            elif step_type == 'quiz':
-                serializer_class = QuizLessonStepSerializer
-                model_class = QuizLessonStep
-            elif step_type == 'video':
-                serializer_class = VideoLessonStepSerializer
-                model_class = VideoLessonStep
-            elif step_type == 'codechallenge':
-                serializer_class = CodeChallengeLessonStepSerializer
-                model_class = CodeChallengeLessonStep
-            elif step_type == 'sorting_problem':
-                serializer_class = SortingProblemLessonStepSerializer
-                model_class = SortingProblemLessonStep
-            elif step_type == 'text_problem':
-                serializer_class = TextProblemLessonStepSerializer
-                model_class = TextProblemLessonStep
-            else:
+            serializer_class = STEP_SERIALIZERS.get(step_type)
+            if serializer_class is None:
                 raise serializers.ValidationError('Unknown step type')
 
-            if step_id:
-                try:
-                    uuid.UUID(step_id, version=4)
-                except ValueError:
-                    # If it's not a valid uuid, create a new instance
-                    serializer = serializer_class(data=item, context=self.context)
-                else:
-                    # If it's a valid uuid, update the existing instance
-                    step_instance = model_class.objects.get(base_step_id=step_id)
-                    serializer = serializer_class(step_instance, data=item)
-            else:
-                serializer = serializer_class(data=item, context=self.context)
+            serializer = serializer_class(data=item, context=context)
             serializer.is_valid(raise_exception=True)
-            step_instance = serializer.save()  # This save will either create or update the instance
-            steps.append(step_instance)
+            values = dict(serializer.validated_data)
+            base_step_values = values.pop('base_step', {})
+            values.pop('type', None)
+
+            children = None
+            for children_field in STEP_CHILDREN_FIELDS:
+                if children_field in values:
+                    children = pair_children_ids(item.get(children_field), values.pop(children_field))
+
+            steps.append({
+                'type': step_type,
+                'id': self.parse_step_id(item.get('id')),
+                'order': base_step_values.get('order'),
+                'values': values,
+                'children': children,
+            })
 
         return steps
+
+    @staticmethod
+    def parse_step_id(step_id):
+        if not step_id:
+            return None
+        try:
+            return uuid.UUID(str(step_id), version=4)
+        except ValueError:
+            # Not a valid uuid, it's a new step
+            return None
@@ -6,10 +6,10 @@ from rest_framework import serializers
 
 from courses.models import Course, Tag, Chapter, Lesson, ProgrammingLanguage, Category, Review, BaseLessonStep
 from users.api.serializers import LearnerSerializer
-from .mixins import ValidateAllowedFieldsMixin
+from .mixins import ValidateAllowedFieldsMixin, RemoteImageMixin
 from .serializer_fields import ImageOrUrlField, LessonStepField
 from .. import cache_utils
-from ..factories import LessonStepFactory
+from ..lesson_steps_sync import sync_lesson_steps
 
 
 logger = logging.getLogger(__name__)
@@ -40,18 +40,18 @@ class LessonSerializer(serializers.ModelSerializer, ValidateAllowedFieldsMixin):
             lesson_steps_data = validated_data.pop('baselessonstep_set', [])
             lesson = Lesson.objects.create(**validated_data)
 
-            for lesson_step_data in lesson_steps_data:
-                LessonStepFactory.create(lesson_step_data, lesson)
+            if lesson_steps_data:
+                sync_lesson_steps(lesson, lesson_steps_data)
 
         return lesson
 
     def update(self, instance, validated_data):
         with transaction.atomic():
-            lesson_steps_data = validated_data.get('baselessonstep_set', [])
-            if lesson_steps_data:
-                # Delete the steps that aren't included in the request
-                instance.baselessonstep_set.exclude(id__in=[step.id for step in lesson_steps_data]).delete()
+            lesson_steps_data = validated_data.pop('baselessonstep_set', [])
             instance = super().update(instance, validated_data)
+            if lesson_steps_data:
+                # Creates, updates and deletes the steps to match the request
+                sync_lesson_steps(instance, lesson_steps_data)
 
         return instance
 
@@ -157,7 +157,7 @@ class CategoryField(serializers.PrimaryKeyRelatedField):
         self.fail('does_not_exist', pk_value=data)
 
 
-class CourseSerializer(serializers.ModelSerializer, ValidateAllowedFieldsMixin):
+class CourseSerializer(RemoteImageMixin, serializers.ModelSerializer, ValidateAllowedFieldsMixin):
     tags = TagSerializer(many=True, required=False)
     chapters = ChapterSerializer(many=True, required=False)
     category = CategoryField(queryset=Category.objects.all(), required=False)
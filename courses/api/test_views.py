@@ -0,0 +1,285 @@
+import json
+import logging
+from unittest.mock import patch
+
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from courses import benchmarks
+from courses.direct_uploads import PART_SIZE
+from courses.models import Course, Chapter, Lesson, BaseLessonStep, VideoLessonStep, DirectUpload
+from learning.models import CourseEnrollment, LearnerProgress
+from courses.synthetic_data import SyntheticDataGenerator
+from courses_project import instrumentation
+from courses_project.tasks import refresh_catalog_courses_cache
+from users.models import User
+
+
+class DirectUploadViewsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('instructor@test.com', 'password', 'Test', 'Instructor')
+        self.other_user = User.objects.create_user('other@test.com', 'password', 'Other', 'Instructor')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1')
+        self.other_course = Course.objects.create(instructor=self.other_user, title='Course 2')
+        self.url = reverse('direct-upload-create')
+
+        # The bucket is not reachable from the tests, only the calls to it are checked
+        get_s3_client = patch('courses.direct_uploads.get_s3_client').start()
+        self.addCleanup(patch.stopall)
+        self.s3_client = get_s3_client.return_value
+        self.s3_client.generate_presigned_url.return_value = 'https://bucket.test/presigned'
+
+    def tearDown(self):
+        cache.clear()
+
+    def start_upload(self, course, size=1024, filename='logo.png', content_type='image/png'):
+        data = {
+            'target': DirectUpload.Target.COURSE_IMAGE,
+            'object_id': str(course.id),
+            'filename': filename,
+            'size': size,
+        }
+        if content_type:
+            data['content_type'] = content_type
+        return self.client.post(self.url, data, format='json')
+
+    def test_initiate_upload(self):
+        response = self.start_upload(self.course)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['method'], 'PUT')
+        self.assertEqual(response.data['url'], 'https://bucket.test/presigned')
+        upload = DirectUpload.objects.get(id=response.data['id'])
+        self.assertEqual(upload.status, DirectUpload.Status.PENDING)
+        self.assertTrue(upload.key.startswith('courses/images/'))
+        self.assertTrue(upload.key.endswith('logo.png'))
+
+    def test_initiate_multipart_upload(self):
+        self.s3_client.create_multipart_upload.return_value = {'UploadId': 'multipart-id'}
+        chapter = Chapter.objects.create(course=self.course, title='Chapter 1')
+        lesson = Lesson.objects.create(chapter=chapter, title='Lesson 1', order=1)
+        video_step = VideoLessonStep.objects.create(base_step=BaseLessonStep.objects.create(lesson=lesson, order=1))
+
+        response = self.client.post(self.url, {
+            'target': DirectUpload.Target.VIDEO_STEP,
+            'object_id': str(video_step.pk),
+            'filename': 'lecture.mp4',
+            'content_type': 'video/mp4',
+            'size': 2 * PART_SIZE + 1,
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['part_size'], PART_SIZE)
+        self.assertEqual([part['part_number'] for part in response.data['parts']], [1, 2, 3])
+        self.assertEqual(DirectUpload.objects.get(id=response.data['id']).multipart_upload_id, 'multipart-id')
+
+        # The parts returned by the bucket are needed to complete the upload
+        response = self.client.post(reverse('direct-upload-complete', args=[response.data['id']]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_initiate_upload_for_other_instructor_course(self):
+        response = self.start_upload(self.other_course)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DirectUpload.objects.exists())
+        self.s3_client.generate_presigned_url.assert_not_called()
+
+    def test_initiate_upload_invalid_file(self):
+        response = self.start_upload(self.course, filename='logo.exe')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.start_upload(self.course, size=11 * 1024 * 1024)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_initiate_upload_invalid_content_type(self):
+        # Served by the public bucket, a document would run in the origin of the bucket
+        for content_type in ['text/html', 'image/svg+xml', 'image/jpeg']:
+            response = self.start_upload(self.course, content_type=content_type)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.s3_client.generate_presigned_url.assert_not_called()
+
+        response = self.start_upload(self.course, content_type=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(DirectUpload.objects.get(id=response.data['id']).content_type, 'image/png')
+
+    def test_initiate_upload_invalid_object_id(self):
+        response = self.client.post(self.url, {
+            'target': DirectUpload.Target.COURSE_IMAGE,
+            'object_id': 'not-a-uuid',
+            'filename': 'logo.png',
+            'content_type': 'image/png',
+            'size': 1024,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_upload(self):
+        self.s3_client.head_object.return_value = {'ContentLength': 2048}
+        upload_id = self.start_upload(self.course).data['id']
+
+        response = self.client.post(reverse('direct-upload-complete', args=[upload_id]), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        upload = DirectUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.status, DirectUpload.Status.COMPLETED)
+        self.assertEqual(upload.size, 2048)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.image.name, upload.key)
+
+        # An upload can only be completed once
+        response = self.client.post(reverse('direct-upload-complete', args=[upload_id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_other_user_upload(self):
+        upload_id = self.start_upload(self.course).data['id']
+
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.post(reverse('direct-upload-complete', args=[upload_id]), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_abort_upload(self):
+        upload_id = self.start_upload(self.course).data['id']
+
+        response = self.client.post(reverse('direct-upload-abort', args=[upload_id]), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(DirectUpload.objects.get(id=upload_id).status, DirectUpload.Status.ABORTED)
+
+
+@override_settings(METRICS_REDIS_URL=None, METRICS_AUTH_TOKEN='metrics-token',
+                   CACHES={'default': {'BACKEND': 'courses_project.instrumentation.InstrumentedLocMemCache'}})
+class InstrumentationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('instructor@test.com', 'password', 'Test', 'Instructor')
+        Course.objects.create(instructor=self.user, title='Course 1', active=True)
+        self.registry = instrumentation.MetricsRegistry()
+        patcher = patch.object(instrumentation, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_metrics(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_request_metrics(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('catalog-course-facets'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        metrics = self.get_metrics()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', metrics)
+        self.assertIn('http_requests_total{view="catalog-course-facets",method="GET",status="200"} 1', metrics)
+        self.assertIn('http_request_db_queries_sum{view="catalog-course-facets"} 3', metrics)
+        self.assertIn('http_request_duration_seconds_count{view="catalog-course-facets"} 1', metrics)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_task_metrics(self):
+        refresh_catalog_courses_cache.delay()
+
+        metrics = self.get_metrics()
+        task = 'courses_project.tasks.refresh_catalog_courses_cache'
+        self.assertIn(f'celery_tasks_total{{task="{task}",state="SUCCESS"}} 1', metrics)
+        self.assertIn(f'celery_task_duration_seconds_count{{task="{task}"}} 1', metrics)
+
+    def test_cache_hits_and_misses(self):
+        with instrumentation.collect_stats() as stats:
+            cache.get('missing')
+            cache.set('key', 'value')
+            cache.get('key')
+            cache.get_many(['key', 'missing'])
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (2, 2))
+
+    def test_database_connection_metrics(self):
+        instrumentation.count_opened_connection(sender=None, connection=connection)
+
+        metrics = self.get_metrics()
+        self.assertIn('db_connections_opened_total{database="default",process="web"} 1', metrics)
+        self.assertIn('db_server_connections{database="default",state="active"}', metrics)
+        self.assertRegex(metrics, r'db_server_max_connections\{database="default"\} \d+')
+
+    def test_metrics_require_the_token(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(INSTRUMENTATION_MAX_QUERIES=1)
+    def test_requests_with_many_queries_are_logged(self):
+        with self.assertLogs('courses_project.instrumentation', logging.WARNING) as logs:
+            self.client.get(reverse('catalog-course-facets'))
+
+        record = logs.records[0]
+        self.assertEqual((record.view, record.db_queries), ('catalog-course-facets', 3))
+        data = json.loads(instrumentation.JsonFormatter().format(record))
+        self.assertEqual(data['level'], 'WARNING')
+        self.assertEqual(data['db_queries'], 3)
+
+
+class SyntheticDataBenchmarksTest(APITestCase):
+    def setUp(self):
+        self.counts = SyntheticDataGenerator(seed=1, batch_size=100).generate(
+            instructors=2, learners=10, courses=3, chapters=2, lessons=2, steps=3, enrollments=2)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_generated_data(self):
+        self.assertEqual(self.counts['courses.Course'], 3)
+        self.assertEqual(self.counts['courses.BaseLessonStep'], 3 * 2 * 2 * 3)
+        self.assertTrue(SyntheticDataGenerator(seed=1).exists())
+        self.assertFalse(SyntheticDataGenerator(seed=2).exists())
+
+        # The completed lessons are those with all their steps completed
+        for progress in LearnerProgress.objects.all():
+            completed_steps = set(progress.completed_steps)
+            for lesson in Lesson.objects.filter(chapter__course=progress.course):
+                lesson_steps = set(lesson.baselessonstep_set.values_list('id', flat=True))
+                self.assertEqual(lesson.id in progress.completed_lessons, lesson_steps <= completed_steps)
+        self.assertEqual(LearnerProgress.objects.count(), CourseEnrollment.objects.count())
+
+    def test_benchmarks(self):
+        results = benchmarks.run_benchmarks(['catalog_course', 'learner_course', 'complete_lesson_step'],
+                                            iterations=2)
+        self.assertEqual(set(results['results']),
+                         {'catalog_course', 'catalog_course_facets', 'learner_course_list', 'learner_course',
+                          'complete_lesson_step'})
+        for result in results['results'].values():
+            self.assertNotIn('error', result)
+        # The runs are rolled back
+        self.assertFalse(benchmarks.compare(results, results, tolerance=0))
+
+        slower = {'results': {'catalog_course': {**results['results']['catalog_course'], 'queries': 100}}}
+        self.assertEqual(len(benchmarks.compare(results, slower, tolerance=0)), 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'courses_project.instrumentation.InstrumentedLocMemCache',
+                                           'LOCATION': 'benchmarks'}})
+    def test_benchmarks_cache(self):
+        cache.set('other', 'value')
+        results = benchmarks.run_benchmarks(['learner_course'], iterations=2, clear_cache=True)
+        for result in results['results'].values():
+            self.assertNotIn('error', result)
+            # Every run reads the cleared entries
+            self.assertTrue(result['cache_misses'])
+
+        # Only the entries written by the benchmarks are deleted
+        self.assertEqual(cache.get('other'), 'value')
+        self.assertEqual(list(caches['default']._cache), [cache.make_key('other')])
+
+    def test_benchmarks_shared_cache(self):
+        memcached = {'default': {'BACKEND': 'courses_project.instrumentation.InstrumentedPyMemcacheCache',
+                                 'LOCATION': '127.0.0.1:11211'}}
+        with override_settings(CACHES=memcached), self.assertRaises(benchmarks.BenchmarkError):
+            benchmarks.run_benchmarks(['catalog_course'], iterations=1)
+        # The keys to delete are not recorded
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem), self.assertRaises(benchmarks.BenchmarkError):
+            benchmarks.run_benchmarks(['catalog_course'], iterations=1, clear_cache=True)
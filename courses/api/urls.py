@@ -4,4 +4,7 @@ from courses.api import views
 
 urlpatterns = [
     path('programming-languages/', views.ProgrammingLanguageListView.as_view(), name='programming-languages-list'),
+    path('uploads/', views.create_direct_upload, name='direct-upload-create'),
+    path('uploads/<uuid:pk>/complete/', views.complete_direct_upload, name='direct-upload-complete'),
+    path('uploads/<uuid:pk>/abort/', views.abort_direct_upload, name='direct-upload-abort'),
 ]
@@ -1,7 +1,13 @@
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from courses import cache_utils
 from courses.api.serializers import ProgrammingLanguageSerializer
+from courses.direct_uploads import UPLOAD_TARGETS, DirectUploadError, initiate_upload, complete_upload, abort_upload
+from courses.models import DirectUpload
 
 
 class ProgrammingLanguageListView(generics.ListAPIView):
@@ -10,3 +16,46 @@ class ProgrammingLanguageListView(generics.ListAPIView):
     def get_queryset(self):
         languages, _ = cache_utils.get_languages()
         return languages
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_direct_upload(request):
+    try:
+        size = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'The file size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        upload, upload_urls = initiate_upload(request.user, request.data.get('target'), request.data.get('object_id'),
+                                              request.data.get('filename', ''),
+                                              request.data.get('content_type'), size)
+    except DirectUploadError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'id': upload.id, 'key': upload.key, **upload_urls}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_direct_upload(request, pk):
+    upload = get_object_or_404(DirectUpload, id=pk, user=request.user)
+    try:
+        obj = complete_upload(upload, request.data.get('parts'))
+    except DirectUploadError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    field_file = getattr(obj, UPLOAD_TARGETS[upload.target].field_name)
+    return Response({'id': upload.id, 'key': upload.key, 'url': field_file.url})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def abort_direct_upload(request, pk):
+    upload = get_object_or_404(DirectUpload, id=pk, user=request.user)
+    try:
+        abort_upload(upload)
+    except DirectUploadError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,239 @@
+"""
+Benchmarks of the main endpoints and of the nightly jobs, on the data of the database (see courses.synthetic_data).
+
+Every benchmark runs its view or job a few times, each run in a transaction rolled back afterwards so the writes don't
+change the data of the next runs, and measures its duration and its number of queries. The results are saved to a
+JSON baseline, to which the later results are compared: a benchmark regresses when its median duration grows by
+more than the tolerance, or when it runs more queries.
+
+The cache writes are not rolled back: the benchmarks only run on a local cache unless forced, and delete the entries
+they wrote once done. The keys are recorded by the Instrumented*Cache backends, see courses_project.instrumentation.
+"""
+import io
+import json
+import platform
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import reverse, resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from courses.models import Course, BaseLessonStep
+from courses_project.instrumentation import collect_stats, InstrumentedCacheMixin
+from learning.models import CourseEnrollment, LearnerProgress
+from teaching.models import EngagementAnalytics
+from users.models import User
+
+
+# The caches of the process running the benchmarks, not shared with the application
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Context:
+    """
+    The objects the benchmarks run on: the course with the most learners, its instructor, and one of its learners.
+    """
+
+    def __init__(self):
+        self.course = Course.objects.filter(active=True).annotate(
+            learners_count=Count('courseenrollment')).order_by('-learners_count').select_related('instructor').first()
+        if self.course is None or not self.course.learners_count:
+            raise BenchmarkError('No course with learners, run generate_synthetic_data first')
+        self.instructor = self.course.instructor
+        enrollment = CourseEnrollment.objects.filter(course=self.course).select_related('learner').order_by('id')[0]
+        self.learner = enrollment.learner
+
+        progress = LearnerProgress.objects.filter(course=self.course, learner=self.learner).first()
+        completed_steps = progress.completed_steps if progress else []
+        # The completion of a new step updates the progress
+        self.step = BaseLessonStep.objects.filter(lesson__chapter__course=self.course).exclude(
+            id__in=completed_steps).first() or BaseLessonStep.objects.filter(lesson__chapter__course=self.course)[0]
+
+
+def request_view(method, url, user=None, data=None):
+    factory = APIRequestFactory()
+    request = getattr(factory, method)(url, data, format='json')
+    if user is not None:
+        force_authenticate(request, user=user)
+    match = resolve(url)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code >= 400:
+        raise BenchmarkError(f'{method.upper()} {url} returned {response.status_code}')
+    return response
+
+
+def run_command(name):
+    call_command(name, stdout=io.StringIO())
+
+
+def get_benchmarks(context):
+    """
+    :return: the function running every benchmark, by name
+    """
+    course_id = context.course.id
+    return {
+        'catalog_web_course_list': lambda: request_view('get', reverse('web-catalog-course-list')),
+        'catalog_mobile_course_list': lambda: request_view('get', reverse('mobile-catalog-course-list')),
+        'catalog_course_facets': lambda: request_view('get', reverse('catalog-course-facets')),
+        'catalog_course': lambda: request_view('get', reverse('catalog-course-view', args=[course_id])),
+        'learner_course_list': lambda: request_view('get', reverse('learner-course-list'), context.learner),
+        'learner_course': lambda: request_view('get', reverse('learner-course-get', args=[course_id]),
+                                               context.learner),
+        'complete_lesson_step': lambda: request_view('post', reverse('complete-lesson-step', args=[context.step.id]),
+                                                     context.learner),
+        'enrollment_analytics': lambda: request_view('get', reverse('enrollment-analytics', args=[course_id]),
+                                                     context.instructor),
+        'completion_analytics': lambda: request_view('get', reverse('completion-analytics', args=[course_id]),
+                                                     context.instructor),
+        'activity_analytics': lambda: request_view('get', reverse('activity-analytics', args=[course_id]),
+                                                   context.instructor),
+        'steps_engagement_analytics': lambda: request_view(
+            'get', reverse('steps-engagement-analytics', args=[course_id]), context.instructor),
+        'lessons_engagement_analytics': lambda: request_view(
+            'get', reverse('lessons-engagement-analytics', args=[course_id]), context.instructor),
+        'assessments_analytics': lambda: request_view('get', reverse('assessments-analytics', args=[course_id]),
+                                                      context.instructor),
+        'job_cache_catalog_courses': lambda: run_command('cache_catalog_courses'),
+        'job_cache_learner_courses': lambda: run_command('cache_learner_courses'),
+        'job_update_daily_active_users': lambda: run_command('update_daily_active_users'),
+        'job_build_course_similarities': lambda: run_command('build_course_similarities'),
+        'job_rebuild_trending_scores': lambda: run_command('rebuild_trending_scores'),
+    }
+
+
+def check_cache(clear_cache, force):
+    backend = caches['default']
+    if not force and not isinstance(backend, LOCAL_CACHE_BACKENDS):
+        raise BenchmarkError(f'The cache ({type(backend).__name__}) is not local and its writes are not rolled back, '
+                             f'use --force to run the benchmarks on it anyway')
+    if clear_cache and not isinstance(backend, (InstrumentedCacheMixin, DummyCache)):
+        raise BenchmarkError(f'The keys of the cache ({type(backend).__name__}) are not recorded, '
+                             f'use an Instrumented*Cache backend to clear them')
+
+
+def run_once(function, cache_keys, clear_cache):
+    """
+    :param cache_keys: the keys read or written by the previous runs, deleted first to clear the cache
+    """
+    if clear_cache:
+        cache.delete_many(cache_keys)
+    with transaction.atomic():
+        # Counted by the execute wrappers, without the overhead and the limit of the queries log
+        with collect_stats() as stats:
+            function()
+            duration = stats.duration
+        transaction.set_rollback(True)
+    return duration, stats
+
+
+def run_benchmark(function, iterations, clear_cache=False):
+    # A first run to warm up the caches and find the keys of the benchmark, not measured
+    cache_keys, written_cache_keys = set(), set()
+    durations, runs = [], []
+    try:
+        for iteration in range(iterations + 1):
+            duration, stats = run_once(function, cache_keys, clear_cache)
+            cache_keys |= stats.cache_keys
+            written_cache_keys |= stats.written_cache_keys
+            if iteration:
+                durations.append(duration * 1000)
+                runs.append(stats)
+    finally:
+        # Written from the data of the rolled back transactions
+        cache.delete_many(written_cache_keys)
+    durations.sort()
+    return {
+        'median_ms': round(statistics.median(durations), 2),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2),
+        'min_ms': round(durations[0], 2),
+        'db_median_ms': round(statistics.median(stats.db_time for stats in runs) * 1000, 2),
+        'queries': max(stats.queries for stats in runs),
+        'cache_misses': max(stats.cache_misses for stats in runs),
+    }
+
+
+def run_benchmarks(names=None, iterations=10, clear_cache=False, log=None, force=False):
+    """
+    :param names: the prefixes of the names of the benchmarks to run, all of them when empty
+    :param force: whether to run on a cache shared with the application, see LOCAL_CACHE_BACKENDS
+    :return: the baseline of the results, the benchmarks which failed have an error instead
+    """
+    check_cache(clear_cache, force)
+    context = Context()
+    results = {}
+    # The host of the requests of APIRequestFactory
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, function in get_benchmarks(context).items():
+            if names and not any(name.startswith(prefix) for prefix in names):
+                continue
+            try:
+                results[name] = run_benchmark(function, iterations, clear_cache)
+            except Exception as e:
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+            if log:
+                log(name, results[name])
+
+    return {
+        'created_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'clear_cache': clear_cache,
+        'scale': get_scale(),
+        'results': results,
+    }
+
+
+def get_scale():
+    return {
+        'users': User.objects.count(),
+        'courses': Course.objects.count(),
+        'steps': BaseLessonStep.objects.count(),
+        'enrollments': CourseEnrollment.objects.count(),
+        'engagement_rows': EngagementAnalytics.objects.count(),
+    }
+
+
+def compare(baseline, current, tolerance):
+    """
+    :param tolerance: the allowed growth of the median durations, e.g. 0.2 for 20%
+    :return: a description of every regression of the current results
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or 'error' in previous:
+            continue
+        if 'error' in result:
+            regressions.append(f"{name}: {result['error']}")
+            continue
+        if result['median_ms'] > previous['median_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: median {result['median_ms']} ms, {previous['median_ms']} ms in the baseline")
+        if result['queries'] > previous['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, {previous['queries']} in the baseline")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path, baseline):
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write('\n')
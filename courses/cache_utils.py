@@ -1,14 +1,17 @@
 from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
 
 from catalog.api.serializers import DetailedCatalogCourseSerializer
 from courses.models import ProgrammingLanguage, Category
 from django.core.exceptions import EmptyResultSet, ObjectDoesNotExist
 
+from courses_project.db_routers import reading_from_primary
 from learning.api.serializers import LearnerCourseSerializer
 
 
 def reset_languages_cache():
-    db_languages = list(ProgrammingLanguage.objects.all())
+    with reading_from_primary():
+        db_languages = list(ProgrammingLanguage.objects.all())
     if not db_languages:
         raise EmptyResultSet('The ProgrammingLanguage table is empty! Run populate_programming_languages command.')
 
@@ -59,7 +62,8 @@ def get_categories():
     category_qs = cache.get(cache_key)
 
     if not category_qs:
-        category_qs = list(Category.objects.all())
+        with reading_from_primary():
+            category_qs = list(Category.objects.all())
         cache.set(cache_key, category_qs, 3600)  # cache for one hour
 
     return category_qs
@@ -70,9 +74,14 @@ def get_learner_course_data(course):
     if cached_serialized_course:
         return cached_serialized_course
     else:
+        return refresh_learner_course_data(course)
+
+
+def refresh_learner_course_data(course):
+    with reading_from_primary():
         course_data = LearnerCourseSerializer(course, context={'is_learner': True}).data
-        cache.set(f"learner_course_{course.id}", course_data, timeout=5400)
-        return course_data
+    cache.set(f"learner_course_{course.id}", course_data, timeout=5400)
+    return course_data
 
 
 def get_catalog_course_data(course):
@@ -80,7 +89,11 @@ def get_catalog_course_data(course):
     if cached_serialized_course:
         return cached_serialized_course
     else:
-        course_data = DetailedCatalogCourseSerializer(course).data
+        # Served to every visitor, so never from a lagging replica
+        with reading_from_primary():
+            if course._state.db != DEFAULT_DB_ALIAS:
+                course.refresh_from_db(using=DEFAULT_DB_ALIAS)
+            course_data = DetailedCatalogCourseSerializer(course).data
         cache.set(f"catalog_course_{course.id}", course_data, timeout=5400)
         return course_data
 
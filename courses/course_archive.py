@@ -0,0 +1,244 @@
+"""
+Portable course archives.
+
+An archive is a zip file holding a single `course.ndjson` entry: a header line, the course line and then one line
+per row of the course tree, parents first. Media files are referenced by their storage name, not embedded, and an
+import only keeps those the instructor already uses or uploaded. Every imported row is validated like a saved object.
+Both directions stream the rows, so neither the export nor the import ever holds the whole course in memory.
+"""
+import io
+import json
+import uuid
+import zipfile
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Q
+
+from courses.course_copy import TREE_MODELS, COURSE_EXCLUDED_FIELDS, BATCH_SIZE, CourseTreeWriter, \
+    CourseTreeRemapper, get_course_tree_rows
+from courses.models import Course, Category, Tag, CodeChallengeLessonStep, ProgrammingLanguage, VideoLessonStep, \
+    DirectUpload
+
+ARCHIVE_FORMAT = 'course-archive'
+ARCHIVE_VERSION = 1
+ARCHIVE_ENTRY_NAME = 'course.ndjson'
+
+MODELS_BY_NAME = {model._meta.model_name: model for model in TREE_MODELS}
+
+# Fields holding the storage names of media files
+MEDIA_FIELDS = {
+    Course: ['image'],
+    VideoLessonStep: ['video_file', 'poster', 'hls_manifest', 'transcoding_source'],
+}
+# Rebuilt from the imported image, see courses.image_variants
+COURSE_IMPORT_EXCLUDED_FIELDS = {*COURSE_EXCLUDED_FIELDS - {'title'}, 'image_variants'}
+
+
+class CourseArchiveError(Exception):
+    pass
+
+
+class ZipStreamBuffer:
+    """
+    Unseekable file object for zipfile, the written bytes are collected until they're read with `pop`.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_line(record):
+    return json.dumps(record, cls=DjangoJSONEncoder).encode() + b'\n'
+
+
+def iter_archive_records(course_id):
+    course_values = Course.objects.filter(id=course_id).values().get()
+    course_values = {key: value for key, value in course_values.items()
+                     if key not in COURSE_EXCLUDED_FIELDS or key == 'title'}
+    # Categories and tags are matched by name, their ids differ between environments
+    category = Category.objects.filter(id=course_values.pop('category_id')).first()
+
+    yield {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION}
+    yield {
+        'model': 'course',
+        'data': course_values,
+        'category': category.name if category else None,
+        'tags': list(Tag.objects.filter(course__id=course_id).values_list('name', flat=True)),
+    }
+    for model in TREE_MODELS:
+        model_name = model._meta.model_name
+        for values in get_course_tree_rows(model, course_id).iterator(chunk_size=BATCH_SIZE):
+            yield {'model': model_name, 'data': values}
+
+
+def iter_course_archive(course_id):
+    """
+    Yield the bytes of the course archive as they're produced.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ARCHIVE_ENTRY_NAME, 'w', force_zip64=True) as entry:
+            for record in iter_archive_records(course_id):
+                entry.write(encode_line(record))
+                data = buffer.pop()
+                if data:
+                    yield data
+    yield buffer.pop()
+
+
+def read_archive_records(file):
+    try:
+        archive = zipfile.ZipFile(file)
+        entry = archive.open(ARCHIVE_ENTRY_NAME)
+    except (zipfile.BadZipFile, KeyError):
+        raise CourseArchiveError(f'The file is not a course archive, it must be a zip with a {ARCHIVE_ENTRY_NAME} file')
+
+    with archive, entry:
+        for line in io.TextIOWrapper(entry, encoding='utf-8'):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    raise CourseArchiveError('The course archive is corrupted')
+
+
+def get_model_values(model, data):
+    if not isinstance(data, dict):
+        raise CourseArchiveError('The course archive is corrupted')
+    # Unknown fields (e.g. from a newer version of the app) are ignored
+    field_names = {field.attname for field in model._meta.concrete_fields}
+    return {key: value for key, value in data.items() if key in field_names}
+
+
+def validate_row(obj):
+    """
+    Validate the field values of an imported row. The references are set by the import, and the uniqueness is checked
+    by the database.
+    """
+    references = [field.name for field in obj._meta.concrete_fields if field.is_relation]
+    try:
+        obj.clean_fields(exclude=references)
+    except ValidationError as e:
+        errors = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in e.message_dict.items())
+        raise CourseArchiveError(f'Invalid {obj._meta.verbose_name} in the course archive, {errors}')
+
+
+class MediaFilter:
+    """
+    Resets the media fields referencing files the instructor doesn't already use in a course or uploaded, so an
+    archive can't attach any file of the bucket to the course.
+    """
+
+    def __init__(self, instructor_id):
+        self.instructor_id = instructor_id
+        self.own_names = {}
+
+    def is_own(self, name):
+        if name not in self.own_names:
+            video_steps = VideoLessonStep.objects.filter(
+                base_step__lesson__chapter__course__instructor=self.instructor_id)
+            self.own_names[name] = (
+                Course.objects.filter(instructor=self.instructor_id, image=name).exists()
+                or video_steps.filter(Q(video_file=name) | Q(poster=name) | Q(hls_manifest=name)).exists()
+                or DirectUpload.objects.filter(user=self.instructor_id, key=name,
+                                               status=DirectUpload.Status.COMPLETED).exists()
+            )
+        return self.own_names[name]
+
+    def filter(self, model, values):
+        for field_name in MEDIA_FIELDS.get(model, []):
+            field = model._meta.get_field(field_name)
+            name = values.get(field.attname)
+            if name and name != field.get_default() and not (isinstance(name, str) and self.is_own(name)):
+                values[field.attname] = field.get_default()
+        return values
+
+
+def import_course(file, instructor_id, batch_size=BATCH_SIZE):
+    """
+    Create a new inactive course owned by the instructor from a course archive.
+
+    :param file: path or binary file object of the archive
+    :return: the new course
+    """
+    records = read_archive_records(file)
+    header = next(records, None)
+    if not isinstance(header, dict) or header.get('format') != ARCHIVE_FORMAT \
+            or header.get('version') != ARCHIVE_VERSION:
+        raise CourseArchiveError('Unsupported course archive format')
+
+    course_record = next(records, None)
+    if not isinstance(course_record, dict) or course_record.get('model') != 'course':
+        raise CourseArchiveError('The course archive is corrupted')
+
+    try:
+        with transaction.atomic():
+            course = import_course_records(course_record, records, instructor_id, batch_size)
+            # The order constraints are deferred, checked here rather than when an outer transaction commits
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+    except DatabaseError as e:
+        # e.g. duplicate orders, or values the validation can't check
+        raise CourseArchiveError(f'The course archive could not be imported: {e}')
+
+    return course
+
+
+def import_course_records(course_record, records, instructor_id, batch_size):
+    language_ids = set(ProgrammingLanguage.objects.values_list('id', flat=True))
+    media_filter = MediaFilter(instructor_id)
+    writer = CourseTreeWriter(batch_size=batch_size)
+
+    course_values = {key: value for key, value in get_model_values(Course, course_record.get('data')).items()
+                     if key not in COURSE_IMPORT_EXCLUDED_FIELDS}
+    tags = course_record.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise CourseArchiveError('The course archive is corrupted')
+    course = Course(
+        id=uuid.uuid4(), instructor_id=instructor_id,
+        category=Category.objects.filter(name=str(course_record.get('category'))).first(),
+        **media_filter.filter(Course, course_values),
+    )
+    validate_row(course)
+    course.save(force_insert=True)
+    course.tags.set(Tag.objects.filter(name__in=tags))
+
+    remapper = CourseTreeRemapper(course.id)
+    for record in records:
+        model = MODELS_BY_NAME.get(record.get('model')) if isinstance(record, dict) else None
+        if model is None:
+            raise CourseArchiveError('The course archive is corrupted, it has a row of an unknown type')
+
+        values = media_filter.filter(model, get_model_values(model, record.get('data')))
+        if model is CodeChallengeLessonStep:
+            language_id = values.get('language_id')
+            if not isinstance(language_id, int) or language_id not in language_ids:
+                values['language_id'] = None
+
+        try:
+            obj = remapper.remap(model, values)
+        except (KeyError, TypeError):
+            raise CourseArchiveError('The course archive is corrupted, a row references a missing parent')
+        validate_row(obj)
+        writer.add(obj)
+
+        if writer.pending >= batch_size:
+            writer.flush()
+    writer.flush()
+
+    return course
@@ -0,0 +1,170 @@
+"""
+Bulk copy of course trees.
+
+Every row of the tree gets its new primary key before it's written, so the children can reference their parents
+without reading them back, and each model is inserted with bulk_create in dependency order.
+"""
+import uuid
+from collections import defaultdict
+
+from django.db import transaction
+
+from courses.models import Course, Chapter, Lesson, BaseLessonStep, TextLessonStep, QuizLessonStep, QuizChoice, \
+    VideoLessonStep, CodeChallengeLessonStep, CodeChallengeTestCase, SortingProblemLessonStep, SortingProblemOption, \
+    TextProblemLessonStep
+
+BATCH_SIZE = 1000
+
+CHILD_STEP_MODELS = [TextLessonStep, QuizLessonStep, VideoLessonStep, CodeChallengeLessonStep,
+                     SortingProblemLessonStep, TextProblemLessonStep]
+
+# Parents always come before their children
+TREE_MODELS = [Chapter, Lesson, BaseLessonStep, *CHILD_STEP_MODELS,
+               QuizChoice, CodeChallengeTestCase, SortingProblemOption]
+
+STEP_LOOKUP = 'lesson__chapter__course_id'
+COURSE_LOOKUPS = {
+    Chapter: 'course_id',
+    Lesson: 'chapter__course_id',
+    BaseLessonStep: STEP_LOOKUP,
+    **{model: f'base_step__{STEP_LOOKUP}' for model in CHILD_STEP_MODELS},
+    QuizChoice: f'quiz__base_step__{STEP_LOOKUP}',
+    CodeChallengeTestCase: f'code_challenge_step__base_step__{STEP_LOOKUP}',
+    SortingProblemOption: f'sorting_problem__base_step__{STEP_LOOKUP}',
+}
+
+# Course fields that are not copied to a new edition
+COURSE_EXCLUDED_FIELDS = {'id', 'instructor_id', 'title', 'creation_date', 'release_date', 'active'}
+
+
+def get_course_tree_rows(model, course_id):
+    """
+    Return the rows of one model of the course tree as `values()` dicts, ordered so they keep their order once copied.
+    """
+    queryset = model.objects.filter(**{COURSE_LOOKUPS[model]: course_id})
+    if model in (CodeChallengeTestCase, SortingProblemOption):
+        queryset = queryset.order_by('id')
+    return queryset.values()
+
+
+def count_course_tree_rows(course_id):
+    return sum(get_course_tree_rows(model, course_id).count() for model in TREE_MODELS)
+
+
+class CourseTreeWriter:
+    """
+    Collects the rows of a course tree and writes them with one bulk_create per model and batch.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, progress_callback=None):
+        """
+        :param progress_callback: called with the number of written rows after every batch
+        """
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.rows = defaultdict(list)
+        self.written = 0
+
+    def add(self, obj):
+        self.rows[type(obj)].append(obj)
+
+    @property
+    def pending(self):
+        return sum(len(objs) for objs in self.rows.values())
+
+    def flush(self):
+        for model in TREE_MODELS:
+            objs = self.rows.pop(model, [])
+            for start in range(0, len(objs), self.batch_size):
+                batch = objs[start:start + self.batch_size]
+                self.write_batch(model, batch)
+                self.written += len(batch)
+                if self.progress_callback:
+                    self.progress_callback(self.written)
+
+    @staticmethod
+    def write_batch(model, batch):
+        if model is Chapter:
+            # bulk_create stamps the chapters with the current time, restore the original dates to keep their order
+            creation_dates = [(chapter, chapter.creation_date) for chapter in batch if chapter.creation_date]
+            model.objects.bulk_create(batch)
+            for chapter, creation_date in creation_dates:
+                chapter.creation_date = creation_date
+            model.objects.bulk_update([chapter for chapter, _ in creation_dates], ['creation_date'])
+        else:
+            model.objects.bulk_create(batch)
+
+
+class CourseTreeRemapper:
+    """
+    Builds the copies of course tree rows for a new course, replacing the primary keys with new ones
+    and the parent references with the new keys of the parents.
+    Rows must be given parents first, see TREE_MODELS.
+    """
+
+    def __init__(self, course_id):
+        self.course_id = course_id
+        self.chapter_ids = {}
+        self.lesson_ids = {}
+        self.step_ids = {}
+
+    @staticmethod
+    def new_id(id_map, old_id):
+        id_map[old_id] = new_id = uuid.uuid4()
+        return new_id
+
+    def remap(self, model, values):
+        """
+        :param values: row as a {field attname: value} dict
+        :return: unsaved model instance
+        """
+        if model is Chapter:
+            overrides = {'id': self.new_id(self.chapter_ids, values['id']), 'course_id': self.course_id}
+        elif model is Lesson:
+            overrides = {'id': self.new_id(self.lesson_ids, values['id']),
+                         'chapter_id': self.chapter_ids[values['chapter_id']]}
+        elif model is BaseLessonStep:
+            overrides = {'id': self.new_id(self.step_ids, values['id']),
+                         'lesson_id': self.lesson_ids[values['lesson_id']]}
+        elif model in CHILD_STEP_MODELS:
+            overrides = {'base_step_id': self.step_ids[values['base_step_id']]}
+        elif model is QuizChoice:
+            overrides = {'id': uuid.uuid4(), 'quiz_id': self.step_ids[values['quiz_id']]}
+        elif model is CodeChallengeTestCase:
+            overrides = {'id': None, 'code_challenge_step_id': self.step_ids[values['code_challenge_step_id']]}
+        elif model is SortingProblemOption:
+            overrides = {'id': None, 'sorting_problem_id': self.step_ids[values['sorting_problem_id']]}
+        else:
+            raise ValueError(f'{model.__name__} is not part of a course tree')
+
+        return model(**{**values, **overrides})
+
+
+def clone_course(course_id, instructor_id, new_course_id=None, title=None, progress_callback=None):
+    """
+    Copy a course with all its chapters, lessons and steps into a new inactive course owned by the instructor.
+
+    :param progress_callback: called with (written rows, total rows) while the tree is written
+    :return: the new course
+    """
+    source_values = Course.objects.filter(id=course_id).values().get()
+    total = count_course_tree_rows(course_id)
+    writer = CourseTreeWriter(
+        progress_callback=(lambda written: progress_callback(written, total)) if progress_callback else None)
+
+    with transaction.atomic():
+        course_values = {key: value for key, value in source_values.items() if key not in COURSE_EXCLUDED_FIELDS}
+        # Saved normally, so the course signals (analytics, caches) still run
+        course = Course.objects.create(id=new_course_id or uuid.uuid4(), instructor_id=instructor_id,
+                                       title=title or source_values['title'], **course_values)
+        course.tags.set(Course.tags.through.objects.filter(course_id=course_id).values_list('tag_id', flat=True))
+
+        remapper = CourseTreeRemapper(course.id)
+        for model in TREE_MODELS:
+            for values in get_course_tree_rows(model, course_id).iterator(chunk_size=BATCH_SIZE):
+                writer.add(remapper.remap(model, values))
+                if writer.pending >= writer.batch_size:
+                    writer.flush()
+        writer.flush()
+
+    return course
@@ -0,0 +1,211 @@
+"""
+Direct uploads to the media bucket.
+
+The client asks for presigned URLs, sends the bytes straight to the bucket (in parts for large files) and then
+confirms the upload, at which point the object key is attached to the model field. The web workers never see the
+file content. Set AWS_S3_ENDPOINT_URL to use a local S3 compatible server such as MinIO.
+"""
+import math
+import os
+import uuid
+
+import boto3
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from courses.models import Course, VideoLessonStep, DirectUpload
+from courses.remote_images import cancel_pending_image
+from users.models import User
+
+MB = 1024 * 1024
+PART_SIZE = 64 * MB  # S3 accepts parts of 5 MB to 5 GB, and at most 10000 parts
+MAX_PARTS = 10000
+URL_EXPIRATION = settings.DIRECT_UPLOAD_URL_EXPIRATION
+
+
+class DirectUploadError(Exception):
+    pass
+
+
+class UploadTarget:
+    def __init__(self, model, field_name, content_types, max_size, get_queryset):
+        """
+        :param content_types: the content types accepted for every allowed file extension, the first one is used when
+            the client doesn't send one. They're served by the bucket, so never types rendered as documents (HTML, SVG)
+        :param get_queryset: function returning the objects of the model the user can upload to
+        """
+        self.model = model
+        self.field_name = field_name
+        self.content_types = content_types
+        self.max_size = max_size
+        self.get_queryset = get_queryset
+
+    @property
+    def extensions(self):
+        return list(self.content_types)
+
+    @property
+    def key_prefix(self):
+        return self.model._meta.get_field(self.field_name).upload_to
+
+
+IMAGE_CONTENT_TYPES = {
+    'jpg': ['image/jpeg'],
+    'jpeg': ['image/jpeg'],
+    'png': ['image/png'],
+    'webp': ['image/webp'],
+}
+VIDEO_CONTENT_TYPES = {
+    'mov': ['video/quicktime'],
+    'avi': ['video/x-msvideo', 'video/avi'],
+    'mp4': ['video/mp4'],
+    'webm': ['video/webm'],
+    'mkv': ['video/x-matroska'],
+}
+
+UPLOAD_TARGETS = {
+    DirectUpload.Target.VIDEO_STEP: UploadTarget(
+        VideoLessonStep, 'video_file', VIDEO_CONTENT_TYPES, 10 * 1024 * MB,
+        lambda user: VideoLessonStep.objects.filter(base_step__lesson__chapter__course__instructor=user),
+    ),
+    DirectUpload.Target.COURSE_IMAGE: UploadTarget(
+        Course, 'image', IMAGE_CONTENT_TYPES, 10 * MB,
+        lambda user: Course.objects.filter(instructor=user),
+    ),
+    DirectUpload.Target.USER_PICTURE: UploadTarget(
+        User, 'picture', IMAGE_CONTENT_TYPES, 10 * MB,
+        lambda user: User.objects.filter(id=user.id),
+    ),
+}
+
+
+def get_s3_client():
+    return boto3.client(
+        's3',
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        region_name=settings.AWS_S3_REGION_NAME,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        config=Config(signature_version='s3v4'),
+    )
+
+
+def get_upload_key(target, filename):
+    return f'{target.key_prefix}{uuid.uuid4().hex}/{get_valid_filename(os.path.basename(filename))}'
+
+
+def initiate_upload(user, target_name, object_id, filename, content_type, size):
+    """
+    Register an upload and return the presigned URL(s) the client should send the file to.
+    Files bigger than PART_SIZE are sent in parts, with one URL per part.
+    """
+    target = UPLOAD_TARGETS.get(target_name)
+    if target is None:
+        raise DirectUploadError(f'Unknown upload target: {target_name}')
+    try:
+        object_id = uuid.UUID(str(object_id))
+    except ValueError:
+        raise DirectUploadError('The object to upload to does not exist')
+    if not target.get_queryset(user).filter(pk=object_id).exists():
+        raise DirectUploadError('The object to upload to does not exist')
+
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in target.content_types:
+        raise DirectUploadError(
+            f'File extension "{extension}" is not allowed, use one of {", ".join(target.extensions)}')
+    content_types = target.content_types[extension]
+    content_type = str(content_type).lower() if content_type else content_types[0]
+    if content_type not in content_types:
+        raise DirectUploadError(f'The content type of a .{extension} file must be {" or ".join(content_types)}')
+    if size <= 0 or size > target.max_size:
+        raise DirectUploadError(f'The file size must be between 1 and {target.max_size} bytes')
+
+    client = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    upload = DirectUpload(user=user, target=target_name, object_id=str(object_id),
+                          key=get_upload_key(target, filename), content_type=content_type, size=size)
+
+    if size <= PART_SIZE:
+        upload.save()
+        url = client.generate_presigned_url(
+            'put_object', Params={'Bucket': bucket, 'Key': upload.key, 'ContentType': content_type},
+            ExpiresIn=URL_EXPIRATION)
+        return upload, {'method': 'PUT', 'url': url}
+
+    parts_count = math.ceil(size / PART_SIZE)
+    if parts_count > MAX_PARTS:
+        raise DirectUploadError('The file is too big')
+
+    multipart_upload = client.create_multipart_upload(Bucket=bucket, Key=upload.key, ContentType=content_type)
+    upload.multipart_upload_id = multipart_upload['UploadId']
+    upload.save()
+    parts = [
+        {'part_number': part_number,
+         'url': client.generate_presigned_url(
+             'upload_part', Params={'Bucket': bucket, 'Key': upload.key, 'UploadId': upload.multipart_upload_id,
+                                    'PartNumber': part_number},
+             ExpiresIn=URL_EXPIRATION)}
+        for part_number in range(1, parts_count + 1)
+    ]
+    return upload, {'method': 'PUT', 'part_size': PART_SIZE, 'parts': parts}
+
+
+def complete_upload(upload, parts=None):
+    """
+    Check that the object is in the bucket and attach its key to the target model field.
+
+    :param parts: list of {'part_number', 'etag'} dicts for multipart uploads, as returned by the bucket
+    :return: the updated object
+    """
+    if upload.status != DirectUpload.Status.PENDING:
+        raise DirectUploadError('The upload is not pending')
+
+    client = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    try:
+        if upload.multipart_upload_id:
+            if not parts:
+                raise DirectUploadError('The uploaded parts must be listed to complete a multipart upload')
+            client.complete_multipart_upload(
+                Bucket=bucket, Key=upload.key, UploadId=upload.multipart_upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': int(part['part_number']), 'ETag': part['etag']}
+                                           for part in parts]})
+        uploaded_object = client.head_object(Bucket=bucket, Key=upload.key)
+    except ClientError as e:
+        raise DirectUploadError(f'The upload could not be completed: {e}')
+    except (KeyError, TypeError, ValueError):
+        raise DirectUploadError('Invalid uploaded parts')
+
+    target = UPLOAD_TARGETS[upload.target]
+    if uploaded_object['ContentLength'] > target.max_size:
+        client.delete_object(Bucket=bucket, Key=upload.key)
+        raise DirectUploadError('The uploaded file is too big')
+
+    obj = target.get_queryset(upload.user).get(pk=upload.object_id)
+    setattr(obj, target.field_name, upload.key)
+    obj.save()
+    cancel_pending_image(obj, target.field_name)
+
+    upload.status = DirectUpload.Status.COMPLETED
+    upload.size = uploaded_object['ContentLength']
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['status', 'size', 'completed_at'])
+    return obj
+
+
+def abort_upload(upload):
+    if upload.status != DirectUpload.Status.PENDING:
+        raise DirectUploadError('The upload is not pending')
+
+    if upload.multipart_upload_id:
+        try:
+            get_s3_client().abort_multipart_upload(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=upload.key,
+                                                   UploadId=upload.multipart_upload_id)
+        except ClientError as e:
+            raise DirectUploadError(f'The upload could not be aborted: {e}')
+
+    upload.status = DirectUpload.Status.ABORTED
+    upload.save(update_fields=['status'])
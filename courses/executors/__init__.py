@@ -0,0 +1,13 @@
+from django.conf import settings
+
+from .base import BaseExecutor, ExecutionResult, ExecutorError, ExecutionIncomplete, COMPILATION_ERROR
+
+
+def get_executor():
+    if settings.CODE_EXECUTOR == 'local':
+        from .local import LocalExecutor
+        return LocalExecutor()
+    if settings.CODE_EXECUTOR == 'judge0':
+        from .judge0 import Judge0Executor
+        return Judge0Executor()
+    raise ExecutorError(f'Unknown code executor {settings.CODE_EXECUTOR}')
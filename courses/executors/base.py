@@ -0,0 +1,69 @@
+"""
+Code executors run the code challenge submissions against their test cases.
+
+The source code, the inputs and the expected outputs are base64 encoded, as stored, and so are the outputs of the
+results, so the test results look the same whichever executor ran them.
+"""
+import base64
+from abc import ABCMeta, abstractmethod
+
+# Judge0 status descriptions, used by every executor
+ACCEPTED = 'Accepted'
+WRONG_ANSWER = 'Wrong Answer'
+TIME_LIMIT_EXCEEDED = 'Time Limit Exceeded'
+COMPILATION_ERROR = 'Compilation Error'
+RUNTIME_ERROR = 'Runtime Error (NZEC)'
+INTERNAL_ERROR = 'Internal Error'
+
+
+class ExecutorError(Exception):
+    """
+    The submission could not be run at all, e.g. the language is not supported.
+    """
+
+
+class ExecutionIncomplete(ExecutorError):
+    """
+    Some results were not received in time, the evaluation can be retried.
+    """
+
+
+class ExecutionResult:
+    def __init__(self, status, stdout=None, stderr=None, compile_output=None):
+        """
+        :param stdout, stderr, compile_output: base64 encoded outputs, or None
+        """
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+        self.compile_output = compile_output
+
+    @property
+    def passed(self):
+        return self.status == ACCEPTED
+
+    def __repr__(self):
+        return f'ExecutionResult({self.status!r})'
+
+
+def encode(data):
+    if data is None or data == b'':
+        return None
+    return base64.b64encode(data if isinstance(data, bytes) else data.encode()).decode()
+
+
+def decode(data):
+    return base64.b64decode(data or '')
+
+
+class BaseExecutor(metaclass=ABCMeta):
+    @abstractmethod
+    def run(self, source_code, language_id, test_cases):
+        """
+        Run the submission against the test cases.
+
+        :param test_cases: CodeChallengeTestCase objects
+        :return: iterator of (test case, ExecutionResult) pairs, in the order the results are available.
+            The evaluation can stop consuming it early, e.g. on the first error. When the submission does not compile,
+            a single COMPILATION_ERROR result is yielded, for the first test case, and the other ones are not run.
+        """
@@ -0,0 +1,39 @@
+#!/bin/sh
+# Filesystem jail of the programs of the local executor, see courses.executors.local.
+#
+# Usage: jail.sh WORK_DIR [READ_ONLY_PATH...] -- COMMAND [ARG...]
+#
+# Run as the root of new user and mount namespaces (unshare --user --map-root-user --mount), it builds a root from an
+# empty tmpfs holding the read-only toolchain paths, the work directory and a few devices, and runs the command in it
+# from the work directory. The files of the worker, e.g. its code and its settings, don't exist for the command and
+# what it writes outside the work directory is dropped with the tmpfs.
+set -eu
+
+work_dir=$1
+shift
+root=$(mktemp -d)
+mount -t tmpfs -o size=64m,mode=755 tmpfs "$root"
+
+while [ "$#" -gt 0 ] && [ "$1" != "--" ]; do
+    if [ -e "$1" ]; then
+        mkdir -p "$root$1"
+        mount --rbind "$1" "$root$1"
+        mount -o remount,bind,ro "$root$1"
+    fi
+    shift
+done
+shift
+
+mkdir -p "$root$work_dir" "$root/tmp" "$root/proc" "$root/dev"
+mount --bind "$work_dir" "$root$work_dir"
+mount -t proc proc "$root/proc"
+for device in null zero random urandom; do
+    touch "$root/dev/$device"
+    mount --bind "/dev/$device" "$root/dev/$device"
+done
+
+status=0
+chroot "$root" sh -c 'cd "$0" && exec "$@"' "$work_dir" "$@" || status=$?
+umount -l "$root"
+rmdir "$root"
+exit "$status"
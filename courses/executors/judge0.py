@@ -0,0 +1,71 @@
+import time
+
+import requests
+
+from courses import judge0_service
+from .base import BaseExecutor, ExecutionResult, ExecutionIncomplete, COMPILATION_ERROR
+
+BATCH_SIZE = 20  # max batch size of the Judge0 API
+MAX_POLLS = 15
+POLL_INTERVAL = 0.5
+PENDING_STATUSES = ['In Queue', 'Processing']
+
+
+class Judge0Executor(BaseExecutor):
+    """
+    Sends the test cases to the Judge0 API in batches of submissions and polls for their results.
+
+    Judge0 has no way to run a compiled program again, so the code is compiled for every test case, but a compilation
+    error is only reported once.
+    """
+
+    def run(self, source_code, language_id, test_cases):
+        test_cases = list(test_cases)
+        if not test_cases:
+            return
+
+        # Judge0 compiles every submission again, so the first test case is run alone to find out whether the code
+        # compiles before sending the other ones
+        for test_case, result in self.run_batch(source_code, language_id, test_cases[:1]):
+            yield test_case, result
+            if result.status == COMPILATION_ERROR:
+                return
+
+        for start in range(1, len(test_cases), BATCH_SIZE):
+            yield from self.run_batch(source_code, language_id, test_cases[start:start + BATCH_SIZE])
+
+    def run_batch(self, source_code, language_id, test_cases):
+        submissions = [{
+            "source_code": source_code,
+            "language_id": language_id,
+            "stdin": test_case.input,
+            "expected_output": test_case.expected_output,
+        } for test_case in test_cases]
+        batch_submission_response = judge0_service.submit_batch(submissions)
+        test_cases_by_token = {submission['token']: test_case
+                               for submission, test_case in zip(batch_submission_response, test_cases)}
+
+        polls = 0
+        while test_cases_by_token and polls < MAX_POLLS:
+            polls += 1
+            try:
+                result = judge0_service.get_batch_submission_result(list(test_cases_by_token))
+            except requests.HTTPError:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            for submission in result.get('submissions', []):
+                status = submission.get('status', {}).get('description', '')
+                if status in PENDING_STATUSES:
+                    continue
+                test_case = test_cases_by_token.pop(submission.get('token', ''), None)
+                if test_case is not None:
+                    yield test_case, ExecutionResult(status, stdout=submission.get('stdout'),
+                                                     stderr=submission.get('stderr'),
+                                                     compile_output=submission.get('compile_output'))
+
+            if test_cases_by_token:
+                time.sleep(POLL_INTERVAL)
+
+        if test_cases_by_token:
+            raise ExecutionIncomplete(f'{len(test_cases_by_token)} Judge0 results were not received in time')
@@ -0,0 +1,243 @@
+"""
+Local executor, runs the submissions in sandboxed subprocesses of the worker.
+
+A submission is written to a temporary directory and compiled once, then the program runs for every test case in a
+shared pool of threads. Every process is started through `prlimit`, which caps its CPU time, memory, number of
+processes, open files and written file size, inside the command of LOCAL_EXECUTOR_SANDBOX_COMMAND (by default
+`unshare` and jail.sh, without network access, seeing only its own processes and only the toolchain and its work
+directory of the filesystem, or e.g. a bubblewrap command line) and as the LOCAL_EXECUTOR_USER user. Before running
+the first submission, a probe checks that the programs can't read the files of the worker: the submissions are refused
+otherwise, they would run with the permissions and the secrets of the worker.
+"""
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+from .base import BaseExecutor, ExecutionResult, ExecutorError, ACCEPTED, WRONG_ANSWER, TIME_LIMIT_EXCEEDED, \
+    COMPILATION_ERROR, RUNTIME_ERROR, encode, decode
+
+COMPILE_TIME_LIMIT = 30
+COMPILE_MEMORY_LIMIT = 1024  # MB
+
+
+class Language:
+    def __init__(self, name, source_file, run_command, compile_command=None, memory_rlimit='as'):
+        """
+        :param memory_rlimit: the prlimit resource capping the memory, 'as' for the address space, 'data' for the
+            runtimes reserving much more address space than they use but not writing to it (Go), None for those
+            bounded by their own options (JVM, V8)
+        """
+        self.name = name
+        self.source_file = source_file
+        self.run_command = run_command
+        self.compile_command = compile_command
+        self.memory_rlimit = memory_rlimit
+
+
+# Judge0 language ids, so the ProgrammingLanguage objects work with both executors
+LANGUAGES = {
+    50: Language('C (GCC)', 'main.c', ['./main'], ['gcc', '-O2', '-std=c11', '-o', 'main', 'main.c', '-lm']),
+    54: Language('C++ (GCC)', 'main.cpp', ['./main'], ['g++', '-O2', '-std=c++17', '-o', 'main', 'main.cpp']),
+    60: Language('Go', 'main.go', ['./main'], ['go', 'build', '-o', 'main', 'main.go'],
+                 memory_rlimit='data'),
+    62: Language('Java (OpenJDK)', 'Main.java', ['java', '-Xmx256m', '-Xss64m', 'Main'], ['javac', 'Main.java'],
+                 memory_rlimit=None),
+    63: Language('JavaScript (Node.js)', 'main.js', ['node', '--max-old-space-size=256', 'main.js'],
+                 memory_rlimit=None),
+    71: Language('Python 3', 'main.py', ['python3', 'main.py']),
+    73: Language('Rust', 'main.rs', ['./main'], ['rustc', '-O', '-o', 'main', 'main.rs']),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+# (sandbox command, user) pairs which passed the probe of LocalExecutor.check_sandbox
+_checked_sandboxes = set()
+
+
+def get_pool():
+    # Shared by the evaluations of the worker process, so they never run more programs than LOCAL_EXECUTOR_WORKERS
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.LOCAL_EXECUTOR_WORKERS, thread_name_prefix='local-executor')
+    return _pool
+
+
+def get_runtime_error_status(returncode):
+    if returncode < 0:
+        try:
+            return f'Runtime Error ({signal.Signals(-returncode).name})'
+        except ValueError:
+            return 'Runtime Error (Other)'
+    return RUNTIME_ERROR
+
+
+def outputs_match(stdout, expected_output):
+    # Trailing whitespace is ignored, as by Judge0
+    return stdout.rstrip() == expected_output.rstrip()
+
+
+class LocalExecutor(BaseExecutor):
+    def __init__(self, time_limit=None, memory_limit=None, output_limit=None):
+        """
+        :param time_limit: CPU seconds per test case
+        :param memory_limit: MB per test case
+        :param output_limit: KB of stdout and of stderr per test case
+        """
+        self.time_limit = time_limit or settings.LOCAL_EXECUTOR_TIME_LIMIT
+        self.memory_limit = memory_limit or settings.LOCAL_EXECUTOR_MEMORY_LIMIT
+        self.output_limit = output_limit or settings.LOCAL_EXECUTOR_OUTPUT_LIMIT
+
+    def run(self, source_code, language_id, test_cases):
+        language = LANGUAGES.get(language_id)
+        if language is None:
+            raise ExecutorError(f'Language {language_id} is not supported by the local executor')
+        if not settings.LOCAL_EXECUTOR_SANDBOX_COMMAND and not settings.LOCAL_EXECUTOR_USER:
+            raise ExecutorError('The local executor needs LOCAL_EXECUTOR_SANDBOX_COMMAND or LOCAL_EXECUTOR_USER')
+
+        work_dir = tempfile.mkdtemp(prefix='submission-')
+        try:
+            self.make_accessible(work_dir)
+            self.check_sandbox(work_dir)
+            with open(os.path.join(work_dir, language.source_file), 'wb') as source_file:
+                source_file.write(decode(source_code))
+            self.make_accessible(work_dir)
+
+            compile_result = self.compile(language, work_dir)
+            if compile_result is not None:
+                test_case = next(iter(test_cases), None)
+                if test_case is not None:
+                    yield test_case, compile_result
+                return
+
+            futures = {get_pool().submit(self.run_test_case, language, work_dir, test_case): test_case
+                       for test_case in test_cases}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # The evaluation stopped early, the test cases that didn't start yet are dropped
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled():
+                        future.exception()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def check_sandbox(self, work_dir):
+        """
+        Refuse to run the programs if they can read the files of the worker, e.g. its code, settings and secrets.
+        """
+        sandbox = (settings.LOCAL_EXECUTOR_SANDBOX_COMMAND, settings.LOCAL_EXECUTOR_USER)
+        if sandbox in _checked_sandboxes:
+            return
+
+        worker_file = os.path.join(settings.BASE_DIR, 'manage.py')
+        returncode, _, stderr, _ = self.execute(['sh', '-c', '! cat "$0" > /dev/null 2>&1', worker_file], work_dir,
+                                                b'', {'cpu': COMPILE_TIME_LIMIT}, COMPILE_TIME_LIMIT)
+        if returncode != 0:
+            raise ExecutorError(f'The programs of the local executor could read {worker_file}, or did not start '
+                                f'({stderr.decode(errors="replace")[-200:]}), configure LOCAL_EXECUTOR_SANDBOX_COMMAND '
+                                f'with a filesystem jail or an unprivileged LOCAL_EXECUTOR_USER')
+        _checked_sandboxes.add(sandbox)
+
+    def compile(self, language, work_dir):
+        """
+        :return: the result of every test case when the compilation failed, else None
+        """
+        if not language.compile_command:
+            return None
+
+        limits = {'cpu': COMPILE_TIME_LIMIT, 'nproc': 64, 'fsize': 256 * 1024 * 1024}
+        if language.memory_rlimit:
+            limits[language.memory_rlimit] = COMPILE_MEMORY_LIMIT * 1024 * 1024
+        returncode, _, output, timed_out = self.execute(language.compile_command, work_dir, b'', limits,
+                                                        COMPILE_TIME_LIMIT * 2)
+        if timed_out:
+            return ExecutionResult(COMPILATION_ERROR, compile_output=encode('Compilation time limit exceeded'))
+        if returncode != 0:
+            return ExecutionResult(COMPILATION_ERROR, compile_output=encode(output))
+        self.make_accessible(work_dir)
+        return None
+
+    def run_test_case(self, language, work_dir, test_case):
+        limits = {'cpu': self.time_limit, 'nproc': 64, 'nofile': 64, 'fsize': self.output_limit * 1024}
+        if language.memory_rlimit:
+            limits[language.memory_rlimit] = self.memory_limit * 1024 * 1024
+        # Wall time limit, for programs sleeping or waiting on input
+        returncode, stdout, stderr, timed_out = self.execute(language.run_command, work_dir, decode(test_case.input),
+                                                             limits, self.time_limit * 3)
+
+        if timed_out or returncode == -signal.SIGXCPU or returncode == -signal.SIGKILL:
+            status = TIME_LIMIT_EXCEEDED
+        elif returncode != 0:
+            status = get_runtime_error_status(returncode)
+        elif outputs_match(stdout.decode(errors='replace'), decode(test_case.expected_output).decode(errors='replace')):
+            status = ACCEPTED
+        else:
+            status = WRONG_ANSWER
+        return ExecutionResult(status, stdout=encode(stdout), stderr=encode(stderr))
+
+    def execute(self, command, work_dir, stdin, limits, timeout):
+        """
+        Run a command in the sandbox, with its outputs capped to output_limit.
+
+        :return: (return code, stdout, stderr, timed out)
+        """
+        prlimit = ['prlimit'] + [f'--{name}={value}' for name, value in limits.items()] + ['--']
+        sandbox = [argument.replace('{work_dir}', work_dir)
+                   for argument in shlex.split(settings.LOCAL_EXECUTOR_SANDBOX_COMMAND)]
+        if sandbox:
+            # Not every sandbox command reports the signal killing the program (unshare --fork exits with 1), a
+            # shell waiting for it reports it as 128 + the signal
+            sandbox += ['sh', '-c', '"$@"; exit $?', 'sh']
+        full_command = sandbox + prlimit + command
+
+        # Temporary files instead of pipes, so a program flooding its output can't fill the memory of the worker
+        with tempfile.TemporaryFile() as stdin_file, tempfile.TemporaryFile() as stdout_file, \
+                tempfile.TemporaryFile() as stderr_file:
+            stdin_file.write(stdin)
+            stdin_file.seek(0)
+            try:
+                process = subprocess.Popen(full_command, cwd=work_dir, stdin=stdin_file, stdout=stdout_file,
+                                           stderr=stderr_file, env=self.get_env(), start_new_session=True,
+                                           user=settings.LOCAL_EXECUTOR_USER or None)
+            except OSError as e:
+                raise ExecutorError(f'Could not start {command[0]}: {e}')
+
+            timed_out = False
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                # The whole session, including the processes the program started
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+            returncode = process.returncode
+            if sandbox and returncode > 128:
+                returncode = 128 - returncode
+            max_size = self.output_limit * 1024
+            stdout_file.seek(0)
+            stderr_file.seek(0)
+            return returncode, stdout_file.read(max_size), stderr_file.read(max_size), timed_out
+
+    @staticmethod
+    def get_env():
+        return {'PATH': os.environ.get('PATH', '/usr/bin:/bin'), 'HOME': '/tmp', 'LANG': 'C.UTF-8'}
+
+    @staticmethod
+    def make_accessible(work_dir):
+        # The programs may run as another user, they only need to read and execute the files
+        if settings.LOCAL_EXECUTOR_USER:
+            os.chmod(work_dir, 0o755)
+            for name in os.listdir(work_dir):
+                os.chmod(os.path.join(work_dir, name), 0o755)
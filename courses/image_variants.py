@@ -0,0 +1,113 @@
+"""
+Resized variants of the course images and profile pictures.
+
+Every variant width is stored as WebP and JPEG next to the original, e.g. courses/images/logo_320w.webp,
+and the names are kept in the `<image field>_variants` JSON field of the object:
+
+    {'source': 'courses/images/logo.png', 'webp': {'160': 'courses/images/logo_160w.webp', ...}, 'jpeg': {...}}
+
+The variants are only valid while `source` is the current image, see ImageVariantsField.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from courses.models import Course
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+# model: (image field, widths of the variants)
+IMAGE_FIELDS = {
+    Course: ('image', [160, 320, 640]),
+    User: ('picture', [64, 128, 256]),
+}
+
+# variant format: (Pillow format, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def get_variants_field_name(field_name):
+    return f'{field_name}_variants'
+
+
+def needs_variants(obj, field_name):
+    image = getattr(obj, field_name)
+    if not image or image.name == obj._meta.get_field(field_name).default:
+        return False
+    variants = getattr(obj, get_variants_field_name(field_name)) or {}
+    return variants.get('source') != image.name
+
+
+def open_image(field_file):
+    with field_file.open('rb'):
+        image = Image.open(field_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    return image
+
+
+def to_rgb(image):
+    # JPEG has no transparency, transparent pixels are flattened on white
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_variants(field_file, widths):
+    """
+    Save the resized variants of the image to its storage.
+
+    :return: the variants dict for the `<image field>_variants` field
+    """
+    source = field_file.name
+    variants = {'source': source}
+    try:
+        image = open_image(field_file)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning(f'No variants for {source}, the image could not be read: {e}')
+        return variants
+
+    image = image.convert('RGBA') if image.mode in ('RGBA', 'LA', 'P') else image.convert('RGB')
+    # Images are never upscaled, a small image gets a single variant of its own width
+    widths = [width for width in widths if width < image.width] or [image.width]
+    stem = os.path.splitext(source)[0]
+
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for format_name, (pil_format, extension, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            (resized if pil_format == 'WEBP' else to_rgb(resized)).save(buffer, pil_format, **options)
+            name = field_file.storage.save(f'{stem}_{width}w.{extension}', ContentFile(buffer.getvalue()))
+            variants.setdefault(format_name, {})[str(width)] = name
+
+    return variants
+
+
+def update_image_variants(obj, field_name):
+    """
+    Build the variants of the current image of the object and save them.
+
+    :return: False when the object has no image to build variants for, or already has them
+    """
+    if not needs_variants(obj, field_name):
+        return False
+
+    _, widths = IMAGE_FIELDS[type(obj)]
+    variants = build_variants(getattr(obj, field_name), widths)
+
+    # The image may have been replaced while the variants were built
+    if type(obj).objects.filter(pk=obj.pk, **{field_name: variants['source']}).exists():
+        setattr(obj, get_variants_field_name(field_name), variants)
+        obj.save(update_fields=[get_variants_field_name(field_name)])
+    return True
@@ -0,0 +1,189 @@
+"""
+Saving of a whole lesson from the editor.
+
+The existing steps of the lesson are loaded with their children in a few queries, diffed against the validated
+payload of LessonStepField, and the differences are written with bulk creates, updates and deletes.
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from courses import cache_utils
+from courses.models import BaseLessonStep, TextLessonStep, QuizLessonStep, QuizChoice, VideoLessonStep, \
+    CodeChallengeLessonStep, CodeChallengeTestCase, SortingProblemLessonStep, SortingProblemOption, \
+    TextProblemLessonStep
+from courses.signals import lesson_steps_changed
+
+# step type: (model, related name on BaseLessonStep)
+STEP_TYPES = {
+    'text': (TextLessonStep, 'text_step'),
+    'quiz': (QuizLessonStep, 'quiz_step'),
+    'video': (VideoLessonStep, 'video_step'),
+    'codechallenge': (CodeChallengeLessonStep, 'code_challenge_step'),
+    'sorting_problem': (SortingProblemLessonStep, 'sorting_problem_step'),
+    'text_problem': (TextProblemLessonStep, 'text_problem_step'),
+}
+
+# step model: (model of the children, foreign key to the step, related name on the step)
+STEP_CHILDREN = {
+    QuizLessonStep: (QuizChoice, 'quiz', 'quizchoice_set'),
+    CodeChallengeLessonStep: (CodeChallengeTestCase, 'code_challenge_step', 'test_cases'),
+    SortingProblemLessonStep: (SortingProblemOption, 'sorting_problem', 'options'),
+}
+
+
+class BulkChanges:
+    """
+    Pending inserts, updates and deletes, grouped by model.
+    """
+
+    def __init__(self):
+        self.created = defaultdict(list)
+        self.updated = defaultdict(dict)
+        self.updated_fields = defaultdict(set)
+        self.deleted = defaultdict(list)
+
+    def create(self, obj):
+        self.created[type(obj)].append(obj)
+
+    def update(self, obj, values, force=False):
+        changed_fields = [field for field, value in values.items() if force or getattr(obj, field) != value]
+        for field in changed_fields:
+            setattr(obj, field, values[field])
+        if changed_fields:
+            self.updated[type(obj)][obj.pk] = obj
+            self.updated_fields[type(obj)].update(changed_fields)
+
+    def delete(self, model, pks):
+        self.deleted[model].extend(pks)
+
+    def apply(self, models):
+        """
+        :param models: models in dependency order, parents first
+        """
+        for model in reversed(models):
+            if self.deleted[model]:
+                model.objects.filter(pk__in=self.deleted[model]).delete()
+        for model in models:
+            if self.created[model]:
+                model.objects.bulk_create(self.created[model])
+            if self.updated[model]:
+                model.objects.bulk_update(list(self.updated[model].values()), list(self.updated_fields[model]))
+
+
+STEP_TYPES_BY_MODEL = {model: related_name for model, related_name in STEP_TYPES.values()}
+
+
+def select_step_details(steps):
+    """
+    Load the typed step of each step of the queryset in the same query, and their children in a query per model.
+    """
+    related_names = [related_name for _, related_name in STEP_TYPES.values()]
+    children = [f'{STEP_TYPES_BY_MODEL[model]}__{children_name}'
+                for model, (_, _, children_name) in STEP_CHILDREN.items()]
+    return steps.select_related(*related_names).prefetch_related(*children)
+
+
+def get_existing_steps(lesson):
+    steps = select_step_details(lesson.baselessonstep_set.all())
+    return {step.id: step for step in steps}
+
+
+def resolve_step_values(values):
+    language = values.pop('language', None)
+    if language is not None:
+        # Compared and written by id, so the existing steps don't load their language
+        programming_language, _ = cache_utils.get_language_by_id(language['id'])
+        values['language_id'] = programming_language.id if programming_language else None
+    return values
+
+
+def pair_children_ids(raw_children, children_values):
+    """
+    Pair the validated values of nested children with their ids from the raw payload,
+    the nested serializers drop the ids since they're read only.
+    """
+    raw_children = raw_children if isinstance(raw_children, list) else []
+    ids = [raw_child.get('id') if isinstance(raw_child, dict) else None for raw_child in raw_children]
+    ids += [None] * (len(children_values) - len(ids))
+    return [(child_id, dict(values)) for child_id, values in zip(ids, children_values)]
+
+
+def sync_step_children(changes, step, children_data, existing_children):
+    """
+    Diff the children (quiz choices, test cases, sorting options) of one step against the payload.
+
+    :param children_data: list of (id, values) pairs, the id being None for new children
+    :param existing_children: {str(pk): child} dict of the current children of the step
+    """
+    child_model, step_field, _ = STEP_CHILDREN[type(step)]
+    kept = set()
+    for child_id, values in children_data:
+        child = existing_children.get(str(child_id)) if child_id is not None else None
+        if child is None:
+            changes.create(child_model(**{step_field: step}, **values))
+        else:
+            kept.add(str(child.pk))
+            changes.update(child, values)
+
+    changes.delete(child_model, [child.pk for key, child in existing_children.items() if key not in kept])
+
+
+def update_step_children(step, children_data):
+    """
+    Diff and save the children of a single step, e.g. the quiz choices of a quiz.
+    """
+    child_model, _, children_name = STEP_CHILDREN[type(step)]
+    changes = BulkChanges()
+    existing_children = {str(child.pk): child for child in getattr(step, children_name).all()}
+    sync_step_children(changes, step, children_data, existing_children)
+    changes.apply([child_model])
+
+
+def sync_lesson_steps(lesson, steps_data):
+    """
+    Make the steps of the lesson match the payload validated by LessonStepField:
+    new steps are created, existing ones updated when they changed and the missing ones deleted.
+    """
+    existing_steps = get_existing_steps(lesson)
+    changes = BulkChanges()
+    kept_step_ids = set()
+
+    # The steps are numbered 1..n following their requested order, or their position when it's not given
+    steps_data = sorted(enumerate(steps_data, start=1), key=lambda item: (item[1]['order'] or item[0], item[0]))
+    for order, (_, step_data) in enumerate(steps_data, start=1):
+        model, related_name = STEP_TYPES[step_data['type']]
+        values = resolve_step_values(step_data['values'])
+
+        if step_data['id'] is None:
+            base_step = BaseLessonStep(lesson=lesson, order=order)
+            step = model(base_step=base_step, **values)
+            changes.create(base_step)
+            changes.create(step)
+            existing_children = {}
+        else:
+            base_step = existing_steps.get(step_data['id'])
+            if base_step is None:
+                raise serializers.ValidationError(
+                    {'lesson_steps': f'Lesson step {step_data["id"]} does not exist in this lesson.'})
+            step = getattr(base_step, related_name, None)
+            if step is None:
+                raise serializers.ValidationError(
+                    {'lesson_steps': f'Lesson step {step_data["id"]} is not a {step_data["type"]} step.'})
+
+            kept_step_ids.add(base_step.id)
+            # Always written: deleting the removed steps renumbers the remaining ones
+            changes.update(base_step, {'order': order}, force=True)
+            changes.update(step, values)
+            existing_children = {}
+            if type(step) in STEP_CHILDREN:
+                _, _, children_name = STEP_CHILDREN[type(step)]
+                existing_children = {str(child.pk): child for child in getattr(step, children_name).all()}
+
+        if type(step) in STEP_CHILDREN and step_data['children'] is not None:
+            sync_step_children(changes, step, step_data['children'], existing_children)
+
+    changes.delete(BaseLessonStep, [step_id for step_id in existing_steps if step_id not in kept_step_ids])
+    changes.apply([BaseLessonStep, *STEP_TYPES_BY_MODEL, *(children[0] for children in STEP_CHILDREN.values())])
+
+    lesson_steps_changed.send(sender=lesson.__class__, lesson=lesson)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalog.recommendations import build_course_similarities
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed similar courses lists from co-enrollments, tags and categories'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Building the course similarities... This may take a while.')
+        similarities_count = build_course_similarities()
+        self.stdout.write(self.style.SUCCESS(f'Stored {similarities_count} course similarities'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from courses.image_variants import IMAGE_FIELDS, needs_variants
+from courses.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Queue the building of the resized variants of the course images and profile pictures that have none'
+
+    def handle(self, *args, **kwargs):
+        for model, (field_name, _) in IMAGE_FIELDS.items():
+            queued = 0
+            for obj in model.objects.only('pk', field_name, f'{field_name}_variants').iterator():
+                if needs_variants(obj, field_name):
+                    generate_image_variants.delay(obj._meta.label_lower, str(obj.pk), field_name)
+                    queued += 1
+            self.stdout.write(self.style.SUCCESS(f'{queued} {model._meta.verbose_name_plural} queued'))
@@ -1,8 +1,7 @@
 from django.core.management.base import BaseCommand
-from django.core.cache import cache
 
+from courses.cache_utils import refresh_learner_course_data
 from courses.models import Course
-from learning.api.serializers import LearnerCourseSerializer
 
 
 class Command(BaseCommand):
@@ -12,8 +11,7 @@ class Command(BaseCommand):
         courses = Course.objects.filter(active=True)
 
         for course in courses:
-            serialized_course = LearnerCourseSerializer(course, context={'is_learner': True}).data
-            cache.set(f"learner_course_{course.id}", serialized_course, timeout=5400)
+            refresh_learner_course_data(course)
             self.stdout.write(self.style.SUCCESS(f"Course {course.id} cached"))
 
         self.stdout.write(self.style.SUCCESS('All active learning courses cached'))
@@ -0,0 +1,25 @@
+from uuid import UUID
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.course_archive import iter_course_archive
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Export a course with its whole structure to a portable zip archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=UUID, help='The ID of the course to export')
+        parser.add_argument('output', help='Path of the archive to write')
+
+    def handle(self, *args, **kwargs):
+        course_id = kwargs['course_id']
+        if not Course.objects.filter(id=course_id).exists():
+            raise CommandError(f'Course {course_id} does not exist')
+
+        with open(kwargs['output'], 'wb') as output:
+            for chunk in iter_course_archive(course_id):
+                output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Course {course_id} exported to {kwargs['output']}"))
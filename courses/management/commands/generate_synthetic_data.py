@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.synthetic_data import SyntheticDataGenerator, PASSWORD
+
+
+class Command(BaseCommand):
+    help = 'Generate courses, learners, enrollments, progress and analytics at a configurable scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instructors', type=int, default=20)
+        parser.add_argument('--learners', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--chapters', type=int, default=5, help='Chapters per course')
+        parser.add_argument('--lessons', type=int, default=5, help='Lessons per chapter')
+        parser.add_argument('--steps', type=int, default=5, help='Steps per lesson')
+        parser.add_argument('--enrollments', type=int, default=5, help='Courses per learner, at most')
+        parser.add_argument('--test-cases', type=int, default=3, help='Test cases per code challenge')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **kwargs):
+        generator = SyntheticDataGenerator(seed=kwargs['seed'], batch_size=kwargs['batch_size'])
+        if generator.exists():
+            raise CommandError(f"The data of the seed {kwargs['seed']} was already generated, use another --seed")
+
+        self.stdout.write('Generating the synthetic data... This may take a while.')
+        counts = generator.generate(
+            instructors=kwargs['instructors'],
+            learners=kwargs['learners'],
+            courses=kwargs['courses'],
+            chapters=kwargs['chapters'],
+            lessons=kwargs['lessons'],
+            steps=kwargs['steps'],
+            enrollments=kwargs['enrollments'],
+            test_cases=kwargs['test_cases'],
+        )
+
+        for label, count in counts.items():
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated the data, the users log in with {generator.email_prefix()}<instructor|learner>-<n>'
+            f'@example.com and the password "{PASSWORD}". Run the nightly jobs to refresh the caches.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.course_archive import import_course, CourseArchiveError
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Import a course archive created by export_course as a new inactive course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help='Path of the archive to import')
+        parser.add_argument('instructor_email', help='Email of the instructor who will own the course')
+
+    def handle(self, *args, **kwargs):
+        try:
+            instructor = User.objects.get(email=kwargs['instructor_email'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {kwargs['instructor_email']} does not exist")
+
+        try:
+            course = import_course(kwargs['archive'], instructor.id)
+        except (CourseArchiveError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Course imported with ID {course.id}'))
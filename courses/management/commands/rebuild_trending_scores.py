@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from catalog.trending import rebuild_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute the time-decayed trending scores of all courses from the stored events'
+
+    def handle(self, *args, **kwargs):
+        courses_count = rebuild_trending_scores()
+        self.stdout.write(self.style.SUCCESS(f'Trending scores rebuilt for {courses_count} courses'))
@@ -1,9 +1,8 @@
 from uuid import UUID
 
 from django.core.management.base import BaseCommand
-from django.core.cache import cache
+from courses.cache_utils import refresh_learner_course_data
 from courses.models import Course
-from learning.api.serializers import LearnerCourseSerializer
 
 
 class Command(BaseCommand):
@@ -16,8 +15,7 @@ class Command(BaseCommand):
         course_id = kwargs['course_id']
         try:
             course = Course.objects.get(id=course_id)
-            serialized_course = LearnerCourseSerializer(course, context={'is_learner': True}).data
-            cache.set(f"learner_course_{course.id}", serialized_course, timeout=5400)
+            refresh_learner_course_data(course)
             self.stdout.write(self.style.SUCCESS(f"Course {course_id} cache refreshed"))
         except Course.DoesNotExist:
             self.stdout.write(self.style.ERROR(f"Course {course_id} does not exist"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time the main endpoints and the nightly jobs, and compare them to a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Prefixes of the benchmarks to run, e.g. catalog_ or job_')
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--clear-cache', action='store_true',
+                            help='Delete the cache entries of the benchmark before every run')
+        parser.add_argument('--force', action='store_true',
+                            help='Run on a cache which is not local, e.g. memcached, whose entries may be shared')
+        parser.add_argument('--save', metavar='PATH', help='Save the results as the baseline')
+        parser.add_argument('--compare', metavar='PATH', help='Fail on a regression from the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed growth of the median durations, 0.2 by default for 20%%')
+
+    def handle(self, *args, **kwargs):
+        baseline = benchmarks.load_baseline(kwargs['compare']) if kwargs['compare'] else None
+
+        try:
+            results = benchmarks.run_benchmarks(kwargs['names'], kwargs['iterations'], kwargs['clear_cache'],
+                                                log=self.log_result, force=kwargs['force'])
+        except benchmarks.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        if kwargs['save']:
+            benchmarks.save_baseline(kwargs['save'], results)
+            self.stdout.write(f"Saved the baseline to {kwargs['save']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, results, kwargs['tolerance'])
+            if regressions:
+                raise CommandError('Regressions from the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regression from the baseline'))
+
+    def log_result(self, name, result):
+        if 'error' in result:
+            self.stdout.write(self.style.ERROR(f"{name}: {result['error']}"))
+        else:
+            self.stdout.write(f"{name}: median {result['median_ms']} ms, p95 {result['p95_ms']} ms, "
+                              f"{result['queries']} queries")
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-19 17:06
+
+from django.db import migrations, models
+import django.db.models.constraints
+from django.db.models import Count
+
+
+def renumber_duplicate_orders(apps, schema_editor):
+    """
+    Renumber the lessons of chapters and the steps of lessons that contain duplicate order values,
+    so the unique constraints can be created.
+    """
+    for model_name, parent_field in [('Lesson', 'chapter_id'), ('BaseLessonStep', 'lesson_id')]:
+        model = apps.get_model('courses', model_name)
+        duplicated_parents = (model.objects.values(parent_field, 'order').order_by()
+                              .annotate(count=Count('pk')).filter(count__gt=1)
+                              .values_list(parent_field, flat=True).distinct())
+        for parent_id in duplicated_parents:
+            objects = list(model.objects.filter(**{parent_field: parent_id}).order_by('order', 'pk'))
+            for index, obj in enumerate(objects, start=1):
+                obj.order = index
+            model.objects.bulk_update(objects, ['order'])
+
+
+class Migration(migrations.Migration):
+    # Avoids "pending trigger events" when the constraints are added right after the renumbering updates
+    atomic = False
+
+    dependencies = [
+        ('courses', '0007_textproblemlessonstep_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='baselessonstep',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['DEFERRED'], fields=('lesson', 'order'), name='unique_lesson_step_order'),
+        ),
+        migrations.AddConstraint(
+            model_name='lesson',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['DEFERRED'], fields=('chapter', 'order'), name='unique_lesson_order'),
+        ),
+    ]
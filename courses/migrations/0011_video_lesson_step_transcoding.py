@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-19 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videolessonstep',
+            name='duration',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='videolessonstep',
+            name='hls_manifest',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='videolessonstep',
+            name='poster',
+            field=models.ImageField(blank=True, null=True, upload_to='courses/videos/posters/'),
+        ),
+        migrations.AddField(
+            model_name='videolessonstep',
+            name='transcoding_source',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='videolessonstep',
+            name='transcoding_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=20, null=True),
+        ),
+    ]
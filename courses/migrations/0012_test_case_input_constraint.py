@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-19 18:59
+
+from django.db import migrations, models
+import django.db.models.constraints
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_video_lesson_step_transcoding'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='codechallengetestcase',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='codechallengetestcase',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['DEFERRED'], fields=('code_challenge_step', 'input'), name='unique_test_case_input'),
+        ),
+    ]
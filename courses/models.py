@@ -7,6 +7,21 @@ from learning.models import CourseEnrollment
 from users.models import User
 
 
+def apply_order(objects):
+    """
+    Number the given objects 1..n in the given order and write the changed `order` values
+    in a single bulk UPDATE. Returns the objects whose order changed.
+    """
+    changed = []
+    for index, obj in enumerate(objects, start=1):
+        if obj.order != index:
+            obj.order = index
+            changed.append(obj)
+    if changed:
+        type(changed[0]).objects.bulk_update(changed, ['order'])
+    return changed
+
+
 class Course(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True, unique=True, editable=False)
     instructor = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -34,6 +49,7 @@ class Course(models.Model):
         MinValueValidator(0)
     ])
     image = models.ImageField(null=True, blank=True, upload_to='courses/images/', default='courses/images/default.jpg')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # see courses.image_variants
     tags = models.ManyToManyField('Tag', blank=True)
     active = models.BooleanField(default=False, null=False, blank=False)
     enrolled_learners = models.ManyToManyField(User, through=CourseEnrollment, related_name='courses_enrolled')
@@ -113,15 +129,16 @@ class Lesson(models.Model):
 
     class Meta:
         ordering = ['order']
+        constraints = [
+            # Deferred, so a reorder can move rows through temporary duplicates inside its transaction
+            models.UniqueConstraint(fields=['chapter', 'order'], name='unique_lesson_order',
+                                    deferrable=models.Deferrable.DEFERRED),
+        ]
 
     def recalculate_order_values(self, chapter=None):
         if chapter is None:
             chapter = self.chapter
-        remaining_lessons = chapter.lesson_set.all().order_by('order')
-        for index, lesson in enumerate(remaining_lessons, start=1):
-            if lesson.order != index:
-                lesson.order = index
-                lesson.save()
+        apply_order(chapter.lesson_set.all().order_by('order'))
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
@@ -138,6 +155,10 @@ class BaseLessonStep(models.Model):
 
     class Meta:
         ordering = ['order']
+        constraints = [
+            models.UniqueConstraint(fields=['lesson', 'order'], name='unique_lesson_step_order',
+                                    deferrable=models.Deferrable.DEFERRED),
+        ]
 
     def save(self, *args, **kwargs):
         if (hasattr(self, 'text_step') + hasattr(self, 'quiz_step')
@@ -147,11 +168,7 @@ class BaseLessonStep(models.Model):
         super().save(*args, **kwargs)
 
     def recalculate_order_values(self):
-        remaining_steps = self.lesson.baselessonstep_set.all()
-        for index, step in enumerate(remaining_steps, start=1):
-            if index != step.order:
-                step.order = index
-                step.save()
+        apply_order(self.lesson.baselessonstep_set.all())
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
@@ -189,6 +206,19 @@ class VideoLessonStep(models.Model):
         FileExtensionValidator(allowed_extensions=['MOV', 'avi', 'mp4', 'webm', 'mkv'])
     ], upload_to='courses/videos/')  # change to False for production, add upload_to=...
 
+    # HLS renditions of the video file, see courses.video_transcoding
+    class TranscodingStatus(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
+    transcoding_status = models.CharField(max_length=20, null=True, blank=True, choices=TranscodingStatus.choices)
+    transcoding_source = models.CharField(max_length=255, blank=True, default='')  # video file being transcoded
+    hls_manifest = models.CharField(max_length=255, null=True, blank=True)
+    poster = models.ImageField(null=True, blank=True, upload_to='courses/videos/posters/')
+    duration = models.DurationField(null=True, blank=True)
+
 
 class CodeChallengeLessonStep(models.Model):
     base_step = models.OneToOneField(BaseLessonStep, on_delete=models.CASCADE, primary_key=True,
@@ -220,7 +250,11 @@ class CodeChallengeTestCase(models.Model):
 
     class Meta:
         ordering = ['id']
-        unique_together = ['code_challenge_step', 'input']
+        constraints = [
+            # Deferred, so a lesson save can move the inputs between test cases, see courses.lesson_steps_sync
+            models.UniqueConstraint(fields=['code_challenge_step', 'input'], name='unique_test_case_input',
+                                    deferrable=models.Deferrable.DEFERRED),
+        ]
 
 
 class SortingProblemLessonStep(models.Model):
@@ -257,3 +291,33 @@ class TextProblemLessonStep(models.Model):
 
     def __str__(self):
         return self.title
+
+
+class DirectUpload(models.Model):
+    """
+    A file sent by the client straight to the media bucket, see courses.direct_uploads.
+    """
+    class Target(models.TextChoices):
+        VIDEO_STEP = 'video_step', 'Video lesson step'
+        COURSE_IMAGE = 'course_image', 'Course image'
+        USER_PICTURE = 'user_picture', 'User picture'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        COMPLETED = 'completed', 'Completed'
+        ABORTED = 'aborted', 'Aborted'
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    target = models.CharField(max_length=20, choices=Target.choices)
+    object_id = models.CharField(max_length=36)
+    key = models.CharField(max_length=500)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    multipart_upload_id = models.CharField(max_length=1024, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.target} {self.object_id}: {self.key} ({self.status})'
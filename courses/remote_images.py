@@ -0,0 +1,140 @@
+"""
+Ingestion of images given by URL.
+
+ImageOrUrlField only validates the URL, the image is downloaded afterwards by the ingest_remote_image task,
+which streams it to a temporary file with size, time and content type limits before saving it to the storage.
+"""
+import os
+import tempfile
+import time
+from urllib.parse import urlparse
+
+import requests
+from django.core.cache import cache
+from django.core.files import File
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+MB = 1024 * 1024
+MAX_SIZE = 10 * MB
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+DOWNLOAD_TIMEOUT = 30  # for the whole download, a slow server can stay under the read timeout for every chunk
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1 * MB
+
+CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+PENDING_TIMEOUT = 60 * 60
+
+
+class RemoteImageError(Exception):
+    pass
+
+
+class RemoteImage:
+    """
+    Validated image URL, saved to the field by the ingest_remote_image task once the object is saved.
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def __eq__(self, other):
+        return isinstance(other, RemoteImage) and other.url == self.url
+
+    def __repr__(self):
+        return f'RemoteImage({self.url!r})'
+
+
+def get_pending_image_key(obj, field_name):
+    return f'remote_image_{obj._meta.label_lower}_{obj.pk}_{field_name}'
+
+
+def set_pending_image(obj, field_name, url):
+    # Only the last requested URL is ingested when the image is changed again before the task runs
+    cache.set(get_pending_image_key(obj, field_name), url, PENDING_TIMEOUT)
+
+
+def cancel_pending_image(obj, field_name):
+    """
+    Drop the image requested by URL which is not downloaded yet, when another image is saved to the field.
+    """
+    pending_key = get_pending_image_key(obj, field_name)
+    if cache.get(pending_key) is not None:
+        # Not deleted, the queued task would then download it
+        cache.set(pending_key, '', PENDING_TIMEOUT)
+
+
+def get_filename(url, content_type):
+    name, extension = os.path.splitext(os.path.basename(urlparse(url).path))
+    return get_valid_filename(f'{name or "image"}.{extension.lstrip(".") or CONTENT_TYPES[content_type]}')
+
+
+def download_image(url):
+    """
+    Stream the image to a temporary file.
+
+    :return: (file, filename), the file must be closed by the caller
+    """
+    deadline = time.monotonic() + DOWNLOAD_TIMEOUT
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        with requests.get(url, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+            if response.status_code != 200:
+                raise RemoteImageError(f'Unable to fetch image from URL, status {response.status_code}')
+
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type not in CONTENT_TYPES:
+                raise RemoteImageError(f'Unsupported image content type: {content_type or "none"}')
+            try:
+                content_length = int(response.headers.get('Content-Length') or 0)
+            except ValueError:
+                # Unknown, the size is checked while streaming
+                content_length = 0
+            if content_length > MAX_SIZE:
+                raise RemoteImageError('The image is too big')
+
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_SIZE:
+                    raise RemoteImageError('The image is too big')
+                if time.monotonic() > deadline:
+                    raise RemoteImageError('The image download took too long')
+                file.write(chunk)
+
+        file.seek(0)
+        try:
+            Image.open(file).verify()
+        except Exception:
+            raise RemoteImageError('The file is not a valid image')
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+
+    return file, get_filename(url, content_type)
+
+
+def ingest_remote_image(obj, field_name, url):
+    """
+    Download the image and save it to the image field of the object.
+
+    :return: False when another image was requested for the field in the meantime
+    """
+    pending_key = get_pending_image_key(obj, field_name)
+    if cache.get(pending_key) not in (None, url):
+        return False
+
+    file, filename = download_image(url)
+    with file:
+        getattr(obj, field_name).save(filename, File(file), save=False)
+    obj.save(update_fields=[field_name])
+    cache.delete(pending_key)
+    return True
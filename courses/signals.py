@@ -1,7 +1,14 @@
-from django.db.models.signals import post_delete
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver, Signal
 
-from courses.models import TextLessonStep, QuizLessonStep, VideoLessonStep
+from courses.image_variants import IMAGE_FIELDS, needs_variants
+from courses.models import Course, TextLessonStep, QuizLessonStep, VideoLessonStep
+from courses.tasks import generate_image_variants, transcode_video, delete_video_renditions
+from users.models import User
+
+# Sent after the steps of a lesson were saved with bulk operations, which don't send the model signals
+lesson_steps_changed = Signal()
 
 
 @receiver(post_delete, sender=TextLessonStep)
@@ -17,3 +24,58 @@ def delete_text_step_base(sender, instance, **kwargs):
 @receiver(post_delete, sender=VideoLessonStep)
 def delete_text_step_base(sender, instance, **kwargs):
     instance.base_step.delete()
+    schedule_renditions_deletion(instance.hls_manifest, instance.poster.name)
+
+
+def schedule_renditions_deletion(hls_manifest, poster):
+    if hls_manifest or poster:
+        transaction.on_commit(lambda: delete_video_renditions.delay(hls_manifest, poster))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=User)
+def handle_image_change(sender, instance, **kwargs):
+    field_name, _ = IMAGE_FIELDS[sender]
+    if needs_variants(instance, field_name):
+        transaction.on_commit(lambda: generate_image_variants.delay(instance._meta.label_lower, str(instance.pk),
+                                                                    field_name))
+
+
+def get_transcoding_source(step):
+    return step.video_file.name if step.video_file else ''
+
+
+@receiver(pre_save, sender=VideoLessonStep)
+def delete_replaced_renditions(sender, instance, **kwargs):
+    """
+    The stored names are read before the save, the instance may have been loaded before the previous transcoding
+    finished and would overwrite them.
+    """
+    if instance._state.adding or get_transcoding_source(instance) == instance.transcoding_source:
+        return
+
+    stored = VideoLessonStep.objects.filter(pk=instance.pk).values('hls_manifest', 'poster').first()
+    if stored:
+        schedule_renditions_deletion(stored['hls_manifest'], stored['poster'])
+
+
+@receiver(post_save, sender=VideoLessonStep)
+def handle_video_change(sender, instance, **kwargs):
+    source = get_transcoding_source(instance)
+    if source == instance.transcoding_source:
+        return
+
+    # The renditions of the previous file are dropped right away, the raw file is served until the new ones are ready
+    values = {
+        'transcoding_source': source,
+        'transcoding_status': VideoLessonStep.TranscodingStatus.PENDING if source else None,
+        'hls_manifest': None,
+        'poster': None,
+        'duration': None,
+    }
+    VideoLessonStep.objects.filter(pk=instance.pk).update(**values)
+    for field_name, value in values.items():
+        setattr(instance, field_name, value)
+
+    if source:
+        transaction.on_commit(lambda: transcode_video.delay(str(instance.pk), source))
@@ -0,0 +1,282 @@
+"""
+Synthetic data at production scale, for the benchmarks (see courses.benchmarks) and for reproducing performance issues.
+
+Generates instructors with courses of chapters, lessons and steps of every type (with their quiz choices, sorting
+options and code challenge test cases), learners enrolled in some of the courses, their progress arrays, assessment
+performances, code challenge submissions, engagement rows and reviews. Everything is inserted with bulk_create, so
+the signals refreshing the caches and the similar courses are not sent: run the nightly jobs afterwards.
+
+The same seed generates the same data, the generated users are named after it so several runs don't conflict.
+"""
+import datetime
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from courses.models import Course, Category, Tag, Chapter, Lesson, BaseLessonStep, TextLessonStep, QuizLessonStep, \
+    QuizChoice, VideoLessonStep, CodeChallengeLessonStep, CodeChallengeTestCase, SortingProblemLessonStep, \
+    SortingProblemOption, TextProblemLessonStep, ProgrammingLanguage, Review
+from learning.models import CourseEnrollment, LearnerProgress, LearnerAssessmentStepPerformance, \
+    CodeChallengeSubmission
+from teaching.models import EngagementAnalytics
+from users.models import User
+
+PASSWORD = 'password'
+HISTORY_DAYS = 180
+
+# Relative frequency of the step types
+STEP_TYPES = {
+    'text': 40,
+    'quiz': 20,
+    'video': 10,
+    'code_challenge': 15,
+    'sorting_problem': 5,
+    'text_problem': 10,
+}
+ASSESSMENT_STEP_TYPES = {'quiz', 'code_challenge', 'sorting_problem', 'text_problem'}
+
+WORDS = ('python', 'django', 'data', 'web', 'design', 'machine', 'learning', 'systems', 'cloud', 'security',
+         'algorithms', 'testing', 'databases', 'networks', 'mobile', 'games', 'graphics', 'finance', 'music', 'writing')
+FIRST_NAMES = ('Alex', 'Sam', 'Charlie', 'Jamie', 'Robin', 'Taylor', 'Morgan', 'Casey', 'Jordan', 'Avery')
+LAST_NAMES = ('Smith', 'Garcia', 'Martin', 'Nguyen', 'Kowalski', 'Rossi', 'Müller', 'Silva', 'Dubois', 'Tanaka')
+
+
+class SyntheticDataGenerator:
+
+    def __init__(self, seed=0, batch_size=1000):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.counts = {}
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def sentence(self, count):
+        return self.words(count).capitalize() + '.'
+
+    def uuid(self):
+        # From the seeded generator, so the same seed generates the same ids
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def past(self, days=HISTORY_DAYS, after=None):
+        start = after or self.now - datetime.timedelta(days=days)
+        return start + (self.now - start) * self.rng.random()
+
+    def create(self, model, objects):
+        objects = model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + len(objects)
+        return objects
+
+    def email_prefix(self):
+        return f'synthetic-{self.seed}-'
+
+    def exists(self):
+        return User.objects.filter(email__startswith=self.email_prefix()).exists()
+
+    @transaction.atomic
+    def generate(self, instructors=20, learners=1000, courses=50, chapters=5, lessons=5, steps=5,
+                 enrollments=5, test_cases=3):
+        """
+        :param courses: number of courses, every course has `chapters` chapters of `lessons` lessons of `steps` steps
+        :param enrollments: number of courses every learner is enrolled in, at most
+        :return: the number of generated objects by model
+        """
+        instructor_users = self.generate_users(instructors, 'instructor')
+        learner_users = self.generate_users(learners, 'learner')
+        categories, tags = self.generate_categories_and_tags()
+        course_objects = self.generate_courses(courses, instructor_users, categories, tags)
+        course_steps = self.generate_structures(course_objects, chapters, lessons, steps, test_cases)
+        self.generate_learning(learner_users, course_objects, course_steps, enrollments)
+        return self.counts
+
+    def generate_users(self, count, role):
+        password = make_password(PASSWORD)  # Hashed once, it's slow on purpose
+        users = [User(
+            id=self.uuid(),
+            email=f'{self.email_prefix()}{role}-{i}@example.com',
+            password=password,
+            email_confirmed=True,
+            first_name=self.rng.choice(FIRST_NAMES),
+            last_name=self.rng.choice(LAST_NAMES),
+            short_bio=self.sentence(6),
+        ) for i in range(count)]
+        return self.create(User, users)
+
+    def generate_categories_and_tags(self):
+        supercategories = self.create(Category, [
+            Category(name=f'{word.capitalize()} {self.seed}', top=True) for word in WORDS[:5]])
+        subcategories = self.create(Category, [
+            Category(name=f'{supercategory.name} {word}', supercategory=supercategory)
+            for supercategory in supercategories for word in self.rng.sample(WORDS, 3)])
+        tags = self.create(Tag, [Tag(id=self.uuid(), name=f'{word}-{self.seed}') for word in WORDS])
+        return supercategories + subcategories, tags
+
+    def generate_courses(self, count, instructors, categories, tags):
+        courses = self.create(Course, [Course(
+            id=self.uuid(),
+            instructor=self.rng.choice(instructors),
+            title=self.words(3).title()[:100],
+            category=self.rng.choice(categories),
+            intro=self.sentence(12),
+            description=' '.join(self.sentence(12) for _ in range(3)),
+            level=self.rng.choice(Course.DifficultyLevel.values),
+            requirements=self.sentence(8),
+            total_hours=self.rng.randint(1, 60),
+            release_date=self.past().date(),
+            price=self.rng.choice((0, 0, 10, 20, 50, 90, 150)),
+            # Most courses are published
+            active=self.rng.random() < 0.9,
+        ) for _ in range(count)])
+        self.create(Course.tags.through, [
+            Course.tags.through(course=course, tag=tag)
+            for course in courses for tag in self.rng.sample(tags, self.rng.randint(1, 4))])
+        return courses
+
+    def generate_structures(self, courses, chapters_count, lessons_count, steps_count, test_cases_count):
+        """
+        :return: the (base step, step type) of every course, in the order of the course
+        """
+        chapters = self.create(Chapter, [
+            Chapter(id=self.uuid(), course=course, title=self.words(3).title()[:100])
+            for course in courses for _ in range(chapters_count)])
+        lessons = self.create(Lesson, [
+            Lesson(id=self.uuid(), chapter=chapter, title=self.words(2).title()[:50], order=order)
+            for chapter in chapters for order in range(1, lessons_count + 1)])
+        step_types = self.rng.choices(list(STEP_TYPES), weights=list(STEP_TYPES.values()),
+                                      k=len(lessons) * steps_count)
+        base_steps = self.create(BaseLessonStep, [
+            BaseLessonStep(id=self.uuid(), lesson=lesson, order=order)
+            for lesson in lessons for order in range(1, steps_count + 1)])
+
+        steps_by_type = {step_type: [] for step_type in STEP_TYPES}
+        course_steps = {course.id: [] for course in courses}
+        for base_step, step_type in zip(base_steps, step_types):
+            steps_by_type[step_type].append(base_step)
+            course_steps[base_step.lesson.chapter.course_id].append((base_step, step_type))
+
+        self.generate_steps(steps_by_type, test_cases_count)
+        return course_steps
+
+    def generate_steps(self, steps_by_type, test_cases_count):
+        language = ProgrammingLanguage.objects.order_by('id').first()
+        if language is None:
+            # Python, as numbered by Judge0
+            language = self.create(ProgrammingLanguage, [ProgrammingLanguage(id=71, name='Python (3.8.1)')])[0]
+
+        self.create(TextLessonStep, [TextLessonStep(base_step=base_step, text=self.sentence(60))
+                                     for base_step in steps_by_type['text']])
+        self.create(VideoLessonStep, [VideoLessonStep(base_step=base_step, title=self.words(3).title())
+                                      for base_step in steps_by_type['video']])
+
+        quizzes = self.create(QuizLessonStep, [
+            QuizLessonStep(base_step=base_step, question=self.sentence(10)[:500], explanation=self.sentence(15))
+            for base_step in steps_by_type['quiz']])
+        self.create(QuizChoice, [
+            QuizChoice(id=self.uuid(), quiz=quiz, text=self.words(3), correct=i == 0)
+            for quiz in quizzes for i in range(4)])
+
+        code_challenges = self.create(CodeChallengeLessonStep, [CodeChallengeLessonStep(
+            base_step=base_step,
+            title=self.words(3).title(),
+            description=self.sentence(30),
+            initial_code='print(input())',
+            language=language,
+            proposed_solution='print(input())',
+        ) for base_step in steps_by_type['code_challenge']])
+        self.create(CodeChallengeTestCase, [
+            CodeChallengeTestCase(code_challenge_step=code_challenge, input=str(i), expected_output=str(i))
+            for code_challenge in code_challenges for i in range(test_cases_count)])
+
+        sorting_problems = self.create(SortingProblemLessonStep, [
+            SortingProblemLessonStep(base_step=base_step, title=self.words(3).title(), statement=self.sentence(15))
+            for base_step in steps_by_type['sorting_problem']])
+        self.create(SortingProblemOption, [
+            SortingProblemOption(sorting_problem=sorting_problem, text=self.words(2), correct_order=order)
+            for sorting_problem in sorting_problems for order in range(1, 5)])
+
+        self.create(TextProblemLessonStep, [TextProblemLessonStep(
+            base_step=base_step, title=self.words(3).title(), statement=self.sentence(15), correct_answer='42')
+            for base_step in steps_by_type['text_problem']])
+
+    def generate_learning(self, learners, courses, course_steps, enrollments_count):
+        active_courses = [course for course in courses if course.active] or courses
+        enrollments, progresses, performances, submissions, engagements, reviews = [], [], [], [], [], []
+
+        for learner in learners:
+            # The popular courses get more learners, as in production
+            enrolled_courses = {course.id: course for course in self.rng.choices(
+                active_courses, weights=range(len(active_courses), 0, -1), k=enrollments_count)}
+            for course in enrolled_courses.values():
+                enrolled_at = self.past()
+                steps = course_steps[course.id]
+                completed_count = int(len(steps) * self.rng.choice((0, 0.1, 0.3, 0.5, 0.8, 1, 1)))
+                completed_steps = steps[:completed_count]
+
+                enrollments.append(CourseEnrollment(course=course, learner=learner, enrolled_at=enrolled_at,
+                                                    completed=bool(steps) and completed_count == len(steps),
+                                                    favourite=self.rng.random() < 0.1))
+                progresses.append(self.build_progress(learner, course, steps, completed_count))
+
+                for base_step, step_type in completed_steps:
+                    engagements.append(EngagementAnalytics(
+                        learner=learner, course=course, lesson_step=base_step,
+                        time_spent=datetime.timedelta(seconds=self.rng.randint(10, 1800)),
+                        last_accessed=self.past(after=enrolled_at)))
+                    if step_type in ASSESSMENT_STEP_TYPES:
+                        performances.append(LearnerAssessmentStepPerformance(
+                            learner=learner, base_step=base_step, attempts=self.rng.randint(1, 4), passed=True))
+                    if step_type == 'code_challenge':
+                        submissions.append(CodeChallengeSubmission(
+                            id=self.uuid(), learner=learner, code_challenge_step_id=base_step.id,
+                            submitted_code='print(input())', passed=True))
+
+                if completed_count and self.rng.random() < 0.3:
+                    reviews.append(Review(id=self.uuid(), course=course, learner=learner,
+                                          rating=self.rng.choices(range(1, 6), weights=(1, 1, 3, 6, 9))[0],
+                                          comment=self.sentence(20)[:500]))
+
+        # The auto_now dates are set by bulk_create, then replaced by the generated ones
+        self.create_with_dates(CourseEnrollment, enrollments, 'enrolled_at')
+        self.create(LearnerProgress, progresses)
+        self.create(LearnerAssessmentStepPerformance, performances)
+        self.create(CodeChallengeSubmission, submissions)
+        self.create_with_dates(EngagementAnalytics, engagements, 'last_accessed')
+        self.create(Review, reviews)
+
+    def create_with_dates(self, model, objects, date_field):
+        dates = [getattr(obj, date_field) for obj in objects]
+        objects = self.create(model, objects)
+        for obj, date in zip(objects, dates):
+            setattr(obj, date_field, date)
+        model.objects.bulk_update(objects, [date_field], batch_size=self.batch_size)
+
+    def build_progress(self, learner, course, steps, completed_count):
+        completed_steps = [base_step for base_step, _ in steps[:completed_count]]
+        completed_step_ids = {base_step.id for base_step in completed_steps}
+
+        # Every step of a completed lesson is completed, and every lesson of a completed chapter
+        lesson_steps, chapter_lessons = {}, {}
+        for base_step, _ in steps:
+            lesson_steps.setdefault(base_step.lesson, []).append(base_step.id)
+            chapter_lessons.setdefault(base_step.lesson.chapter, []).append(base_step.lesson.id)
+        completed_lessons = [lesson.id for lesson, step_ids in lesson_steps.items()
+                             if completed_step_ids.issuperset(step_ids)]
+        completed_chapters = [chapter.id for chapter, lesson_ids in chapter_lessons.items()
+                              if set(completed_lessons).issuperset(lesson_ids)]
+
+        last_step = steps[completed_count][0] if completed_count < len(steps) else None
+        return LearnerProgress(
+            learner=learner,
+            course=course,
+            last_stopped_step=last_step,
+            last_stopped_lesson=last_step.lesson if last_step else None,
+            last_stopped_chapter=last_step.lesson.chapter if last_step else None,
+            completed_chapters=completed_chapters,
+            completed_lessons=completed_lessons,
+            completed_steps=[base_step.id for base_step in completed_steps],
+        )
@@ -0,0 +1,96 @@
+import requests
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from django.apps import apps
+
+from courses import remote_images, image_variants, video_transcoding
+from courses.models import VideoLessonStep
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, autoretry_for=(requests.ConnectionError, requests.Timeout), retry_backoff=True)
+def ingest_remote_image(self, model_label, pk, field_name, url):
+    """
+    Download an image given by URL and save it to the image field of the object.
+
+    :param model_label: model of the object, e.g. 'courses.course'
+    """
+    obj = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if obj is None:
+        return 'Deleted'
+
+    try:
+        ingested = remote_images.ingest_remote_image(obj, field_name, url)
+    except remote_images.RemoteImageError as e:
+        logger.warning(f'Image {url} of {model_label} {pk} was not ingested: {e}')
+        return 'Failed'
+
+    return 'Done' if ingested else 'Superseded'
+
+
+@shared_task
+def generate_image_variants(model_label, pk, field_name):
+    """
+    Build the resized WebP and JPEG variants of an image field, see courses.image_variants.
+    """
+    obj = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if obj is None:
+        return 'Deleted'
+
+    return 'Done' if image_variants.update_image_variants(obj, field_name) else 'Skipped'
+
+
+@shared_task(soft_time_limit=video_transcoding.TRANSCODE_TIMEOUT + 10 * 60,
+             time_limit=video_transcoding.TRANSCODE_TIMEOUT + 15 * 60)
+def transcode_video(step_id, source):
+    """
+    Transcode the video file of a VideoLessonStep to HLS, see courses.video_transcoding.
+
+    :param source: name of the video file to transcode, the job is dropped if the step got another file since
+    """
+    steps = VideoLessonStep.objects.filter(pk=step_id, transcoding_source=source)
+    step = steps.first()
+    if step is None:
+        return 'Superseded'
+
+    steps.update(transcoding_status=VideoLessonStep.TranscodingStatus.PROCESSING)
+    try:
+        video_transcoding.transcode_video(step)
+    except SoftTimeLimitExceeded:
+        logger.warning(f'Video {source} of step {step_id} was not transcoded in time')
+        steps.update(transcoding_status=VideoLessonStep.TranscodingStatus.FAILED)
+        raise
+    except video_transcoding.TranscodingError as e:
+        logger.warning(f'Video {source} of step {step_id} was not transcoded: {e}')
+        steps.update(transcoding_status=VideoLessonStep.TranscodingStatus.FAILED)
+        return 'Failed'
+    except Exception:
+        # e.g. the storage is not reachable, the step must not be left processing forever
+        logger.exception(f'Video {source} of step {step_id} was not transcoded')
+        steps.update(transcoding_status=VideoLessonStep.TranscodingStatus.FAILED)
+        return 'Failed'
+
+    if not steps.exists():
+        video_transcoding.delete_renditions(step.video_file.storage, step.hls_manifest, step.poster.name)
+        return 'Superseded'
+    # Saved normally, so the course caches are refreshed with the manifest
+    step.save(update_fields=['hls_manifest', 'poster', 'duration', 'transcoding_status'])
+    return 'Done'
+
+
+@shared_task
+def delete_video_renditions(hls_manifest, poster):
+    """
+    Delete the HLS renditions and the poster of a replaced or deleted video file from the storage.
+    """
+    # Cloned and imported courses share the files of their source steps, which keep them
+    if hls_manifest and VideoLessonStep.objects.filter(hls_manifest=hls_manifest).exists():
+        hls_manifest = None
+    if poster and VideoLessonStep.objects.filter(poster=poster).exists():
+        poster = None
+
+    storage = VideoLessonStep._meta.get_field('poster').storage
+    video_transcoding.delete_renditions(storage, hls_manifest, poster)
+    return 'Done'
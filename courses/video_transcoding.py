@@ -0,0 +1,185 @@
+"""
+Transcoding of the video lesson steps to HLS.
+
+The uploaded file is copied from the storage to a temporary directory, probed with ffprobe for its duration and size,
+and transcoded by a single ffmpeg run into H.264/AAC renditions of a few heights with aligned keyframes, described by
+a master playlist. A poster frame is extracted as well, then every output file is saved to the storage under
+courses/videos/hls/<step id>/<job id>/, so the relative paths of the playlists keep working with any storage backend.
+"""
+import datetime
+import json
+import os
+import posixpath
+import subprocess
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+
+from courses.models import VideoLessonStep
+
+# (height, video bitrate, audio bitrate), renditions higher than the source are skipped
+RENDITIONS = [
+    (360, '800k', '96k'),
+    (720, '2800k', '128k'),
+    (1080, '5000k', '192k'),
+]
+SEGMENT_DURATION = 6
+POSTER_HEIGHT = 720
+PROBE_TIMEOUT = 60
+TRANSCODE_TIMEOUT = 60 * 60
+CHUNK_SIZE = 1024 * 1024
+
+MASTER_PLAYLIST_NAME = 'master.m3u8'
+POSTER_NAME = 'poster.jpg'
+
+
+class TranscodingError(Exception):
+    pass
+
+
+def run(command, timeout):
+    try:
+        return subprocess.run(command, capture_output=True, check=True, timeout=timeout)
+    except FileNotFoundError:
+        raise TranscodingError(f'{command[0]} is not installed')
+    except subprocess.TimeoutExpired:
+        raise TranscodingError(f'{command[0]} did not finish in {timeout} seconds')
+    except subprocess.CalledProcessError as e:
+        raise TranscodingError(f'{command[0]} failed: {e.stderr.decode(errors="replace")[-1000:]}')
+
+
+def probe(path):
+    """
+    :return: (duration in seconds, width, height, has audio)
+    """
+    output = run([settings.FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+                  path], PROBE_TIMEOUT).stdout
+    try:
+        metadata = json.loads(output)
+        video_streams = [stream for stream in metadata.get('streams', []) if stream.get('codec_type') == 'video']
+        if not video_streams:
+            raise TranscodingError('The file has no video stream')
+
+        has_audio = any(stream.get('codec_type') == 'audio' for stream in metadata['streams'])
+        duration = float(metadata.get('format', {}).get('duration') or video_streams[0].get('duration') or 0)
+        return duration, int(video_streams[0]['width']), int(video_streams[0]['height']), has_audio
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise TranscodingError(f'Unexpected output of {settings.FFPROBE_BINARY}: {e!r}')
+
+
+def get_renditions(source_height):
+    return [rendition for rendition in RENDITIONS if rendition[0] <= source_height] or RENDITIONS[:1]
+
+
+def build_hls_command(input_path, output_dir, renditions, has_audio):
+    count = len(renditions)
+    split = ''.join(f'[v{index}]' for index in range(count))
+    filters = [f'[0:v]split={count}{split}'] + [
+        f'[v{index}]scale=-2:{height}[v{index}out]' for index, (height, _, _) in enumerate(renditions)]
+
+    command = [settings.FFMPEG_BINARY, '-y', '-i', input_path, '-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for index, (_, video_bitrate, audio_bitrate) in enumerate(renditions):
+        command += ['-map', f'[v{index}out]', f'-c:v:{index}', 'libx264', f'-b:v:{index}', video_bitrate,
+                    f'-maxrate:v:{index}', video_bitrate, f'-bufsize:v:{index}', video_bitrate]
+        if has_audio:
+            command += ['-map', 'a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', audio_bitrate, '-ac', '2']
+        stream_map.append(f'v:{index},a:{index}' if has_audio else f'v:{index}')
+
+    command += [
+        '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-sc_threshold', '0',
+        # Keyframes on the segment boundaries of every rendition, so players can switch between them
+        '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_DURATION})',
+        '-f', 'hls', '-hls_time', str(SEGMENT_DURATION), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%03d.ts'),
+        '-master_pl_name', MASTER_PLAYLIST_NAME, '-var_stream_map', ' '.join(stream_map),
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return command
+
+
+def build_poster_command(input_path, output_path, duration):
+    return [settings.FFMPEG_BINARY, '-y', '-ss', str(min(1.0, duration / 2)), '-i', input_path,
+            '-frames:v', '1', '-vf', f'scale=-2:min(ih\\,{POSTER_HEIGHT})', output_path]
+
+
+def copy_to_local(field_file, path):
+    with field_file.open('rb'), open(path, 'wb') as local_file:
+        for chunk in field_file.chunks(CHUNK_SIZE):
+            local_file.write(chunk)
+
+
+def save_directory(storage, local_dir, prefix):
+    """
+    Save every file of the directory to the storage, keeping their relative paths.
+    """
+    for root, _, filenames in os.walk(local_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            name = f'{prefix}/{os.path.relpath(path, local_dir).replace(os.sep, "/")}'
+            with open(path, 'rb') as file:
+                saved_name = storage.save(name, File(file))
+            if saved_name != name:
+                storage.delete(saved_name)
+                raise TranscodingError(f'{name} already exists in the storage')
+
+
+def delete_directory(storage, prefix):
+    """
+    Delete every file saved under the prefix by save_directory.
+    """
+    try:
+        directories, filenames = storage.listdir(prefix)
+    except FileNotFoundError:
+        return
+
+    for directory in directories:
+        delete_directory(storage, f'{prefix}/{directory}')
+    for filename in filenames:
+        storage.delete(f'{prefix}/{filename}')
+
+
+def delete_renditions(storage, hls_manifest, poster):
+    """
+    Delete the files of a transcoding job, given the names saved to the step.
+    """
+    if hls_manifest:
+        delete_directory(storage, posixpath.dirname(hls_manifest))
+    if poster:
+        storage.delete(poster)
+
+
+def transcode_video(step):
+    """
+    Transcode the video file of the step and save the HLS renditions, the poster and the duration to it.
+    """
+    video_file = step.video_file
+    storage = video_file.storage
+    prefix = f'courses/videos/hls/{step.pk}/{uuid.uuid4().hex}'
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = os.path.join(work_dir, 'source' + os.path.splitext(video_file.name)[1].lower())
+        copy_to_local(video_file, input_path)
+        duration, _, height, has_audio = probe(input_path)
+
+        output_dir = os.path.join(work_dir, 'hls')
+        os.makedirs(output_dir)
+        run(build_hls_command(input_path, output_dir, get_renditions(height), has_audio), TRANSCODE_TIMEOUT)
+        poster_path = os.path.join(work_dir, POSTER_NAME)
+        run(build_poster_command(input_path, poster_path, duration), PROBE_TIMEOUT)
+
+        try:
+            save_directory(storage, output_dir, prefix)
+            with open(poster_path, 'rb') as poster:
+                step.poster.save(f'{step.pk}.jpg', File(poster), save=False)
+        except BaseException:
+            # Also on the soft time limit of the task, the files saved so far are not referenced by the step
+            delete_renditions(storage, f'{prefix}/{MASTER_PLAYLIST_NAME}', step.poster.name)
+            raise
+
+    step.hls_manifest = f'{prefix}/{MASTER_PLAYLIST_NAME}'
+    step.duration = datetime.timedelta(seconds=round(duration, 3))
+    step.transcoding_status = VideoLessonStep.TranscodingStatus.READY
+    return step
@@ -1,7 +1,20 @@
 import os
 from celery import Celery
+from celery.signals import task_prerun, task_postrun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "courses_project.settings")
 app = Celery("courses_project")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@task_prerun.connect
+def start_task_instrumentation(**kwargs):
+    from courses_project import instrumentation
+    instrumentation.task_started(**kwargs)
+
+
+@task_postrun.connect
+def finish_task_instrumentation(**kwargs):
+    from courses_project import instrumentation
+    instrumentation.task_finished(**kwargs)
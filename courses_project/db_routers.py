@@ -0,0 +1,144 @@
+"""
+Routing of the read-only catalog and analytics queries to the read replicas of REPLICA_DATABASES.
+
+Everything runs on the primary ("default") database, except the reads of the views marked as replica-safe, with the
+replica_safe decorator or ReplicaSafeMixin, which go to one of the replicas picked for the request. The writes always
+go to the primary, and the reads following a write in the same request too, as well as all the reads of a user for
+REPLICA_PIN_SECONDS after a successful write request (see ReplicaPinningMiddleware), so the users read their writes
+despite the replication lag.
+
+The replica-safe views may do a few writes, but they must not read rows written by another request a moment before.
+The entries of the shared caches are filled from the primary (see reading_from_primary), else one request could keep
+serving the lagging data of a replica to everyone until they expire.
+"""
+import contextlib
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+
+class _ReplicaState:
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+
+
+_replica_state = contextvars.ContextVar('replica_state', default=None)
+
+
+def get_pin_key(user_id):
+    return f'replica_pin_{user_id}'
+
+
+def pin_to_primary(user_id):
+    """
+    Send the reads of the user to the primary for REPLICA_PIN_SECONDS, after a write.
+    """
+    cache.set(get_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return cache.get(get_pin_key(user_id)) is not None
+
+
+@contextlib.contextmanager
+def reading_from_replica(user=None):
+    """
+    Send the reads of the block to a replica, unless the user recently wrote.
+    """
+    if not settings.REPLICA_DATABASES or (user is not None and user.is_authenticated
+                                          and is_pinned_to_primary(user.pk)):
+        yield
+        return
+
+    token = _replica_state.set(_ReplicaState(random.choice(settings.REPLICA_DATABASES)))
+    try:
+        yield
+    finally:
+        _replica_state.reset(token)
+
+
+@contextlib.contextmanager
+def reading_from_primary():
+    """
+    Send the reads of the block to the primary, even in a replica-safe view.
+    """
+    token = _replica_state.set(None)
+    try:
+        yield
+    finally:
+        _replica_state.reset(token)
+
+
+def replica_safe(view):
+    """
+    Decorator of the function views reading from a replica. Goes below @api_view, to know the authenticated user.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading_from_replica(request.user):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaSafeMixin:
+    """
+    Mixin of the class-based API views reading from a replica.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Once the user is authenticated, until the response is finalized
+        self._replica_context = reading_from_replica(request.user)
+        self._replica_context.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_context = getattr(self, '_replica_context', None)
+        if replica_context is not None:
+            self._replica_context = None
+            replica_context.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        if state is None or state.wrote:
+            # Explicitly, else the objects read from a replica would read their relations from it
+            return DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _replica_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas have the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS and response.status_code < 400:
+            # Authenticated by the API view by now
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user.pk)
+        return response
@@ -0,0 +1,403 @@
+"""
+Query count, DB time, cache hits/misses and latency of every request and celery task.
+
+InstrumentationMiddleware and the task_prerun/task_postrun handlers count the queries run on every database
+connection (with connection.execute_wrapper) and the hits and misses of the Instrumented*Cache backends while a
+request or a task runs, which also record the keys read and written. The totals are:
+
+- added to the metrics of the view (its URL name) or the task, exposed in the Prometheus text format by the metrics
+  view. Every process sums them in memory and adds them every few seconds to a Redis hash shared by all the processes
+  (METRICS_REDIS_URL), or keeps them in memory when it isn't set.
+- logged as a structured record by the courses_project.instrumentation logger, at the WARNING level for the slow
+  requests and tasks or those running too many queries, DEBUG otherwise. Use JsonFormatter to log them as JSON.
+
+The database connections opened by every type of process are counted too, and the connections of the database
+servers are read at every scrape, to compare them with their max_connections.
+"""
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.db import connections, DatabaseError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+FLUSH_INTERVAL = 10  # seconds
+METRICS_KEY = 'metrics'
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by view, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Latency of the requests, by view.'),
+    'http_request_db_queries': ('histogram', 'Database queries per request, by view.'),
+    'http_request_db_duration_seconds_total': ('counter', 'Time spent in the database by the requests, by view.'),
+    'http_request_cache_hits_total': ('counter', 'Cache hits of the requests, by view.'),
+    'http_request_cache_misses_total': ('counter', 'Cache misses of the requests, by view.'),
+    'celery_tasks_total': ('counter', 'Tasks run, by task and state.'),
+    'celery_task_duration_seconds': ('histogram', 'Run time of the tasks, by task.'),
+    'celery_task_db_queries': ('histogram', 'Database queries per task run, by task.'),
+    'celery_task_db_duration_seconds_total': ('counter', 'Time spent in the database by the tasks, by task.'),
+    'celery_task_cache_hits_total': ('counter', 'Cache hits of the tasks, by task.'),
+    'celery_task_cache_misses_total': ('counter', 'Cache misses of the tasks, by task.'),
+    'db_connections_opened_total': ('counter', 'Database connections opened, by database and type of process.'),
+    'db_server_connections': ('gauge', 'Connections to the database server, by database and state.'),
+    'db_server_max_connections': ('gauge', 'Maximum number of connections of the database server, by database.'),
+}
+
+
+class Stats:
+    """
+    Counters of the request or task running in the current context.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_keys = set()
+        self.written_cache_keys = set()
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.start
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+_current_stats = contextvars.ContextVar('instrumentation_stats', default=None)
+
+
+def get_current_stats():
+    return _current_stats.get()
+
+
+@contextlib.contextmanager
+def collect_stats():
+    """
+    Count the queries and cache accesses of the block, in the yielded Stats.
+    """
+    stats = Stats()
+    token = _current_stats.set(stats)
+    try:
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def record_cache_access(hits, misses):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def record_cache_keys(keys, written=False):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.cache_keys.update(keys)
+        if written:
+            stats.written_cache_keys.update(keys)
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """
+    Counts the hits and misses of the cache reads, and records the keys read and written, in the stats of the current
+    request or task.
+    """
+
+    def get(self, key, default=None, version=None):
+        record_cache_keys([key])
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache_access(0, 1)
+            return default
+        record_cache_access(1, 0)
+        return value
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        record_cache_keys([key], written=True)
+        return super().add(key, value, timeout=timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        record_cache_keys([key], written=True)
+        return super().set(key, value, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        record_cache_keys(data, written=True)
+        return super().set_many(data, timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        record_cache_keys([key], written=True)
+        return super().incr(key, delta=delta, version=version)
+
+    def delete(self, key, version=None):
+        record_cache_keys([key], written=True)
+        return super().delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        record_cache_keys(keys, written=True)
+        return super().delete_many(keys, version=version)
+
+
+class InstrumentedPyMemcacheCache(InstrumentedCacheMixin, PyMemcacheCache):
+
+    def get_many(self, keys, version=None):
+        # A single request to memcached, unlike the default get_many calling get for every key
+        keys = list(keys)
+        record_cache_keys(keys)
+        values = super().get_many(keys, version=version)
+        record_cache_access(len(values), len(keys) - len(values))
+        return values
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{escape_label(value)}"' for name, value in labels)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """
+    Sums the metrics of the process, by series: the name of the metric followed by its labels, as rendered.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(float)
+        self.totals = defaultdict(float)
+        self.last_flush = time.monotonic()
+
+    def inc(self, name, labels, value=1.0):
+        series = f'{name}{{{format_labels(labels)}}}'
+        with self.lock:
+            self.pending[series] += value
+
+    def observe(self, name, labels, value, buckets):
+        # Cumulative buckets, as expected by Prometheus
+        for bound in buckets:
+            if value <= bound:
+                self.inc(f'{name}_bucket', (*labels, ('le', bound)))
+        self.inc(f'{name}_bucket', (*labels, ('le', '+Inf')))
+        self.inc(f'{name}_sum', labels, value)
+        self.inc(f'{name}_count', labels)
+
+    def flush(self, force=False):
+        """
+        Add the metrics summed since the last flush to the shared ones, at most every FLUSH_INTERVAL unless forced.
+        """
+        if not force and time.monotonic() - self.last_flush < FLUSH_INTERVAL:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        if not settings.METRICS_REDIS_URL:
+            with self.lock:
+                for series, value in pending.items():
+                    self.totals[series] += value
+            return
+
+        try:
+            pipeline = get_client().pipeline(transaction=False)
+            for series, value in pending.items():
+                pipeline.hincrbyfloat(METRICS_KEY, series, value)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f'Could not flush the metrics: {e}')
+
+    def get_totals(self):
+        self.flush(force=True)
+        if not settings.METRICS_REDIS_URL:
+            with self.lock:
+                return dict(self.totals)
+        return {series.decode(): float(value) for series, value in get_client().hgetall(METRICS_KEY).items()}
+
+
+registry = MetricsRegistry()
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.METRICS_REDIS_URL)
+    return _client
+
+
+def render_metrics(totals):
+    """
+    :return: the metrics in the Prometheus text exposition format
+    """
+    series_by_metric = defaultdict(list)
+    for series, value in totals.items():
+        name = series.split('{', 1)[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                name = name[:-len(suffix)]
+        series_by_metric[name].append((series, value))
+
+    lines = []
+    for name in sorted(series_by_metric):
+        metric_type, description = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for series, value in sorted(series_by_metric[name]):
+            lines.append(f'{series} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+@receiver(connection_created)
+def count_opened_connection(sender, connection, **kwargs):
+    # Rare with persistent connections (CONN_MAX_AGE), every request or task opens one without them
+    registry.inc('db_connections_opened_total', (('database', connection.alias), ('process', settings.PROCESS_TYPE)))
+
+
+def get_database_gauges():
+    """
+    :return: the connections of the database servers by state, and their maximum, as metric series
+    """
+    gauges = {}
+    for connection in connections.all():
+        labels = (('database', connection.alias),)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT coalesce(state, %s), count(*) FROM pg_stat_activity '
+                               'WHERE datname = current_database() GROUP BY 1', ['unknown'])
+                for state, count in cursor.fetchall():
+                    gauges[f'db_server_connections{{{format_labels((*labels, ("state", state)))}}}'] = count
+                cursor.execute('SHOW max_connections')
+                gauges[f'db_server_max_connections{{{format_labels(labels)}}}'] = int(cursor.fetchone()[0])
+        except DatabaseError as e:
+            logger.warning(f'Could not read the connections of the database {connection.alias}: {e}')
+    return gauges
+
+
+def record(prefix, labels, stats, duration):
+    registry.observe(f'{prefix}_duration_seconds', labels, duration, LATENCY_BUCKETS)
+    registry.observe(f'{prefix}_db_queries', labels, stats.queries, QUERY_COUNT_BUCKETS)
+    registry.inc(f'{prefix}_db_duration_seconds_total', labels, stats.db_time)
+    registry.inc(f'{prefix}_cache_hits_total', labels, stats.cache_hits)
+    registry.inc(f'{prefix}_cache_misses_total', labels, stats.cache_misses)
+
+
+def log_stats(message, stats, duration, **fields):
+    is_slow = duration >= settings.INSTRUMENTATION_SLOW_SECONDS
+    has_many_queries = stats.queries >= settings.INSTRUMENTATION_MAX_QUERIES
+    level = logging.WARNING if is_slow or has_many_queries else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={
+            **fields,
+            'duration': round(duration, 4),
+            'db_queries': stats.queries,
+            'db_duration': round(stats.db_time, 4),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        })
+
+
+class InstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect_stats() as stats:
+            response = self.get_response(request)
+        duration = stats.duration
+
+        # The URL name rather than the path, which would make a series per object
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match else 'unresolved'
+        registry.inc('http_requests_total',
+                     (('view', view), ('method', request.method), ('status', response.status_code)))
+        record('http_request', (('view', view),), stats, duration)
+        registry.flush()
+
+        log_stats(f'{request.method} {request.path} {response.status_code}', stats, duration,
+                  view=view, method=request.method, path=request.path, status=response.status_code)
+        return response
+
+
+_running_tasks = {}
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    stack = contextlib.ExitStack()
+    stats = stack.enter_context(collect_stats())
+    _running_tasks[task_id] = stack, stats
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    stack, stats = _running_tasks.pop(task_id, (None, None))
+    if stack is None:
+        return
+    duration = stats.duration
+    stack.close()
+
+    registry.inc('celery_tasks_total', (('task', task.name), ('state', state)))
+    record('celery_task', (('task', task.name),), stats, duration)
+    # A worker process can stay idle for long after a task
+    registry.flush(force=True)
+
+    log_stats(f'Task {task.name} {state}', stats, duration, task=task.name, task_id=task_id, state=state)
+
+
+# Attributes of every LogRecord, the other ones are the extra fields
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    A JSON object per record, with the extra fields of the record.
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
@@ -68,8 +68,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(days=1),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "users.api.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.api.serializers.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -97,7 +97,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # 'PAGE_SIZE': 20,  # Set the default page size, change as needed
@@ -105,13 +105,18 @@ REST_FRAMEWORK = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+# Seconds after the login during which the claims of the access tokens are trusted, see users.authentication
+AUTH_CLAIMS_TRUST_WINDOW = int(os.environ.get('AUTH_CLAIMS_TRUST_WINDOW', 15 * 60))
 
 MIDDLEWARE = [
+    # First, to measure the whole request
+    'courses_project.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'courses_project.db_routers.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -145,6 +150,12 @@ WSGI_APPLICATION = 'courses_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# The type of the process, set by docker-compose.yml: "web" (gunicorn), "asgi" (uvicorn) or "worker" (celery)
+PROCESS_TYPE = os.environ.get('PROCESS_TYPE', 'web')
+# Seconds a database connection is kept for the next requests or tasks of the process, checked before reuse by
+# CONN_HEALTH_CHECKS. Not under ASGI, where every request may run in another thread and open its own connection.
+DB_CONN_MAX_AGE = {'web': 60, 'asgi': 0, 'worker': 10 * 60}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -153,9 +164,32 @@ DATABASES = {
         'PASSWORD': os.environ.get("POSTGRES_PASSWORD"),
         'HOST': os.environ.get("POSTGRES_HOST"),
         'PORT': os.environ.get("POSTGRES_PORT", '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', DB_CONN_MAX_AGE.get(PROCESS_TYPE, 0))),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
     }
 }
 
+# Read replicas of the default database, as a comma separated list of host[:port][/name], e.g.
+# "replica-1,replica-2:5433". The catalog and analytics views read from them, see courses_project.db_routers.
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICAS', '').split(',')), start=1):
+    replica_address, _, replica_name = replica.strip().partition('/')
+    replica_host, _, replica_port = replica_address.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'NAME': replica_name or DATABASES['default']['NAME'],
+        # Not created by the tests, which can't see the rows of their transactions from the replica connections
+        # anyway: run them without replicas, see catalog.api.test_views.ReplicaRoutingTest
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['courses_project.db_routers.ReplicaRouter']
+# Seconds during which the reads of a user go to the primary after a write, longer than the replication lag
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
 # Logging
 
 LOGGING = {
@@ -170,12 +204,16 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'courses_project.instrumentation.JsonFormatter',
+        },
     },
     'handlers': {
         'console': {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            # "json" for structured logs
+            'formatter': os.getenv('DJANGO_LOG_FORMAT', 'verbose'),
         },
     },
     'loggers': {
@@ -184,6 +222,12 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': True,
         },
+        # Slow requests and tasks, see courses_project.instrumentation
+        'courses_project.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
         # Add other loggers for different parts of the application here
     },
 }
@@ -192,7 +236,8 @@ LOGGING = {
 # Caches
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        # Counts the hits and misses, see courses_project.instrumentation
+        'BACKEND': 'courses_project.instrumentation.InstrumentedPyMemcacheCache',
         'LOCATION': f"{os.environ.get('MEMCACHED_HOST')}:{os.environ.get('MEMCACHED_PORT')}",
         'TIMEOUT': 2592000,  # 30 days
     }
@@ -254,6 +299,56 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')
 
+# Redis pub/sub used to push the progress of the code challenge submissions, see learning.submission_events
+SUBMISSION_EVENTS_REDIS_URL = os.environ.get('SUBMISSION_EVENTS_REDIS_URL') or (
+    CELERY_BROKER_URL if (CELERY_BROKER_URL or '').startswith('redis') else None)
+SUBMISSION_EVENTS_TIMEOUT = int(os.environ.get('SUBMISSION_EVENTS_TIMEOUT', 120))
+
+# Request and task metrics, see courses_project.instrumentation. Kept in memory by every process without Redis.
+METRICS_REDIS_URL = os.environ.get('METRICS_REDIS_URL') or SUBMISSION_EVENTS_REDIS_URL
+# Bearer token of the Prometheus scraper, the staff users can also read the metrics
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')
+# The requests and tasks above either are logged with a warning
+INSTRUMENTATION_SLOW_SECONDS = float(os.environ.get('INSTRUMENTATION_SLOW_SECONDS', 1))
+INSTRUMENTATION_MAX_QUERIES = int(os.environ.get('INSTRUMENTATION_MAX_QUERIES', 50))
+
+# Admission control of the code challenge submissions, see learning.submission_scheduler
+CODE_EVALUATION_MAX_IN_FLIGHT = int(os.environ.get('CODE_EVALUATION_MAX_IN_FLIGHT', 2))
+CODE_EVALUATION_QUEUES = {
+    'learner': os.environ.get('CODE_EVALUATION_LEARNER_QUEUE', 'code_evaluation'),
+    'instructor': os.environ.get('CODE_EVALUATION_INSTRUCTOR_QUEUE', 'code_evaluation_instructor'),
+}
+
+# Every family of tasks has its own queue, consumed by its own worker pool (see docker-compose.yml), so a backlog in
+# one of them never delays the others. The other tasks go to the default "celery" queue.
+CELERY_TASK_ROUTES = {
+    'learning.tasks.evaluate_code': {'queue': CODE_EVALUATION_QUEUES['learner']},
+    'courses.tasks.transcode_video': {'queue': 'video'},
+    'courses.tasks.ingest_remote_image': {'queue': 'media'},
+    'courses.tasks.generate_image_variants': {'queue': 'media'},
+    'courses.tasks.delete_video_renditions': {'queue': 'media'},
+    'courses_project.tasks.*': {'queue': 'maintenance'},
+    'catalog.tasks.refresh_course_similarities': {'queue': 'maintenance'},
+    'catalog.tasks.record_course_event': {'queue': 'maintenance'},
+    'teaching.tasks.update_learner_progress_for_deleted_item': {'queue': 'maintenance'},
+    'teaching.tasks.refresh_learner_course_cache': {'queue': 'maintenance'},
+    'users.tasks.*': {'queue': 'email'},
+}
+# Default time limits, in seconds, the soft one raises SoftTimeLimitExceeded in the task to let it clean up
+CELERY_TASK_SOFT_TIME_LIMIT = 10 * 60
+CELERY_TASK_TIME_LIMIT = 12 * 60
+CELERY_TASK_ANNOTATIONS = {
+    'learning.tasks.evaluate_code': {'soft_time_limit': 3 * 60, 'time_limit': 4 * 60},
+    'courses.tasks.ingest_remote_image': {'soft_time_limit': 2 * 60, 'time_limit': 3 * 60},
+    'courses.tasks.generate_image_variants': {'soft_time_limit': 2 * 60, 'time_limit': 3 * 60},
+    'courses.tasks.delete_video_renditions': {'soft_time_limit': 2 * 60, 'time_limit': 3 * 60},
+    'courses_project.tasks.rebuild_course_similarities': {'soft_time_limit': 30 * 60, 'time_limit': 35 * 60},
+    'users.tasks.send_email': {'soft_time_limit': 60, 'time_limit': 90},
+    'users.tasks.send_outbox_emails': {'soft_time_limit': 5 * 60, 'time_limit': 6 * 60},
+}
+# Overridden by the workers of the long tasks, which only reserve the task they run (--prefetch-multiplier=1)
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', 4))
+
 
 CELERY_BEAT_SCHEDULE = {
     "refresh_catalog_courses_cache": {
@@ -268,10 +363,23 @@ CELERY_BEAT_SCHEDULE = {
         "task": "courses_project.tasks.update_daily_active_users",
         "schedule": crontab(minute=0, hour='*/6')  # Every 6 hours
     },
+    "send_outbox_emails": {
+        "task": "users.tasks.send_outbox_emails",
+        "schedule": crontab(minute="*"),  # Every minute, for the retries and the rate limited emails
+    },
+    "delete_sent_emails": {
+        "task": "users.tasks.delete_sent_emails",
+        "schedule": crontab(minute=30, hour=4),
+    },
+    "rebuild_course_similarities": {
+        "task": "courses_project.tasks.rebuild_course_similarities",
+        "schedule": crontab(minute=0, hour=3)  # Every night, enrollments update the lists incrementally
+    },
 }
 
 # S3 configuration
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Set to django.core.files.storage.FileSystemStorage to keep the media files in MEDIA_ROOT, e.g. for local testing
+DEFAULT_FILE_STORAGE = os.environ.get('DEFAULT_FILE_STORAGE', 'storages.backends.s3boto3.S3Boto3Storage')
 
 AWS_QUERYSTRING_AUTH = False
 AWS_S3_FILE_OVERWRITE = False
@@ -279,12 +387,39 @@ AWS_S3_FILE_OVERWRITE = False
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
+AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME')
+# Set to use an S3 compatible server such as MinIO
+AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL')
+
+DIRECT_UPLOAD_URL_EXPIRATION = int(os.environ.get('DIRECT_UPLOAD_URL_EXPIRATION', 60 * 60))
+
+# Video transcoding, see courses.video_transcoding
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
 
 # Judge0 variables
 JUDGE0_HOST = os.environ.get('JUDGE0_HOST')
 JUDGE0_AUTH_TOKEN = os.environ.get('JUDGE0_AUTH_TOKEN')
 JUDGE0_AUTH_USER = os.environ.get('JUDGE0_AUTH_USER')
 
+# Code executor of the code challenge submissions, 'judge0' or 'local', see courses.executors
+CODE_EXECUTOR = os.environ.get('CODE_EXECUTOR', 'judge0')
+LOCAL_EXECUTOR_WORKERS = int(os.environ.get('LOCAL_EXECUTOR_WORKERS', os.cpu_count() or 2))
+LOCAL_EXECUTOR_TIME_LIMIT = int(os.environ.get('LOCAL_EXECUTOR_TIME_LIMIT', 5))  # CPU seconds per test case
+LOCAL_EXECUTOR_MEMORY_LIMIT = int(os.environ.get('LOCAL_EXECUTOR_MEMORY_LIMIT', 256))  # MB
+LOCAL_EXECUTOR_OUTPUT_LIMIT = int(os.environ.get('LOCAL_EXECUTOR_OUTPUT_LIMIT', 1024))  # KB
+# Command prefix isolating the programs, {work_dir} being replaced by their directory. By default they run without
+# network access, without access to the processes of the worker and in a filesystem jail only holding the read-only
+# toolchain paths and their directory, see courses/executors/jail.sh. The worker must be allowed to create user
+# namespaces. The programs are refused if they can read the files of the worker, e.g. when the command is empty and
+# LOCAL_EXECUTOR_USER isn't set.
+LOCAL_EXECUTOR_SANDBOX_COMMAND = os.environ.get(
+    'LOCAL_EXECUTOR_SANDBOX_COMMAND',
+    f'unshare --user --map-root-user --mount --net --pid --fork --mount-proc '
+    f'sh {BASE_DIR / "courses/executors/jail.sh"} {{work_dir}} /usr /bin /lib /lib64 /etc/alternatives --')
+# Unprivileged user running the programs, not able to read the files of the worker. It must run as root to switch to it
+LOCAL_EXECUTOR_USER = os.environ.get('LOCAL_EXECUTOR_USER')
+
 # SMTP
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST')
@@ -292,3 +427,9 @@ EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL') or EMAIL_HOST_USER or 'webmaster@localhost'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+
+# Mail outbox, see users.mail_outbox
+MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 50))
+MAIL_OUTBOX_RATE_LIMIT = int(os.environ.get('MAIL_OUTBOX_RATE_LIMIT', 300))  # emails per minute
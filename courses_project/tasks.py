@@ -22,3 +22,9 @@ def refresh_learner_courses_cache():
 def update_daily_active_users():
     logger.info("Updating daily active users...")
     call_command("update_daily_active_users")
+
+
+@shared_task
+def rebuild_course_similarities():
+    logger.info("Rebuilding the course similarities...")
+    call_command("build_course_similarities")
@@ -0,0 +1,48 @@
+import functools
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+
+
+class _AssertQueryBudgetContext(CaptureQueriesContext):
+
+    def __init__(self, test_case, max_queries, connection):
+        self.test_case = test_case
+        self.max_queries = max_queries
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        self.test_case.assertLessEqual(
+            executed, self.max_queries,
+            '%d queries executed, over the budget of %d\nCaptured queries were:\n%s' % (
+                executed, self.max_queries,
+                '\n'.join('%d. %s' % (i, query['sql']) for i, query in enumerate(self.captured_queries, start=1))))
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin failing the tests which run more queries than their budget, to catch the N+1 queries.
+    """
+
+    def assertQueryBudget(self, max_queries, using=DEFAULT_DB_ALIAS):
+        """
+        Like assertNumQueries, with at most max_queries queries.
+        """
+        return _AssertQueryBudgetContext(self, max_queries, connections[using])
+
+
+def query_budget(max_queries, using=DEFAULT_DB_ALIAS):
+    """
+    Decorator of the test methods of a QueryBudgetMixin, the queries run by the whole test must fit in the budget.
+    """
+    def decorator(test_method):
+        @functools.wraps(test_method)
+        def wrapper(self, *args, **kwargs):
+            with self.assertQueryBudget(max_queries, using):
+                return test_method(self, *args, **kwargs)
+        return wrapper
+    return decorator
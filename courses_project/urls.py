@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from courses_project import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.api.urls')),
@@ -26,6 +28,7 @@ urlpatterns = [
     path('api/learning/', include('learning.api.urls')),
     path('api/catalog/', include('catalog.api.urls')),
     path('api/', include('courses.api.urls')),
+    path('metrics', views.metrics, name='metrics'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from courses_project import instrumentation
+
+
+def is_metrics_scraper(request):
+    # The Prometheus scraper sends the token, the staff can read them from their admin session
+    if settings.METRICS_AUTH_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        if constant_time_compare(authorization, f'Bearer {settings.METRICS_AUTH_TOKEN}'):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@require_GET
+def metrics(request):
+    """
+    The metrics of the requests, tasks and database connections of all the processes, see
+    courses_project.instrumentation.
+    """
+    if not is_metrics_scraper(request):
+        return HttpResponseForbidden()
+    series = {**instrumentation.registry.get_totals(), **instrumentation.get_database_gauges()}
+    return HttpResponse(instrumentation.render_metrics(series), content_type='text/plain; version=0.0.4; charset=utf-8')
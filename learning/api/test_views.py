@@ -1,12 +1,30 @@
-from django.test import TestCase
+import base64
+import os
+import shutil
+from unittest import skipUnless
+from unittest.mock import patch
+from uuid import UUID
+
+from asgiref.sync import async_to_sync
+from celery import states
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
 
 from datetime import timedelta
 
-from courses.models import Course, Chapter, Lesson, BaseLessonStep
-from learning.models import CourseEnrollment
+from courses.executors import ExecutorError
+from courses.executors.judge0 import Judge0Executor
+from courses.executors.local import LocalExecutor
+from courses.models import Course, Chapter, Lesson, BaseLessonStep, CodeChallengeLessonStep, ProgrammingLanguage, \
+    CodeChallengeTestCase
+from learning import submission_events, submission_scheduler
+from learning.models import CourseEnrollment, CodeChallengeSubmission
+from learning.tasks import evaluate_code
 from teaching.models import EngagementAnalytics
 from users.models import User
 
@@ -100,3 +118,327 @@ class EngagementAnalyticsTestCase(TestCase):
         response = self.client.post(self.engagement_url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.data['detail'], 'Forbidden')
+
+
+class SubmissionEventsTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.learner = User.objects.create_user(
+            email='learner@example.com', password='testpassword', first_name='Learner', last_name='Test')
+        self.other_learner = User.objects.create_user(
+            email='other@example.com', password='testpassword', first_name='Other', last_name='Test')
+        self.instructor = User.objects.create_user(
+            email='instructor@example.com', password='testpassword', first_name='Instructor', last_name='Test')
+
+        self.course = Course.objects.create(instructor=self.instructor, title='Test Course')
+        CourseEnrollment.objects.create(course=self.course, learner=self.learner, active=True, completed=False)
+        CourseEnrollment.objects.create(course=self.course, learner=self.other_learner, active=True, completed=False)
+        chapter = Chapter.objects.create(course=self.course, title='Test Chapter')
+        lesson = Lesson.objects.create(chapter=chapter, title='Test Lesson', order=1)
+        self.code_challenge = CodeChallengeLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=lesson, order=1), title='Challenge')
+
+        self.task_id = 'b3b7c6a8-0f4e-4d5b-9a8e-3d2f8f0e6c11'
+        self.events_url = reverse('code-challenge-submission-events', kwargs={'task_id': self.task_id})
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('learning.submission_scheduler.uuid.uuid4')
+    @patch('learning.api.views.evaluate_code')
+    def submit(self, evaluate_code, uuid4):
+        uuid4.return_value = UUID(self.task_id)
+        self.client.force_authenticate(user=self.learner)
+        response = self.client.post(reverse('submit-code-challenge', kwargs={'pk': self.code_challenge.base_step_id}),
+                                    {'code': 'print(1)', 'acting_role': 'learner'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['token'], self.task_id)
+
+    def test_only_the_submitter_can_check_the_result(self):
+        self.submit()
+
+        self.client.force_authenticate(user=self.other_learner)
+        response = self.client.get(reverse('check-code-challenge', kwargs={'task_id': self.task_id}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('learning.api.views.AsyncResult')
+    def test_result_after_the_owner_expired(self, async_result):
+        async_result.return_value.ready.return_value = False
+        self.submit()
+        cache.delete(submission_events.get_task_owner_key(self.task_id))
+
+        response = self.client.get(reverse('check-code-challenge', kwargs={'task_id': self.task_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'PENDING')
+
+        # Falls back to the enrollments of the user
+        self.client.force_authenticate(user=self.instructor)
+        response = self.client.get(reverse('check-code-challenge', kwargs={'task_id': self.task_id}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(SUBMISSION_EVENTS_REDIS_URL='redis://localhost:6379/0')
+    @patch('learning.api.views.submission_events.iter_events')
+    def test_stream_submission_events(self, iter_events):
+        async def events(task_id, timeout):
+            yield submission_events.format_sse(
+                submission_events.encode_event(submission_events.TEST_RESULT, {'passed': True}))
+            yield submission_events.format_sse(
+                submission_events.encode_event(submission_events.VERDICT, {'passed': True}))
+
+        iter_events.side_effect = events
+        self.submit()
+
+        response = async_to_sync(self.async_client.get)(
+            self.events_url, headers={'Authorization': f'Bearer {AccessToken.for_user(self.learner)}'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = async_to_sync(self.read_stream)(response)
+        self.assertEqual(content.count('data: '), 2)
+        self.assertIn('"type": "verdict"', content)
+
+    def test_stream_submission_events_forbidden(self):
+        self.submit()
+
+        response = self.client.get(self.events_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # EventSource clients send the token as a query parameter
+        response = self.client.get(self.events_url, {'access_token': str(AccessToken.for_user(self.other_learner))})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @staticmethod
+    async def read_stream(response):
+        return ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+
+class AdmissionControlTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.learner = User.objects.create_user(
+            email='learner@example.com', password='testpassword', first_name='Learner', last_name='Test')
+        self.instructor = User.objects.create_user(
+            email='instructor@example.com', password='testpassword', first_name='Instructor', last_name='Test')
+        course = Course.objects.create(instructor=self.instructor, title='Test Course')
+        CourseEnrollment.objects.create(course=course, learner=self.learner, active=True, completed=False)
+        lesson = Lesson.objects.create(chapter=Chapter.objects.create(course=course, title='Test Chapter'),
+                                       title='Test Lesson', order=1)
+        self.code_challenge = CodeChallengeLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=lesson, order=1), title='Challenge')
+        self.submit_url = reverse('submit-code-challenge', kwargs={'pk': self.code_challenge.base_step_id})
+
+    def tearDown(self):
+        cache.clear()
+
+    def submit(self, user, acting_role='learner'):
+        self.client.force_authenticate(user=user)
+        return self.client.post(self.submit_url, {'code': 'print(1)', 'acting_role': acting_role}, format='json')
+
+    @override_settings(CODE_EVALUATION_MAX_IN_FLIGHT=2)
+    @patch('learning.api.views.evaluate_code')
+    def test_in_flight_limit(self, evaluate_code):
+        self.assertEqual(self.submit(self.learner).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.submit(self.learner).status_code, status.HTTP_200_OK)
+
+        response = self.submit(self.learner)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(evaluate_code.apply_async.call_count, 2)
+
+        # The limit is per user
+        self.assertEqual(self.submit(self.instructor, 'instructor').status_code, status.HTTP_200_OK)
+
+        # Released once an evaluation ends
+        submission_scheduler.release_slot(self.learner.id)
+        self.assertEqual(self.submit(self.learner).status_code, status.HTTP_200_OK)
+
+    @patch('learning.api.views.evaluate_code')
+    def test_lanes(self, evaluate_code):
+        self.submit(self.learner)
+        self.submit(self.instructor, 'instructor')
+
+        queues = [call.kwargs['queue'] for call in evaluate_code.apply_async.call_args_list]
+        self.assertEqual(queues, ['code_evaluation', 'code_evaluation_instructor'])
+
+    @patch('learning.api.views.AsyncResult')
+    @patch('learning.api.views.evaluate_code')
+    def test_superseded_submission_is_not_evaluated(self, _, async_result):
+        first_task_id = self.submit(self.learner).data['token']
+        second_task_id = self.submit(self.learner).data['token']
+
+        with patch.object(evaluate_code, 'update_state') as update_state:
+            result = evaluate_code.apply(args=['cHJpbnQoMSk=', self.code_challenge.base_step_id, self.learner.id],
+                                         task_id=first_task_id)
+
+        self.assertNotEqual(result.state, states.SUCCESS)
+        update_state.assert_called_once_with(state=submission_scheduler.SUPERSEDED,
+                                             meta={'superseded_by': second_task_id})
+        self.assertFalse(CodeChallengeSubmission.objects.exists())
+        self.assertEqual(submission_scheduler.get_in_flight_count(self.learner.id), 1)
+
+        async_result.return_value.status = submission_scheduler.SUPERSEDED
+        async_result.return_value.info = {'superseded_by': second_task_id}
+        response = self.client.get(reverse('check-code-challenge', kwargs={'task_id': first_task_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'task_status': 'SUPERSEDED', 'superseded_by': second_task_id})
+
+    @patch('learning.api.views.submission_scheduler.get_queue_depths')
+    def test_queue_depths(self, get_queue_depths):
+        get_queue_depths.return_value = {'learner': {'queue': 'code_evaluation', 'depth': 3, 'consumers': 1}}
+        url = reverse('code-evaluation-queues')
+
+        self.client.force_authenticate(user=self.learner)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.learner.is_staff = True
+        self.learner.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['learner']['depth'], 3)
+
+
+def b64(text):
+    return base64.b64encode(text.encode()).decode()
+
+
+@skipUnless(shutil.which('prlimit') and shutil.which('unshare'), 'prlimit or unshare is not installed')
+@override_settings(CODE_EXECUTOR='local', LOCAL_EXECUTOR_TIME_LIMIT=1, SUBMISSION_EVENTS_REDIS_URL=None)
+class LocalExecutorTestCase(TestCase):
+
+    def setUp(self):
+        self.learner = User.objects.create_user(
+            email='learner@example.com', password='testpassword', first_name='Learner', last_name='Test')
+        instructor = User.objects.create_user(
+            email='instructor@example.com', password='testpassword', first_name='Instructor', last_name='Test')
+        chapter = Chapter.objects.create(course=Course.objects.create(instructor=instructor, title='Test Course'),
+                                         title='Test Chapter')
+        self.lesson = Lesson.objects.create(chapter=chapter, title='Test Lesson', order=1)
+
+    def tearDown(self):
+        cache.clear()
+
+    def evaluate(self, language_id, code, continue_on_error=True):
+        language = ProgrammingLanguage.objects.get_or_create(id=language_id, defaults={'name': str(language_id)})[0]
+        code_challenge = CodeChallengeLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=1), title='Sum', language=language)
+        for numbers in ['1 2', '3 4', '10 -5']:
+            CodeChallengeTestCase.objects.create(code_challenge_step=code_challenge, input=b64(numbers + '\n'),
+                                                 expected_output=b64(f'{sum(map(int, numbers.split()))}\n'))
+
+        evaluate_code.apply(args=[b64(code), code_challenge.base_step_id, self.learner.id, continue_on_error])
+        return CodeChallengeSubmission.objects.get(learner=self.learner, code_challenge_step=code_challenge)
+
+    def test_accepted(self):
+        submission = self.evaluate(71, 'a, b = map(int, input().split())\nprint(a + b)\n')
+
+        self.assertTrue(submission.passed)
+        self.assertEqual({result.status for result in submission.test_results.all()}, {'Accepted'})
+
+    def test_wrong_answer(self):
+        submission = self.evaluate(71, 'a, b = map(int, input().split())\nprint(a - b)\n')
+
+        self.assertFalse(submission.passed)
+        statuses = sorted(result.status for result in submission.test_results.all())
+        self.assertEqual(statuses, ['Wrong Answer', 'Wrong Answer', 'Wrong Answer'])
+
+    def test_time_limit_exceeded(self):
+        submission = self.evaluate(71, 'while True:\n    pass\n')
+
+        self.assertFalse(submission.passed)
+        self.assertEqual({result.status for result in submission.test_results.all()}, {'Time Limit Exceeded'})
+
+    def test_runtime_error_stops_the_evaluation(self):
+        submission = self.evaluate(71, 'raise ValueError()\n', continue_on_error=False)
+
+        self.assertFalse(submission.passed)
+        self.assertIn('ValueError', base64.b64decode(submission.error_message[len('Error: '):]).decode())
+
+    def test_programs_do_not_see_the_worker(self):
+        submission = self.evaluate(71, 'import os, socket\n'
+                                       'assert len([pid for pid in os.listdir("/proc") if pid.isdigit()]) <= 3\n'
+                                       'try:\n'
+                                       '    socket.create_connection(("1.1.1.1", 53), timeout=1)\n'
+                                       'except OSError:\n'
+                                       '    a, b = map(int, input().split())\n'
+                                       '    print(a + b)\n')
+
+        self.assertTrue(submission.passed)
+
+    def test_programs_can_not_open_the_worker_files(self):
+        worker_file = os.path.join(settings.BASE_DIR, 'courses_project', 'settings.py')
+        escaped_file = os.path.join(settings.BASE_DIR, 'escaped.txt')
+        self.addCleanup(lambda: os.path.exists(escaped_file) and os.remove(escaped_file))
+        submission = self.evaluate(71, 'try:\n'
+                                       f'    open({worker_file!r}).read()\n'
+                                       'except OSError:\n'
+                                       '    try:\n'
+                                       f'        open({escaped_file!r}, "w").write("escaped")\n'
+                                       '    except OSError:\n'
+                                       '        a, b = map(int, input().split())\n'
+                                       '        print(a + b)\n')
+
+        self.assertTrue(submission.passed)
+        self.assertFalse(os.path.exists(escaped_file))
+
+    @override_settings(LOCAL_EXECUTOR_SANDBOX_COMMAND='', LOCAL_EXECUTOR_USER=None)
+    def test_unsandboxed_execution_is_refused(self):
+        with self.assertRaises(ExecutorError):
+            next(LocalExecutor().run(b64('print(1)\n'), 71, []))
+
+    @override_settings(LOCAL_EXECUTOR_SANDBOX_COMMAND='unshare --net --pid --fork --mount-proc --map-root-user')
+    def test_sandbox_without_filesystem_jail_is_refused(self):
+        with self.assertRaises(ExecutorError):
+            next(LocalExecutor().run(b64('print(1)\n'), 71, []))
+
+    @skipUnless(shutil.which('gcc'), 'gcc is not installed')
+    def test_compiled_language(self):
+        submission = self.evaluate(50, '#include <stdio.h>\n'
+                                       'int main() { int a, b; scanf("%d %d", &a, &b); printf("%d\\n", a + b); }\n')
+
+        self.assertTrue(submission.passed)
+
+    @skipUnless(shutil.which('gcc'), 'gcc is not installed')
+    def test_compilation_error(self):
+        submission = self.evaluate(50, 'int main() { return missing; }\n')
+
+        self.assertFalse(submission.passed)
+        results = submission.test_results.all()
+        self.assertEqual({result.status for result in results}, {'Compilation Error'})
+        # Compiled and reported once
+        compile_errors = [result.compile_err for result in results if result.compile_err]
+        self.assertEqual(len(compile_errors), 1)
+        self.assertIn('missing', base64.b64decode(compile_errors[0]).decode())
+        self.assertEqual(submission.error_message, f'Error: {compile_errors[0]}')
+
+
+class Judge0ExecutorTestCase(TestCase):
+
+    @patch('courses.executors.judge0.time.sleep')
+    @patch('courses.executors.judge0.judge0_service')
+    def run_executor(self, submissions, judge0_service, sleep):
+        test_cases = [CodeChallengeTestCase(id=index, input=b64(str(index)), expected_output=b64(str(index)))
+                      for index in range(1, 4)]
+        judge0_service.submit_batch.side_effect = lambda batch: [
+            {'token': f'token{index}'} for index in range(len(batch))]
+        judge0_service.get_batch_submission_result.side_effect = lambda tokens: {
+            'submissions': [dict(submissions[token], token=token) for token in tokens]}
+
+        results = list(Judge0Executor().run(b64('code'), 54, test_cases))
+        return results, judge0_service
+
+    def test_compilation_error_is_reported_once(self):
+        results, judge0_service = self.run_executor({
+            'token0': {'status': {'description': 'Compilation Error'}, 'compile_output': b64('error')}})
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][1].compile_output, b64('error'))
+        judge0_service.submit_batch.assert_called_once()
+
+    def test_the_other_test_cases_run_after_the_first_one(self):
+        accepted = {'status': {'description': 'Accepted'}}
+        results, judge0_service = self.run_executor({'token0': accepted, 'token1': accepted})
+
+        self.assertEqual([test_case.id for test_case, _ in results], [1, 2, 3])
+        self.assertTrue(all(result.passed for _, result in results))
+        self.assertEqual([len(call.args[0]) for call in judge0_service.submit_batch.call_args_list], [1, 2])
@@ -12,8 +12,11 @@ urlpatterns = [
 
     path('code-challenge-steps/<uuid:pk>/submit/', views.CodeChallengeView.as_view(), name='submit-code-challenge'),
     path('code-challenge-steps/<uuid:pk>/', views.CodeChallengeView.as_view(), name='get-code-challenge'),
+    path('code-challenge-steps/queues/', views.get_code_evaluation_queues, name='code-evaluation-queues'),
     path('code-challenge-steps/submissions/<str:task_id>/', views.CodeChallengeResultView.as_view(),
          name='check-code-challenge'),
+    path('code-challenge-steps/submissions/<str:task_id>/events/', views.stream_submission_events,
+         name='code-challenge-submission-events'),
 
     path('quiz-steps/<uuid:pk>/', views.QuizStepView.as_view(), name='quiz-read-submit'),
     path('sorting-steps/<uuid:pk>/', views.SortingStepView.as_view(), name='sorting-read-submit'),
@@ -2,7 +2,10 @@ import re
 from datetime import timedelta
 from uuid import UUID
 
+from asgiref.sync import sync_to_async
 from celery.result import AsyncResult
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.generics import get_object_or_404
@@ -10,17 +13,20 @@ from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.filters import OrderingFilter
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 
 from courses.api.lesson_steps_serializers import QuizLessonStepSerializer, SortingProblemLessonStepSerializer, \
     TextProblemLessonStepSerializer, CodeChallengeLessonStepSerializer
 from courses.api.serializers import ReviewSerializer
+from learning import submission_events, submission_scheduler
 from learning.models import LearnerAssessmentStepPerformance, CodeChallengeSubmission
 from teaching.models import EngagementAnalytics
+from users.authentication import ClaimsJWTAuthentication
 from .mixins import LearnerCourseViewMixin
 from .serializers import LearnerCourseSerializer, LearnerProgressSerializer
 from courses.models import Course, CodeChallengeLessonStep, BaseLessonStep, QuizLessonStep, Review, \
     SortingProblemLessonStep, TextProblemLessonStep
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 from learning.models import LearnerProgress, CourseEnrollment
 from learning.tasks import evaluate_code
@@ -102,10 +108,21 @@ class CodeChallengeView(APIView):
 
         code_challenge_id = code_challenge_step.base_step_id
         cache.set(f'code_challenge_{code_challenge_id}', code_challenge_step, timeout=300)
+        if not submission_scheduler.acquire_slot(user.id):
+            return Response({'error': 'Too many submissions are being evaluated, please wait for their results'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': '5'})
+
         is_instructor = (acting_role == 'instructor')
-        task = evaluate_code.delay(code, code_challenge_id, user.id, is_instructor)
+        task_id = submission_scheduler.start_submission(user.id, code_challenge_id)
+        submission_events.set_task_owner(task_id, user.id)
+        try:
+            evaluate_code.apply_async((code, code_challenge_id, user.id, is_instructor), task_id=task_id,
+                                      queue=submission_scheduler.get_queue(acting_role))
+        except Exception:
+            submission_scheduler.release_slot(user.id)
+            raise
 
-        return Response({"token": str(task.id)})
+        return Response({"token": task_id})
 
     def get(self, request, pk):
         user = request.user
@@ -132,16 +149,23 @@ class CodeChallengeResultView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, task_id):
-        user = request.user
-        enrolled = CodeChallengeLessonStep.objects.filter(
-            base_step__lesson__chapter__course__enrolled_learners=user
-        ).exists()
-        if not enrolled:
+        # Prefer the push channel, see stream_submission_events
+        owner_id = submission_events.get_task_owner(task_id)
+        if owner_id is None:
+            # Polled after the owner key expired or was evicted, any learner enrolled in a code challenge is allowed
+            allowed = CodeChallengeLessonStep.objects.filter(
+                base_step__lesson__chapter__course__enrolled_learners=request.user
+            ).exists()
+        else:
+            allowed = owner_id == str(request.user.id)
+        if not allowed:
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
 
         # check if the task is done and return the result
         result = AsyncResult(task_id)
 
+        if result.status == submission_scheduler.SUPERSEDED:
+            return Response({'task_status': submission_scheduler.SUPERSEDED, **result.info})
         if result.ready():
             if result.status == states.SUCCESS:
                 code_submission = result.result
@@ -161,6 +185,54 @@ class CodeChallengeResultView(APIView):
             return Response({'status': states.PENDING})
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_code_evaluation_queues(request):
+    """
+    Number of evaluations waiting in every lane, to monitor the grading latency.
+    """
+    return Response(submission_scheduler.get_queue_depths())
+
+
+def get_token_user_id(request):
+    """
+    Id of the user of the JWT access token given in the Authorization header, or in the access_token query parameter
+    for EventSource clients, which can't set headers.
+    """
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else request.GET.get('access_token', '').encode()
+    if not raw_token:
+        return None
+
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token)).id
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def stream_submission_events(request, task_id):
+    """
+    Server-Sent Events with the progress of a code challenge submission: one `test_result` event per test case
+    and a final `verdict` (the submission, as returned by CodeChallengeResultView) or `error` event.
+    """
+    user_id = await sync_to_async(get_token_user_id)(request)
+    if user_id is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    if not await sync_to_async(submission_events.is_task_owner)(task_id, user_id):
+        return JsonResponse({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    if not settings.SUBMISSION_EVENTS_REDIS_URL:
+        return JsonResponse({'detail': 'Submission events are not available'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(submission_events.iter_events(task_id, settings.SUBMISSION_EVENTS_TIMEOUT),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 class QuizStepView(APIView):
     permission_classes = [IsAuthenticated]
 
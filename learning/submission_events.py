@@ -0,0 +1,129 @@
+"""
+Live progress of the code challenge submissions.
+
+evaluate_code publishes an event on the Redis channel of its task for every evaluated test case and a final one with
+the verdict, which learning.api.views.stream_submission_events streams to the submitting user as Server-Sent Events.
+The final event is also kept for a few minutes, for clients that subscribe after the task finished.
+"""
+import json
+import logging
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Event types
+TEST_RESULT = 'test_result'
+VERDICT = 'verdict'
+ERROR = 'error'
+FINAL_EVENTS = (VERDICT, ERROR)
+
+FINAL_EVENT_TIMEOUT = 5 * 60
+TASK_OWNER_TIMEOUT = 60 * 60
+
+
+def get_channel(task_id):
+    return f'code_challenge_submission_{task_id}'
+
+
+def get_final_event_key(task_id):
+    return f'code_challenge_submission_{task_id}_final'
+
+
+def get_task_owner_key(task_id):
+    return f'code_challenge_task_owner_{task_id}'
+
+
+def set_task_owner(task_id, user_id):
+    # The result endpoints check the owner of the task instead of the enrollments of the user
+    cache.set(get_task_owner_key(task_id), str(user_id), TASK_OWNER_TIMEOUT)
+
+
+def get_task_owner(task_id):
+    """
+    :return: id of the submitting user, None once the key expired or was evicted
+    """
+    return cache.get(get_task_owner_key(task_id))
+
+
+def is_task_owner(task_id, user_id):
+    return get_task_owner(task_id) == str(user_id)
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.SUBMISSION_EVENTS_REDIS_URL)
+    return _client
+
+
+def get_async_client():
+    # Not shared, an asyncio client is bound to the event loop it was created in
+    return redis.asyncio.Redis.from_url(settings.SUBMISSION_EVENTS_REDIS_URL)
+
+
+def encode_event(event_type, data):
+    return json.dumps({'type': event_type, 'data': data}, default=str)
+
+
+def publish_event(task_id, event_type, data):
+    """
+    Publish an event of the task, errors are only logged so the evaluation never fails because of them.
+    """
+    if not task_id or not settings.SUBMISSION_EVENTS_REDIS_URL:
+        return
+
+    message = encode_event(event_type, data)
+    try:
+        client = get_client()
+        if event_type in FINAL_EVENTS:
+            client.set(get_final_event_key(task_id), message, ex=FINAL_EVENT_TIMEOUT)
+        client.publish(get_channel(task_id), message)
+    except redis.RedisError as e:
+        logger.warning(f'Submission event of task {task_id} not published: {e}')
+
+
+def format_sse(message, event_type=None):
+    lines = [f'event: {event_type}'] if event_type else []
+    lines += [f'data: {line}' for line in message.splitlines()]
+    return '\n'.join(lines) + '\n\n'
+
+
+async def iter_events(task_id, timeout, heartbeat_interval=15):
+    """
+    Yield the events of the task as SSE messages until the final one, or a timeout.
+    """
+    client = get_async_client()
+    pubsub = client.pubsub()
+    try:
+        # Subscribed before reading the stored final event, so no event is lost in between
+        await pubsub.subscribe(get_channel(task_id))
+        final_message = await client.get(get_final_event_key(task_id))
+        if final_message is not None:
+            yield format_sse(final_message.decode())
+            return
+
+        waited = 0
+        while waited < timeout:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat_interval)
+            if message is None:
+                waited += heartbeat_interval
+                # Comment line, keeps the proxies from closing an idle connection
+                yield ': heartbeat\n\n'
+                continue
+
+            data = message['data'].decode()
+            yield format_sse(data)
+            if json.loads(data)['type'] in FINAL_EVENTS:
+                return
+
+        yield format_sse(encode_event(ERROR, {'error': 'Timed out waiting for the submission result'}))
+    finally:
+        await pubsub.reset()
+        await client.close()
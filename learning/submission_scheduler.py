@@ -0,0 +1,106 @@
+"""
+Admission control of the code challenge submissions.
+
+- Every user has at most CODE_EVALUATION_MAX_IN_FLIGHT evaluations queued or running, the submissions above it are
+  rejected with a 429 response until one of them finishes.
+- A submission supersedes the previous one of the same user and step: when the evaluation of the older one starts,
+  it's dropped instead of run.
+- The learner attempts and the instructor dry-runs are sent to separate queues (lanes of CODE_EVALUATION_QUEUES),
+  consumed by separate workers, so a burst of one never delays the other.
+"""
+import uuid
+
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+
+LEARNER = 'learner'
+INSTRUCTOR = 'instructor'
+
+# Celery state of the evaluation tasks of the superseded submissions
+SUPERSEDED = 'SUPERSEDED'
+
+# Cleans up the counters of the evaluations whose worker was killed
+IN_FLIGHT_TIMEOUT = 10 * 60
+LATEST_SUBMISSION_TIMEOUT = 60 * 60
+
+
+def get_in_flight_key(user_id):
+    return f'code_evaluation_in_flight_{user_id}'
+
+
+def get_latest_submission_key(user_id, code_challenge_step_id):
+    return f'code_evaluation_latest_{user_id}_{code_challenge_step_id}'
+
+
+def get_queue(acting_role):
+    return settings.CODE_EVALUATION_QUEUES[acting_role]
+
+
+def acquire_slot(user_id):
+    """
+    :return: whether the user can submit another evaluation, in which case release_slot must be called once it ends
+    """
+    key = get_in_flight_key(user_id)
+    cache.add(key, 0, IN_FLIGHT_TIMEOUT)
+    try:
+        in_flight = cache.incr(key)
+    except ValueError:
+        # Expired in between
+        cache.add(key, 1, IN_FLIGHT_TIMEOUT)
+        return True
+
+    if in_flight > settings.CODE_EVALUATION_MAX_IN_FLIGHT:
+        release_slot(user_id)
+        return False
+    return True
+
+
+def release_slot(user_id):
+    key = get_in_flight_key(user_id)
+    try:
+        if cache.decr(key) < 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def get_in_flight_count(user_id):
+    return max(cache.get(get_in_flight_key(user_id), 0), 0)
+
+
+def start_submission(user_id, code_challenge_step_id):
+    """
+    :return: the id of the evaluation task to create, now the latest submission of the user for the step
+    """
+    task_id = str(uuid.uuid4())
+    cache.set(get_latest_submission_key(user_id, code_challenge_step_id), task_id, LATEST_SUBMISSION_TIMEOUT)
+    return task_id
+
+
+def get_superseding_task_id(user_id, code_challenge_step_id, task_id):
+    """
+    :return: the id of the task of a newer submission of the user for the step, if any
+    """
+    latest_task_id = cache.get(get_latest_submission_key(user_id, code_challenge_step_id))
+    if latest_task_id is not None and latest_task_id != task_id:
+        return latest_task_id
+    return None
+
+
+def get_queue_depths():
+    """
+    :return: the number of waiting evaluations and of consumers of every lane
+    """
+    depths = {}
+    with current_app.connection_for_read() as connection:
+        channel = connection.default_channel
+        for lane, queue in settings.CODE_EVALUATION_QUEUES.items():
+            try:
+                _, message_count, consumer_count = channel.queue_declare(queue=queue, passive=True)
+            except connection.channel_errors:
+                # Not declared yet, no worker consumed it
+                message_count, consumer_count = 0, 0
+                channel = connection.channel()
+            depths[lane] = {'queue': queue, 'depth': message_count, 'consumers': consumer_count}
+    return depths
@@ -1,36 +1,54 @@
-import time
-
-import requests
 from django.db import transaction
 from django.core.cache import cache
 
 from courses.models import CodeChallengeLessonStep
+from learning import submission_events, submission_scheduler
 from learning.api.serializers import CodeChallengeSubmissionSerializer
 from learning.models import CodeChallengeSubmission, TestResult, LearnerAssessmentStepPerformance
-from learning.utils import batch_queryset
 
-from celery import shared_task
-from courses import judge0_service
+from celery import shared_task, states, Task
+from celery.exceptions import Ignore, SoftTimeLimitExceeded
+from courses.executors import get_executor, ExecutionIncomplete, ExecutorError, COMPILATION_ERROR
 
 from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
+class EvaluationTask(Task):
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        # Frees the slot taken by the submission, see submission_scheduler.acquire_slot
+        if status != states.RETRY:
+            submission_scheduler.release_slot(kwargs.get('learner_id', args[2] if len(args) > 2 else None))
+
+
+@shared_task(bind=True, base=EvaluationTask, max_retries=3)
 def evaluate_code(self, code, code_challenge_step_id, learner_id, continue_on_error=False):
     """
-    Evaluates the code by sending batch submissions containing the test cases to the judge0 api.
+    Evaluates the code against the test cases with the executor of the CODE_EXECUTOR setting (Judge0 or local).
     Creates or updates related db objects: CodeChallengeSubmission and TestResult.
 
     :param self: celery param
     :param code: submission code string
     :param code_challenge_step_id: id of related CodeChallengeLessonStep object
     :param learner_id: id of related Learner object
-    :param continue_on_error: flag for continuing submission processing upon receiving a judge0 code execution error
-    :return: CodeChallengeSubmission object
+    :param continue_on_error: flag for continuing submission processing upon receiving a code execution error
+    :return: CodeChallengeSubmission object. When a newer submission superseded this one, the task ends in the
+        SUPERSEDED state with the id of the newer task instead.
     """
-    # create batches as max batch size for judge0 call is 20
+    superseding_task_id = submission_scheduler.get_superseding_task_id(learner_id, code_challenge_step_id,
+                                                                       self.request.id)
+    if superseding_task_id:
+        submission_events.publish_event(self.request.id, submission_events.ERROR, {
+            'error': 'Superseded by a newer submission',
+            'superseded_by': superseding_task_id,
+        })
+        self.update_state(state=submission_scheduler.SUPERSEDED, meta={'superseded_by': superseding_task_id})
+        # Ignore keeps the state, which would be replaced by SUCCESS on return, but skips after_return
+        submission_scheduler.release_slot(learner_id)
+        raise Ignore()
+
     code_challenge_step = cache.get(f'code_challenge_{code_challenge_step_id}')
     if not code_challenge_step:
         code_challenge_step = CodeChallengeLessonStep.objects.get(base_step_id=code_challenge_step_id)
@@ -48,95 +66,58 @@ def evaluate_code(self, code, code_challenge_step_id, learner_id, continue_on_er
         base_step_id=code_challenge_step_id
     )
 
-    batch_size = 20
-    batches = batch_queryset(test_cases, batch_size)
-    for batch in batches:
-        token_to_testresult_mapping = {}
-        submissions = []
-        test_results_batch = []
-        for test_case in batch:
-            test_result, created = TestResult.objects.get_or_create(
-                submission=code_challenge_submission,
-                test_case=test_case
-            )
-            test_results_batch.append(test_result)
-            submission = {
-                "source_code": code,
-                "language_id": code_challenge_step.language_id,
-                "stdin": test_case.input,
-                "expected_output": test_case.expected_output
-            }
-
-            submissions.append(submission)
-
-        batch_submission_response = judge0_service.submit_batch(submissions)
-        submission_tokens = [submission['token'] for submission in batch_submission_response]
-
-        for token, test_result in zip(submission_tokens, test_results_batch):
-            token_to_testresult_mapping[token] = test_result
-
-        # call judge0 api to check batch results (with the tokens)
-        # Set up a loop to poll the Judge0 API for the results
-        max_retries = 15
-        retries = 0
-        all_results_received = False
-        while not all_results_received and retries < max_retries:
-            tokens_to_remove = []
-            all_results_received = True
-
-            try:
-                result = judge0_service.get_batch_submission_result(submission_tokens)
-            except requests.HTTPError as e:
-                retries += 1
-                all_results_received = False
-                time.sleep(0.5)
-                continue
-
-            submissions = result.get('submissions', [])
-            for submission in submissions:
-                status = submission.get('status', {}).get('description', '')
-                if status not in ['In Queue', 'Processing']:
-                    token = submission.get('token', '')
-                    tokens_to_remove.append(token)
-                    test_result = token_to_testresult_mapping[token]
-                    test_result.status = status
-                    test_result.stdout = submission.get('stdout', None)
-                    test_result.stderr = submission.get('stderr', None)
-                    test_result.compile_err = submission.get('compile_output', None)
-                    if status == 'Accepted':
-                        test_result.passed = True
-                    else:
-                        test_result.passed = False
-                    test_result.save()
-
-                    if test_result.stderr or test_result.compile_err:
-                        code_challenge_submission.error_message = f"Error: {test_result.stderr or test_result.compile_err}"
-                        print(f"Error encountered: {code_challenge_submission.error_message}")
-                        if not continue_on_error:
-                            print("Stopping further processing due to error")
-
-                            code_challenge_submission.passed = False
-                            code_challenge_submission.save()
-
-                            if not (assessment_performance.passed or performance_created):
-                                assessment_performance.attempts += 1
-                            assessment_performance.save()
-
-                            return CodeChallengeSubmissionSerializer(code_challenge_submission).data
-                else:
-                    all_results_received = False  # Not all results are received, continue polling
-                    retries += 1
-                    break
-
-            submission_tokens = [token for token in submission_tokens if token not in tokens_to_remove]
-            print(f"Retries: {retries}")
-            print(f"Polling Judge0 API for results. Remaining tokens: {len(submission_tokens)}")
-            print(submission_tokens)
-
-            time.sleep(0.5)
-
-        if not all_results_received:
-            raise self.retry(countdown=1)
+    test_results = {test_case.id: TestResult.objects.get_or_create(
+        submission=code_challenge_submission,
+        test_case=test_case
+    )[0] for test_case in test_cases}
+
+    try:
+        results = get_executor().run(code, code_challenge_step.language_id, test_cases)
+        for test_case, execution_result in results:
+            test_result = test_results[test_case.id]
+            test_result.status = execution_result.status
+            test_result.stdout = execution_result.stdout
+            test_result.stderr = execution_result.stderr
+            test_result.compile_err = execution_result.compile_output
+            test_result.passed = execution_result.passed
+            test_result.save()
+            submission_events.publish_event(self.request.id, submission_events.TEST_RESULT, {
+                'test_case': test_result.test_case_id,
+                'status': test_result.status,
+                'passed': test_result.passed,
+            })
+
+            if execution_result.status == COMPILATION_ERROR:
+                # The code was compiled once for all the test cases, which are not run
+                TestResult.objects.filter(submission=code_challenge_submission).exclude(pk=test_result.pk).update(
+                    status=COMPILATION_ERROR, stdout=None, stderr=None, compile_err=None, passed=False)
+
+            if test_result.stderr or test_result.compile_err:
+                code_challenge_submission.error_message = f"Error: {test_result.stderr or test_result.compile_err}"
+                logger.info(f"Error encountered: {code_challenge_submission.error_message}")
+                # Nothing else to evaluate after a compilation error, whatever continue_on_error
+                if not continue_on_error or execution_result.status == COMPILATION_ERROR:
+                    results.close()
+                    code_challenge_submission.passed = False
+                    code_challenge_submission.save()
+
+                    if not (assessment_performance.passed or performance_created):
+                        assessment_performance.attempts += 1
+                    assessment_performance.save()
+
+                    return publish_verdict(self.request.id, code_challenge_submission)
+    except ExecutionIncomplete:
+        if self.request.retries >= self.max_retries:
+            submission_events.publish_event(self.request.id, submission_events.ERROR,
+                                            {'error': 'The code could not be evaluated, please try again'})
+        raise self.retry(countdown=1)
+    except SoftTimeLimitExceeded:
+        submission_events.publish_event(self.request.id, submission_events.ERROR,
+                                        {'error': 'The evaluation took too long, please try again'})
+        raise
+    except ExecutorError as e:
+        submission_events.publish_event(self.request.id, submission_events.ERROR, {'error': str(e)})
+        raise
 
     # At this point of execution all test cases have been processed without errors
     code_challenge_submission.error_message = None
@@ -155,4 +136,10 @@ def evaluate_code(self, code, code_challenge_step_id, learner_id, continue_on_er
         assessment_performance.passed = all_passed
     assessment_performance.save()
 
-    return CodeChallengeSubmissionSerializer(code_challenge_submission).data
+    return publish_verdict(self.request.id, code_challenge_submission)
+
+
+def publish_verdict(task_id, code_challenge_submission):
+    submission_data = CodeChallengeSubmissionSerializer(code_challenge_submission).data
+    submission_events.publish_event(task_id, submission_events.VERDICT, submission_data)
+    return submission_data
@@ -16,3 +16,11 @@ class DailyActiveUsersAnalyticsSerializer(serializers.ModelSerializer):
     class Meta:
         model = DailyActiveUsersAnalytics
         fields = ['date', 'active_users']
+
+
+class LessonStepsOrderSerializer(serializers.Serializer):
+    steps = serializers.ListField(child=serializers.UUIDField())
+
+
+class ChapterLessonsOrderSerializer(serializers.Serializer):
+    lessons = serializers.ListField(child=serializers.UUIDField())
@@ -1,20 +1,41 @@
 # courses/tests.py
+import io
+import os
+import shutil
+import smtplib
+import subprocess
+import tempfile
+import zipfile
 from datetime import date, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
 
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
+from PIL import Image
 from rest_framework.test import APITestCase, APIClient
 
-from learning.models import LearnerAssessmentStepPerformance, CodeChallengeSubmission
+from courses import course_archive, course_copy, remote_images, video_transcoding
+from courses.tasks import transcode_video
+from courses_project.testing import QueryBudgetMixin
+from learning.models import LearnerAssessmentStepPerformance, CodeChallengeSubmission, CourseEnrollment
 from teaching.models import DailyActiveUsersAnalytics, EngagementAnalytics
-from users.models import User
+from teaching.tasks import refresh_learner_course_cache
+from users.models import User, OutgoingEmail
+from users.tasks import send_outbox_emails
 from courses.models import Course, Category, Tag, Chapter, Lesson, BaseLessonStep, TextLessonStep, ProgrammingLanguage, \
-    QuizLessonStep, CodeChallengeLessonStep
+    QuizLessonStep, QuizChoice, CodeChallengeLessonStep, CodeChallengeTestCase, VideoLessonStep
 from django.core.cache import cache
 
 
-class CourseListCreateViewTest(APITestCase):
+class CourseListCreateViewTest(QueryBudgetMixin, APITestCase):
     def setUp(self):
         # Create a user and log them in
         self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
@@ -43,7 +64,8 @@ class CourseListCreateViewTest(APITestCase):
 
     def test_list_courses_with_nested_structure(self):
         # Make a GET request to the list endpoint
-        response = self.client.get(self.url)
+        with self.assertQueryBudget(7):
+            response = self.client.get(self.url)
 
         # Check that the response is 200 OK
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -73,7 +95,8 @@ class CourseListCreateViewTest(APITestCase):
         course_2 = Course.objects.create(instructor=self.user, title='Course 2', category=self.category)
 
         # Make a GET request to the list endpoint
-        response = self.client.get(self.url)
+        with self.assertQueryBudget(11):
+            response = self.client.get(self.url)
 
         # Check that the response is 200 OK.
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -471,3 +494,709 @@ class CourseAssessmentAnalyticsTest(APITestCase):
         self.assertEqual(code_challenge_stats[0]['total_attempts'], 1)
         self.assertEqual(code_challenge_stats[0]['total_learners'], 1)
         self.assertEqual(code_challenge_stats[0]['success_rate'], 100.0)
+
+
+class CourseReadinessTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1', intro='Short intro')
+        self.chapter = Chapter.objects.create(course=self.course, title='Chapter 1')
+        self.empty_chapter = Chapter.objects.create(course=self.course, title='Chapter 2')
+        self.lesson = Lesson.objects.create(chapter=self.chapter, title='Lesson 1', order=1)
+        self.empty_lesson = Lesson.objects.create(chapter=self.chapter, title='Lesson 2', order=2)
+        base_step = BaseLessonStep.objects.create(lesson=self.lesson, order=1)
+        QuizLessonStep.objects.create(base_step=base_step, question='Question')
+
+        self.url = reverse('course-readiness', kwargs={'course_id': self.course.id})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_readiness_report(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['ready'])
+        self.assertEqual(response.data['stats'], {'chapters_count': 2, 'lessons_count': 2,
+                                                  'assignment_steps_count': 1})
+
+        violations = {violation['code']: violation for violation in response.data['violations']}
+        self.assertEqual(set(violations), {'min_lessons', 'min_assignment_steps', 'empty_chapters', 'empty_lessons',
+                                           'missing_logo', 'short_intro', 'missing_category'})
+        self.assertEqual(violations['empty_chapters']['chapters'], [self.empty_chapter.id])
+        self.assertEqual(violations['empty_lessons']['lessons'], [self.empty_lesson.id])
+
+    def test_readiness_report_refreshed_on_structure_change(self):
+        self.client.get(self.url)
+        Lesson.objects.create(chapter=self.empty_chapter, title='Lesson 3', order=1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['stats']['lessons_count'], 3)
+        codes = [violation['code'] for violation in response.data['violations']]
+        self.assertNotIn('empty_chapters', codes)
+
+    def test_publish_course_reports_all_violations(self):
+        response = self.client.post(reverse('publish-course', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['errors']), 7)
+        self.assertEqual(response.data['detail'], response.data['errors'][0])
+
+        self.course.refresh_from_db()
+        self.assertFalse(self.course.active)
+
+
+class ReorderViewsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1')
+        self.chapter = Chapter.objects.create(course=self.course, title='Chapter 1')
+        self.lessons = [Lesson.objects.create(chapter=self.chapter, title=f'Lesson {i}', order=i) for i in range(1, 4)]
+        self.steps = [BaseLessonStep.objects.create(lesson=self.lessons[0], order=i) for i in range(1, 5)]
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_reorder_lesson_steps(self):
+        new_order = [self.steps[3].id, self.steps[0].id, self.steps[2].id, self.steps[1].id]
+        url = reverse('lesson-step-reorder', kwargs={'lesson_id': self.lessons[0].id})
+        response = self.client.put(url, {'steps': [str(step_id) for step_id in new_order]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.lessons[0].baselessonstep_set.values_list('id', flat=True)), new_order)
+
+    def test_reorder_refreshes_the_learner_course_cache(self):
+        cache.set(f'learner_course_{self.course.id}', {'chapters': []})
+        url = reverse('lesson-step-reorder', kwargs={'lesson_id': self.lessons[0].id})
+        response = self.client.put(url, {'steps': [str(step.id) for step in reversed(self.steps)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(f'learner_course_{self.course.id}'))
+
+        cache.set(f'learner_course_{self.course.id}', {'chapters': []})
+        url = reverse('lesson-reorder', kwargs={'chapter_id': self.chapter.id})
+        response = self.client.put(url, {'lessons': [str(lesson.id) for lesson in reversed(self.lessons)]},
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.get(f'learner_course_{self.course.id}'))
+
+    def test_reorder_invalid_body(self):
+        url = reverse('lesson-step-reorder', kwargs={'lesson_id': self.lessons[0].id})
+        for data in [[str(self.steps[0].id)], {'steps': ['not-an-id']}, {'steps': 'not-a-list'}]:
+            response = self.client.put(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reorder_lesson_steps_incomplete_list(self):
+        url = reverse('lesson-step-reorder', kwargs={'lesson_id': self.lessons[0].id})
+        response = self.client.put(url, {'steps': [str(self.steps[1].id), str(self.steps[0].id)]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(self.lessons[0].baselessonstep_set.values_list('order', flat=True)), [1, 2, 3, 4])
+
+    def test_reorder_chapter_lessons(self):
+        new_order = [self.lessons[2].id, self.lessons[1].id, self.lessons[0].id]
+        url = reverse('lesson-reorder', kwargs={'chapter_id': self.chapter.id})
+        response = self.client.put(url, {'lessons': [str(lesson_id) for lesson_id in new_order]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.chapter.lesson_set.values_list('id', flat=True)), new_order)
+
+    def test_delete_step_recalculates_order(self):
+        self.steps[1].delete()
+        self.assertEqual(list(self.lessons[0].baselessonstep_set.values_list('id', 'order')),
+                         [(self.steps[0].id, 1), (self.steps[2].id, 2), (self.steps[3].id, 3)])
+
+
+class CourseCopyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.category = Category.objects.create(name='Development')
+        self.course = Course.objects.create(instructor=self.user, title='Course 1', category=self.category,
+                                            active=True)
+        self.course.tags.set([Tag.objects.create(name='Python')])
+        for chapter_number in range(2):
+            chapter = Chapter.objects.create(course=self.course, title=f'Chapter {chapter_number}')
+            lesson = Lesson.objects.create(chapter=chapter, title='Lesson 1', order=1)
+            quiz = QuizLessonStep.objects.create(base_step=BaseLessonStep.objects.create(lesson=lesson, order=1),
+                                                 question='Question')
+            quiz.quizchoice_set.create(text='Answer', correct=True)
+            code_challenge = CodeChallengeLessonStep.objects.create(
+                base_step=BaseLessonStep.objects.create(lesson=lesson, order=2), title='Challenge')
+            code_challenge.test_cases.create(input='1', expected_output='1')
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_clone_course(self):
+        response = self.client.post(reverse('clone-course', kwargs={'course_id': self.course.id}),
+                                    {'title': 'Course 1, 2nd edition'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        clone = Course.objects.get(id=response.data['course_id'])
+        self.assertEqual(clone.title, 'Course 1, 2nd edition')
+        self.assertFalse(clone.active)
+        self.assertEqual(clone.category, self.category)
+        self.assertEqual(list(clone.tags.values_list('name', flat=True)), ['Python'])
+
+        self.assertEqual(list(clone.chapter_set.values_list('title', flat=True)), ['Chapter 0', 'Chapter 1'])
+        steps = BaseLessonStep.objects.filter(lesson__chapter__course=clone)
+        self.assertEqual(steps.count(), 4)
+        self.assertEqual(QuizLessonStep.objects.filter(base_step__in=steps, quizchoice__correct=True).count(), 2)
+        self.assertEqual(CodeChallengeLessonStep.objects.filter(base_step__in=steps,
+                                                                test_cases__expected_output='1').count(), 2)
+        # The source course is untouched
+        self.assertEqual(BaseLessonStep.objects.filter(lesson__chapter__course=self.course).count(), 4)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    @patch('courses.signals.transcode_video')
+    def test_clone_keeps_the_source_renditions(self, _):
+        lesson = Lesson.objects.filter(chapter__course=self.course).first()
+        video_step = VideoLessonStep.objects.create(base_step=BaseLessonStep.objects.create(lesson=lesson, order=3))
+        storage = video_step.poster.storage
+        manifest = storage.save(f'courses/videos/hls/{video_step.pk}/job/master.m3u8', ContentFile(b'#EXTM3U'))
+        poster = storage.save(f'courses/videos/posters/{video_step.pk}.jpg', ContentFile(b'poster'))
+        VideoLessonStep.objects.filter(pk=video_step.pk).update(
+            video_file='courses/videos/lecture.mp4', transcoding_source='courses/videos/lecture.mp4',
+            transcoding_status=VideoLessonStep.TranscodingStatus.READY, hls_manifest=manifest, poster=poster)
+
+        clone = course_copy.clone_course(self.course.id, self.user.id)
+        cloned_steps = VideoLessonStep.objects.filter(base_step__lesson__chapter__course=clone)
+        with self.captureOnCommitCallbacks(execute=True):
+            cloned_step = cloned_steps.get()
+            cloned_step.video_file = SimpleUploadedFile('other.mp4', b'other video', content_type='video/mp4')
+            cloned_step.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('video-step-retrieve-update-destroy', kwargs={'pk': cloned_step.pk}))
+        self.assertFalse(cloned_steps.exists())
+
+        self.assertTrue(storage.exists(manifest))
+        self.assertTrue(storage.exists(poster))
+
+        # Deleted with the last step using them
+        video_step.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            video_step.delete()
+        self.assertFalse(storage.exists(manifest))
+        self.assertFalse(storage.exists(poster))
+
+    def test_clone_other_instructor_course(self):
+        other_user = User.objects.create_user('other@test.com', 'password', 'Other', 'User')
+        self.client.force_authenticate(user=other_user)
+        response = self.client.post(reverse('clone-course', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_import_course(self):
+        response = self.client.get(reverse('export-course', kwargs={'course_id': self.course.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        archive = SimpleUploadedFile('course.zip', b''.join(response.streaming_content),
+                                     content_type='application/zip')
+
+        response = self.client.post(reverse('import-course'), {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        imported = Course.objects.get(id=response.data['course_id'])
+        self.assertEqual(imported.title, 'Course 1')
+        self.assertFalse(imported.active)
+        self.assertEqual(imported.category, self.category)
+        self.assertEqual(list(imported.chapter_set.values_list('title', flat=True)), ['Chapter 0', 'Chapter 1'])
+        steps = BaseLessonStep.objects.filter(lesson__chapter__course=imported)
+        self.assertEqual(sorted(steps.values_list('lesson__chapter__title', 'order')),
+                         [('Chapter 0', 1), ('Chapter 0', 2), ('Chapter 1', 1), ('Chapter 1', 2)])
+        self.assertEqual(QuizLessonStep.objects.filter(base_step__in=steps, quizchoice__correct=True).count(), 2)
+        self.assertEqual(CodeChallengeLessonStep.objects.filter(base_step__in=steps,
+                                                                test_cases__expected_output='1').count(), 2)
+
+    def test_import_invalid_archive(self):
+        archive = SimpleUploadedFile('course.zip', b'not a zip', content_type='application/zip')
+        response = self.client.post(reverse('import-course'), {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def import_modified_archive(self, modify):
+        records = list(course_archive.iter_archive_records(self.course.id))
+        modify(records)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr(course_archive.ARCHIVE_ENTRY_NAME,
+                             b''.join(course_archive.encode_line(record) for record in records))
+        archive = SimpleUploadedFile('course.zip', buffer.getvalue(), content_type='application/zip')
+        return self.client.post(reverse('import-course'), {'archive': archive}, format='multipart')
+
+    def test_import_invalid_rows(self):
+        def set_course_value(name, value):
+            return lambda records: records[1]['data'].update({name: value})
+
+        def set_row_value(model, name, value):
+            def modify(records):
+                next(record for record in records if record.get('model') == model)['data'][name] = value
+            return modify
+
+        def duplicate_step_order(records):
+            first, *others = [record['data'] for record in records if record.get('model') == 'baselessonstep']
+            next(step for step in others if step['lesson_id'] == first['lesson_id'])['order'] = first['order']
+
+        for modify in [set_course_value('price', -10), set_course_value('title', 'x' * 101),
+                       set_row_value('chapter', 'title', 'x' * 101),
+                       set_row_value('lesson', 'chapter_id', ['not', 'an', 'id']),
+                       set_row_value('quizchoice', 'correct', 'maybe'), duplicate_step_order]:
+            response = self.import_modified_archive(modify)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Course.objects.count(), 1)
+
+    def test_import_foreign_media(self):
+        own_image = 'courses/images/own/logo.png'
+        Course.objects.filter(id=self.course.id).update(image=own_image)
+
+        response = self.import_modified_archive(lambda records: None)
+        self.assertEqual(Course.objects.get(id=response.data['course_id']).image.name, own_image)
+
+        # Another file of the bucket is not attached to the imported course
+        response = self.import_modified_archive(
+            lambda records: records[1]['data'].update(image='users/pictures/someone-else.png'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Course.objects.get(id=response.data['course_id']).image.name, 'courses/images/default.jpg')
+
+
+class LessonStepsSaveTest(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1')
+        self.chapter = Chapter.objects.create(course=self.course, title='Chapter 1')
+        self.lesson = Lesson.objects.create(chapter=self.chapter, title='Lesson 1', order=1)
+        self.text_step = TextLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=1), text='Some text')
+        self.quiz_step = QuizLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=2), question='Question')
+        self.kept_choice = self.quiz_step.quizchoice_set.create(text='Kept', correct=True)
+        self.quiz_step.quizchoice_set.create(text='Removed', correct=False)
+        self.removed_step = TextLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=3), text='Removed')
+
+        self.url = reverse('lesson-retrieve-update-destroy', kwargs={'pk': self.lesson.id})
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_save_lesson_steps(self):
+        data = {
+            'title': 'Lesson 1',
+            'lesson_steps': [
+                {'id': str(self.quiz_step.base_step_id), 'type': 'quiz', 'order': 1, 'question': 'New question',
+                 'quiz_choices': [{'id': str(self.kept_choice.id), 'text': 'Kept', 'correct': True},
+                                  {'text': 'Added', 'correct': False}]},
+                {'id': str(self.text_step.base_step_id), 'type': 'text', 'order': 2, 'text': 'Some text'},
+                {'id': 'new-step', 'type': 'text', 'order': 3, 'text': 'New text'},
+            ]
+        }
+        response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        steps = list(self.lesson.baselessonstep_set.all())
+        self.assertEqual([step.order for step in steps], [1, 2, 3])
+        self.assertEqual(steps[0].id, self.quiz_step.base_step_id)
+        self.assertEqual(steps[0].quiz_step.question, 'New question')
+        self.assertEqual(steps[1].id, self.text_step.base_step_id)
+        self.assertEqual(steps[2].text_step.text, 'New text')
+        self.assertFalse(BaseLessonStep.objects.filter(id=self.removed_step.base_step_id).exists())
+
+        # The unchanged choice keeps its id
+        choices = {choice.text: choice.id for choice in self.quiz_step.quizchoice_set.all()}
+        self.assertEqual(set(choices), {'Kept', 'Added'})
+        self.assertEqual(choices['Kept'], self.kept_choice.id)
+
+    @patch('teaching.tasks.refresh_learner_course_cache.apply_async')
+    def test_save_lesson_steps_refreshes_the_learner_course_cache_once(self, apply_async):
+        # Scheduled by the creation of the steps in setUp
+        refresh_learner_course_cache(str(self.course.id))
+        cache.set(f'learner_course_{self.course.id}', {'title': 'Stale'})
+        data = {'title': 'Lesson 1', 'lesson_steps': [
+            {'id': str(self.quiz_step.base_step_id), 'type': 'quiz', 'order': 1, 'question': 'New question',
+             'quiz_choices': [{'id': str(self.kept_choice.id), 'text': 'Kept', 'correct': True}]},
+            {'id': 'new-step', 'type': 'quiz', 'order': 2, 'question': 'Another question', 'quiz_choices': []},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(self.url, data, format='json')
+            self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertIsNone(cache.get(f'learner_course_{self.course.id}'))
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.args[0], (str(self.course.id),))
+
+        # Every edit made after the refresh started schedules another one
+        refresh_learner_course_cache(str(self.course.id))
+        self.assertEqual(cache.get(f'learner_course_{self.course.id}')['title'], 'Course 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.url, data, format='json')
+        self.assertEqual(apply_async.call_count, 2)
+
+    def test_save_many_lesson_steps(self):
+        language = ProgrammingLanguage.objects.create(id=71, name='Python')
+        for order in range(4, 24):
+            quiz_step = QuizLessonStep.objects.create(
+                base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=order), question=f'Question {order}')
+            quiz_step.quizchoice_set.create(text='Choice', correct=True)
+            code_step = CodeChallengeLessonStep.objects.create(
+                base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=order + 20), title=f'Code {order}',
+                language=language)
+            code_step.test_cases.create(input='1', expected_output='1')
+
+        steps = self.client.get(self.url).data['lesson_steps']
+        for step in steps:
+            if step['type'] == 'quiz':
+                step['question'] += '?'
+                step['quiz_choices'] = [{**choice, 'text': 'Edited'} for choice in step['quiz_choices']]
+            elif step['type'] == 'codechallenge':
+                step['test_cases'].append({'input': '2', 'expected_output': '2'})
+        # The removed step is deleted
+        steps = [step for step in steps if step['id'] != str(self.removed_step.base_step_id)]
+        steps += [{'id': f'new-{index}', 'type': 'quiz', 'question': f'New {index}',
+                   'quiz_choices': [{'text': 'Added', 'correct': True}]} for index in range(20)]
+        steps += [{'id': f'new-code-{index}', 'type': 'codechallenge', 'title': f'New {index}', 'language_id': 71,
+                   'test_cases': [{'input': '1', 'expected_output': '1'}]} for index in range(20)]
+
+        # Validation, saving and response: every model is read once and written by bulk queries, whatever the number
+        # of steps and children
+        with self.assertQueryBudget(40):
+            response = self.client.put(self.url, {'title': 'Lesson 1', 'lesson_steps': steps}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['lesson_steps']), 82)
+
+        self.assertEqual(self.lesson.baselessonstep_set.count(), 82)
+        self.assertFalse(BaseLessonStep.objects.filter(id=self.removed_step.base_step_id).exists())
+        choices = QuizChoice.objects.filter(quiz__base_step__lesson=self.lesson)
+        self.assertEqual({choice.text for choice in choices}, {'Edited', 'Added'})
+        self.assertEqual(choices.count(), 42)
+        self.assertEqual(CodeChallengeTestCase.objects.filter(code_challenge_step__base_step__lesson=self.lesson)
+                         .count(), 60)
+
+    def test_save_test_case_inputs(self):
+        language = ProgrammingLanguage.objects.create(id=71, name='Python')
+        code_step = CodeChallengeLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=4), title='Challenge', language=language)
+        first = code_step.test_cases.create(input='1', expected_output='1')
+        second = code_step.test_cases.create(input='2', expected_output='4')
+
+        def save(test_cases):
+            step = {'id': str(code_step.base_step_id), 'type': 'codechallenge', 'title': 'Challenge',
+                    'language_id': language.id, 'test_cases': test_cases}
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(self.url, {'title': 'Lesson 1', 'lesson_steps': [step]}, format='json')
+            # The test transaction is never committed, the deferred constraints are checked here
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+            return response
+
+        # The input of a new test case was used by another one before the save
+        response = save([{'id': first.id, 'input': '3', 'expected_output': '9'},
+                         {'id': second.id, 'input': '2', 'expected_output': '4'},
+                         {'input': '1', 'expected_output': '1'}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(code_step.test_cases.values_list('input', flat=True)), ['1', '2', '3'])
+
+        # Swapped inputs
+        response = save([{'id': first.id, 'input': '2', 'expected_output': '4'},
+                         {'id': second.id, 'input': '3', 'expected_output': '9'}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(code_step.test_cases.values_list('id', 'input')), [(first.id, '2'), (second.id, '3')])
+
+        response = save([{'input': '1', 'expected_output': '1'}, {'input': '1', 'expected_output': '2'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_save_lesson_steps_unknown_step(self):
+        data = {'title': 'Lesson 1', 'lesson_steps': [
+            {'id': '3def5c73-e3dc-4435-8c53-57e459c00ae5', 'type': 'text', 'order': 1, 'text': 'Some text'}]}
+        response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.lesson.baselessonstep_set.count(), 3)
+
+
+@patch('courses.api.mixins.ingest_remote_image')
+class CourseRemoteImageTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1')
+        self.url = reverse('course-retrieve-update-destroy', kwargs={'pk': self.course.id})
+        self.image_url = 'https://images.example.com/courses/logo.png'
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_image_url_is_ingested_after_the_update(self, ingest_remote_image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'title': 'New title', 'image': self.image_url}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.title, 'New title')
+        # The current image is kept until the new one is downloaded
+        self.assertEqual(self.course.image.name, 'courses/images/default.jpg')
+        ingest_remote_image.delay.assert_called_once_with('courses.course', str(self.course.id), 'image',
+                                                          self.image_url)
+
+    def test_unchanged_image_url_is_skipped(self, ingest_remote_image):
+        image = self.client.get(self.url).data['image']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'image': image}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ingest_remote_image.delay.assert_not_called()
+
+    def test_invalid_image_url(self, ingest_remote_image):
+        response = self.client.patch(self.url, {'image': 'file:///etc/passwd'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        ingest_remote_image.delay.assert_not_called()
+
+    @staticmethod
+    def get_png():
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    @patch('courses.remote_images.download_image')
+    def test_uploaded_image_replaces_the_pending_url(self, download_image, ingest_remote_image):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'image': self.image_url}, format='json')
+        image = SimpleUploadedFile('logo.png', self.get_png(), content_type='image/png')
+        response = self.client.patch(self.url, {'image': image}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The download queued before the upload doesn't overwrite it
+        self.course.refresh_from_db()
+        self.assertFalse(remote_images.ingest_remote_image(self.course, 'image', self.image_url))
+        download_image.assert_not_called()
+
+    @patch('courses.remote_images.requests.get')
+    def test_malformed_content_length(self, get, ingest_remote_image):
+        response = get.return_value.__enter__.return_value
+        response.status_code = 200
+        response.headers = {'Content-Type': 'image/png', 'Content-Length': 'unknown'}
+        response.iter_content.return_value = [self.get_png()]
+
+        file, filename = remote_images.download_image(self.image_url)
+        with file:
+            self.assertEqual(filename, 'logo.png')
+
+
+class VideoTranscodingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser@test.com', 'password', 'Test', 'User')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.course = Course.objects.create(instructor=self.user, title='Course 1')
+        self.chapter = Chapter.objects.create(course=self.course, title='Chapter 1')
+        self.lesson = Lesson.objects.create(chapter=self.chapter, title='Lesson 1', order=1)
+        self.video_step = VideoLessonStep.objects.create(
+            base_step=BaseLessonStep.objects.create(lesson=self.lesson, order=1), title='Video')
+        self.url = reverse('video-step-retrieve-update-destroy', kwargs={'pk': self.video_step.pk})
+
+    def tearDown(self):
+        cache.clear()
+
+    def upload_video(self, content=b'not a video'):
+        self.video_step.video_file = SimpleUploadedFile('lecture.mp4', content, content_type='video/mp4')
+        self.video_step.save()
+
+    @patch('courses.signals.transcode_video')
+    def test_new_video_is_queued(self, transcode_video):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_video()
+
+        self.video_step.refresh_from_db()
+        self.assertEqual(self.video_step.transcoding_status, VideoLessonStep.TranscodingStatus.PENDING)
+        self.assertEqual(self.video_step.transcoding_source, self.video_step.video_file.name)
+        transcode_video.delay.assert_called_once_with(str(self.video_step.pk), self.video_step.video_file.name)
+
+        # Other changes of the step don't transcode the same file again
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video_step.title = 'New title'
+            self.video_step.save()
+        transcode_video.delay.assert_called_once()
+
+    def test_manifest_is_returned_when_ready(self):
+        self.upload_video()
+        response = self.client.get(self.url)
+        self.assertIsNone(response.data['hls_manifest'])
+
+        VideoLessonStep.objects.filter(pk=self.video_step.pk).update(
+            transcoding_status=VideoLessonStep.TranscodingStatus.READY,
+            hls_manifest=f'courses/videos/hls/{self.video_step.pk}/job/master.m3u8', duration=timedelta(seconds=90.5))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['hls_manifest'].endswith('/job/master.m3u8'))
+        self.assertEqual(response.data['duration'], 90.5)
+
+    @override_settings(FFPROBE_BINARY='missing-ffprobe', CELERY_TASK_ALWAYS_EAGER=True)
+    def test_failed_transcoding(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_video()
+
+        self.video_step.refresh_from_db()
+        self.assertEqual(self.video_step.transcoding_status, VideoLessonStep.TranscodingStatus.FAILED)
+        self.assertIsNone(self.video_step.hls_manifest)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    @patch('courses.tasks.video_transcoding.transcode_video', side_effect=OSError('The storage is not reachable'))
+    def test_unexpected_transcoding_error(self, _):
+        with self.assertLogs('courses.tasks', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            self.upload_video()
+
+        self.video_step.refresh_from_db()
+        self.assertEqual(self.video_step.transcoding_status, VideoLessonStep.TranscodingStatus.FAILED)
+
+    @patch('courses.tasks.video_transcoding.transcode_video', side_effect=SoftTimeLimitExceeded())
+    @patch('courses.signals.transcode_video')
+    def test_transcoding_time_limit(self, *_):
+        self.upload_video()
+
+        # Raised again, for the worker to record the timeout
+        with self.assertRaises(SoftTimeLimitExceeded):
+            transcode_video(str(self.video_step.pk), self.video_step.video_file.name)
+        self.video_step.refresh_from_db()
+        self.assertEqual(self.video_step.transcoding_status, VideoLessonStep.TranscodingStatus.FAILED)
+
+    @patch('courses.video_transcoding.run')
+    def test_unexpected_probe_output(self, run):
+        for output in [b'not json', b'{"streams": [{"codec_type": "video"}]}', b'[]']:
+            run.return_value.stdout = output
+            with self.assertRaises(video_transcoding.TranscodingError):
+                video_transcoding.probe('lecture.mp4')
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    @patch('courses.signals.transcode_video')
+    def test_replaced_renditions_are_deleted(self, _):
+        self.upload_video()
+        storage = self.video_step.video_file.storage
+        prefix = f'courses/videos/hls/{self.video_step.pk}/job'
+        names = [storage.save(f'{prefix}/{name}', ContentFile(b'#EXTM3U'))
+                 for name in ['master.m3u8', '0/index.m3u8', '0/segment_000.ts']]
+        poster = storage.save(f'courses/videos/posters/{self.video_step.pk}.jpg', ContentFile(b'poster'))
+        VideoLessonStep.objects.filter(pk=self.video_step.pk).update(
+            transcoding_status=VideoLessonStep.TranscodingStatus.READY, hls_manifest=names[0], poster=poster)
+
+        # The step was loaded before the transcoding finished
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_video(b'another video')
+
+        for name in names + [poster]:
+            self.assertFalse(storage.exists(name))
+
+    @skipUnless(shutil.which('ffmpeg') and shutil.which('ffprobe'), 'ffmpeg is not installed')
+    def test_transcoding(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, 'lecture.mp4')
+            subprocess.run(['ffmpeg', '-y', '-f', 'lavfi', '-i', 'testsrc=duration=3:size=640x480:rate=25',
+                            '-f', 'lavfi', '-i', 'sine=duration=3', '-shortest', path], capture_output=True, check=True)
+            with open(path, 'rb') as video:
+                content = video.read()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload_video(content)
+
+        self.video_step.refresh_from_db()
+        self.assertEqual(self.video_step.transcoding_status, VideoLessonStep.TranscodingStatus.READY)
+        self.assertAlmostEqual(self.video_step.duration.total_seconds(), 3, delta=0.5)
+        self.assertTrue(self.video_step.poster)
+        with self.video_step.video_file.storage.open(self.video_step.hls_manifest) as manifest:
+            # Only the renditions up to the source height
+            self.assertEqual(manifest.read().decode().count('#EXT-X-STREAM-INF'), 1)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class NotifyEnrolledLearnersTest(APITestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor@test.com', 'password', 'Test', 'Instructor')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.instructor)
+        self.course = Course.objects.create(instructor=self.instructor, title='Course 1')
+        for index in range(3):
+            learner = User.objects.create_user(f'learner{index}@test.com', 'password', 'Test', 'Learner')
+            CourseEnrollment.objects.create(course=self.course, learner=learner)
+        dropped = User.objects.create_user('dropped@test.com', 'password', 'Test', 'Learner')
+        CourseEnrollment.objects.create(course=self.course, learner=dropped, active=False)
+
+        self.url = reverse('notify-enrolled-learners', kwargs={'course_id': self.course.id})
+        self.data = {'subject': 'New chapter', 'message': 'A new chapter is available.'}
+
+    def tearDown(self):
+        cache.clear()
+
+    def notify(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response
+
+    def test_notify_enrolled_learners(self):
+        with patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            response = self.notify()
+
+        self.assertEqual(response.data['queued'], 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['learner0@test.com', 'learner1@test.com', 'learner2@test.com'])
+        self.assertEqual(mail.outbox[0].subject, 'Course 1: New chapter')
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.Status.SENT).count(), 3)
+        # A single connection for the batch
+        open_connection.assert_called_once()
+
+    def test_notify_enrolled_learners_invalid_subject(self):
+        for subject in ['x' * 254, 'New chapter\r\nBcc: everyone@test.com']:
+            response = self.client.post(self.url, {**self.data, 'subject': subject}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_notify_enrolled_learners_not_instructor(self):
+        self.client.force_authenticate(user=User.objects.get(email='learner0@test.com'))
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_emails_are_retried(self):
+        send_messages = mail.get_connection().send_messages
+
+        def fail_for_learner1(messages):
+            # As the SMTP backend, the messages before the failing one are sent
+            for message in messages:
+                if message.to == ['learner1@test.com']:
+                    raise smtplib.SMTPRecipientsRefused({'learner1@test.com': (550, b'Unknown user')})
+                send_messages([message])
+            return len(messages)
+
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=fail_for_learner1):
+            self.notify()
+
+        # Each learner received the email once
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['learner0@test.com', 'learner2@test.com'])
+        failed = OutgoingEmail.objects.get(to_email='learner1@test.com')
+        self.assertEqual(failed.status, OutgoingEmail.Status.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.send_after, timezone.now())
+
+    @override_settings(MAIL_OUTBOX_RATE_LIMIT=2)
+    @patch('users.tasks.send_outbox_emails.apply_async')
+    def test_rate_limit(self, apply_async):
+        # Runs the first drain, not the one continuing it
+        apply_async.side_effect = lambda *args, **kwargs: (
+            None if kwargs.get('countdown') else send_outbox_emails.apply())
+        self.notify()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.Status.PENDING).count(), 1)
+        # Continued in the next minute
+        apply_async.assert_called_with(countdown=60)
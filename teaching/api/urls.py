@@ -13,7 +13,9 @@ urlpatterns = [
          name='chapter-retrieve-update-destroy'),
 
     path('chapters/<uuid:chapter_id>/lessons/', views.LessonListCreateView.as_view(), name='lesson-list-create'),
+    path('chapters/<uuid:chapter_id>/lessons/order/', views.reorder_chapter_lessons, name='lesson-reorder'),
     path('lessons/<uuid:pk>/', views.LessonRetrieveUpdateDestroyView.as_view(), name='lesson-retrieve-update-destroy'),
+    path('lessons/<uuid:lesson_id>/steps/order/', views.reorder_lesson_steps, name='lesson-step-reorder'),
 
     path('lessons/<uuid:lesson_id>/text-steps/', views.TextLessonStepListCreateView.as_view(),
          name='text-step-list-create'),
@@ -56,5 +58,11 @@ urlpatterns = [
     path('analytics/<uuid:course_id>/assessments/', views.get_course_assessments_analytics,
          name='assessments-analytics'),
 
+    path('courses/import/', views.import_course_archive, name='import-course'),
+    path('courses/<uuid:course_id>/export/', views.export_course, name='export-course'),
+    path('courses/<uuid:course_id>/clone/', views.clone_course, name='clone-course'),
+    path('courses/clone/<str:task_id>/', views.get_clone_course_status, name='clone-course-status'),
+    path('courses/<uuid:course_id>/readiness/', views.get_course_readiness, name='course-readiness'),
     path('courses/<uuid:course_id>/publish/', views.publish_course, name='publish-course'),
+    path('courses/<uuid:course_id>/notify/', views.notify_enrolled_learners, name='notify-enrolled-learners'),
 ]
@@ -1,9 +1,15 @@
 import json
+import uuid
+
+from celery import states
+from celery.result import AsyncResult
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.db.models import F, Count, Avg, Max
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import generics, status, serializers
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.generics import get_object_or_404
 from rest_framework import parsers
 from rest_framework.permissions import IsAuthenticated
@@ -13,15 +19,23 @@ from django.db.models.functions import TruncDate
 from datetime import datetime, timedelta
 
 from courses import cache_utils
+from courses.signals import lesson_steps_changed
+from courses.course_archive import iter_course_archive, import_course, CourseArchiveError
+from courses_project.db_routers import replica_safe
 from learning.models import CourseEnrollment
 from courses.api.serializers import CourseSerializer, ChapterSerializer, LessonSerializer
 from courses.api.lesson_steps_serializers import TextLessonStepSerializer, \
     QuizLessonStepSerializer, QuizChoiceSerializer, VideoLessonStepSerializer, CodeChallengeLessonStepSerializer, \
     CodeChallengeTestCaseSerializer
-from .serializers import CourseEnrollmentSerializer, DailyActiveUsersAnalyticsSerializer
+from .serializers import CourseEnrollmentSerializer, DailyActiveUsersAnalyticsSerializer, LessonStepsOrderSerializer, \
+    ChapterLessonsOrderSerializer
 from courses.models import Course, Chapter, Lesson, TextLessonStep, QuizLessonStep, QuizChoice, VideoLessonStep, \
-    BaseLessonStep, CodeChallengeLessonStep, CodeChallengeTestCase
+    BaseLessonStep, CodeChallengeLessonStep, CodeChallengeTestCase, apply_order
 from ..analytics import CourseAssessmentAnalytics
+from ..readiness import CourseReadiness
+from ..tasks import clone_course as clone_course_task, schedule_learner_course_cache_refresh
+from users.mail_outbox import queue_emails
+from users.models import OutgoingEmail
 from ..models import CourseCompletionAnalytics, DailyActiveUsersAnalytics, EngagementAnalytics
 
 
@@ -134,6 +148,7 @@ class LessonRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         context['lesson'] = self.get_object()  # Ensure 'lesson' is included in the context
         return context
 
+    @transaction.atomic
     def perform_update(self, serializer):
         lesson = self.get_object()
         chapter = lesson.chapter
@@ -212,6 +227,7 @@ class BaseLessonStepRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIV
         pk = self.kwargs['pk']
         return get_object_or_404(self.get_queryset(), base_step__id=pk)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         lesson_step = self.get_object()
         base_lesson_step = lesson_step.base_step
@@ -224,30 +240,65 @@ class BaseLessonStepRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIV
                 base_lesson_step.save()
                 serializer.save()
                 return
-            elif new_order > len(all_lesson_steps):
+            elif new_order > all_lesson_steps.count():
                 raise serializers.ValidationError(
                     {"order": "Order value cannot be bigger than the total number of lesson steps in the lesson"}
                 )
             else:
                 if new_order > order:
-                    affected_lesson_steps = list(
-                        filter(lambda x: order < x.order <= new_order, all_lesson_steps))
-                    for step in affected_lesson_steps:
-                        step.order = step.order - 1
-                        step.save()
-                    base_lesson_step.order = new_order
+                    affected_lesson_steps = all_lesson_steps.filter(order__gt=order, order__lte=new_order)
+                    affected_lesson_steps.update(order=F('order') - 1)
                 else:
-                    affected_lesson_steps = list(
-                        filter(lambda x: new_order <= x.order < order, all_lesson_steps))
-                    for step in affected_lesson_steps:
-                        step.order = step.order + 1
-                        step.save()
-                    base_lesson_step.order = new_order
+                    affected_lesson_steps = all_lesson_steps.filter(order__gte=new_order, order__lt=order)
+                    affected_lesson_steps.update(order=F('order') + 1)
+                base_lesson_step.order = new_order
 
         base_lesson_step.save()
         serializer.save()
 
 
+def reorder_items(items, ordered_ids, field_name):
+    """
+    Apply the complete desired order of `items` given as a list of their ids, in one bulk UPDATE.
+    """
+    items_by_id = {str(item.id): item for item in items}
+    ordered_ids = [str(item_id) for item_id in ordered_ids]
+    if len(set(ordered_ids)) != len(ordered_ids) or set(ordered_ids) != set(items_by_id):
+        raise serializers.ValidationError(
+            {field_name: "The list must contain every item exactly once."})
+    apply_order([items_by_id[item_id] for item_id in ordered_ids])
+    return ordered_ids
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+@transaction.atomic
+def reorder_lesson_steps(request, lesson_id):
+    # Locking the lesson serializes concurrent reorders of its steps
+    lesson = get_object_or_404(Lesson.objects.select_for_update(of=('self',)).select_related('chapter'),
+                               id=lesson_id, chapter__course__instructor=request.user)
+    serializer = LessonStepsOrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    steps = reorder_items(lesson.baselessonstep_set.all(), serializer.validated_data['steps'], 'steps')
+    # The steps are updated in bulk, without their save signals
+    lesson_steps_changed.send(sender=Lesson, lesson=lesson)
+    return Response({'steps': steps})
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+@transaction.atomic
+def reorder_chapter_lessons(request, chapter_id):
+    chapter = get_object_or_404(Chapter.objects.select_for_update(of=('self',)), id=chapter_id,
+                                course__instructor=request.user)
+    serializer = ChapterLessonsOrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    lessons = reorder_items(chapter.lesson_set.all(), serializer.validated_data['lessons'], 'lessons')
+    # The lessons are updated in bulk, without their save signals
+    schedule_learner_course_cache_refresh(chapter.course_id)
+    return Response({'lessons': lessons})
+
+
 class TextLessonStepListCreateView(BaseLessonStepListCreateView):
     serializer_class = TextLessonStepSerializer
 
@@ -430,67 +481,86 @@ class CourseEnrolledLearnersListView(generics.ListAPIView):
         return CourseEnrollment.objects.filter(course=course)
 
 
-@api_view(['POST'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def publish_course(request, course_id):
+def export_course(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
 
-    chapters = course.chapter_set.all()
+    response = StreamingHttpResponse(iter_course_archive(course.id), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="course-{course.id}.zip"'
+    return response
 
-    # Course should have at least 2 chapters, 10 lessons
-    # and 10 assignment steps (quiz, code challenge, sorting problem, text problem)
-    if chapters.count() < 2:
-        return Response({'detail': 'The course must have at least 2 chapters to be published'},
-                        status=status.HTTP_400_BAD_REQUEST)
 
-    lessons = Lesson.objects.filter(chapter__course=course)
-    if lessons.count() < 10:
-        return Response({'detail': 'The course must have at least 10 lessons to be published'},
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([parsers.MultiPartParser])
+def import_course_archive(request):
+    archive = request.FILES.get('archive')
+    if not archive:
+        return Response({'detail': 'The course archive must be uploaded in the archive field'},
                         status=status.HTTP_400_BAD_REQUEST)
 
-    assignment_steps = BaseLessonStep.objects.filter(lesson__chapter__course=course).exclude(
-        text_problem_step=None, quiz_step=None, code_challenge_step=None, sorting_problem_step=None)
-    if assignment_steps.count() < 10:
-        return Response({'detail': 'The course must have at least 10 assignment steps to be published'},
-                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        course = import_course(archive, request.user.id)
+    except CourseArchiveError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Course should not have empty modules (chapters without lessons)
-    empty_chapters = chapters.filter(lesson=None)
-    if empty_chapters.exists():
-        return Response({
-            'detail': 'Course has empty chapters. Please add lessons to all chapters or remove the empty chapters before publishing.'},
-            status=status.HTTP_400_BAD_REQUEST)
-
-    # Course should not have empty lessons (lessons without lesson steps)
-    empty_lessons = lessons.filter(baselessonstep=None)
-    if empty_lessons.exists():
-        return Response({
-            'detail': 'Course has empty lessons. Please add lesson steps to all lessons or remove the empty lessons before publishing.'},
-            status=status.HTTP_400_BAD_REQUEST)
-
-    # All videos in video steps should have a video URL
-    video_steps = VideoLessonStep.objects.filter(base_step__lesson__chapter__course=course)
-    for step in video_steps:
-        if not step.video_file:
-            return Response({
-                'detail': 'All video steps should have a video URL before publishing the course'},
-                status=status.HTTP_400_BAD_REQUEST)
-
-    # Logo is uploaded (not default image)
-    if not course.image or course.image.name == 'courses/images/default.jpg':
-        return Response({'detail': 'Course logo must be uploaded before publishing the course'},
-                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'course_id': str(course.id)}, status=status.HTTP_201_CREATED)
+
+
+CLONE_TASK_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def clone_course(request, course_id):
+    instructor = request.user
+    course = get_object_or_404(Course, id=course_id, instructor=instructor)
+
+    new_course_id = str(uuid.uuid4())
+    task = clone_course_task.delay(str(course.id), instructor.id, new_course_id, request.data.get('title'))
+    # Only the instructor who started the clone can follow it
+    cache.set(f'course_clone_{task.id}', instructor.id, timeout=CLONE_TASK_CACHE_TIMEOUT)
+
+    return Response({'token': str(task.id), 'course_id': new_course_id}, status=status.HTTP_202_ACCEPTED)
 
-    # Intro is more than 100 chars long
-    if len(course.intro) < 100:
-        return Response({'detail': 'Course summary should be at least 100 characters long'},
-                        status=status.HTTP_400_BAD_REQUEST)
 
-    # Category must be set
-    if not course.category:
-        return Response({'detail': 'Category must be set for the course before publishing'},
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_clone_course_status(request, task_id):
+    if cache.get(f'course_clone_{task_id}') != request.user.id:
+        return Response({'detail': 'Not Found'}, status=status.HTTP_404_NOT_FOUND)
+
+    result = AsyncResult(task_id)
+    if result.status == states.SUCCESS:
+        return Response({'task_status': states.SUCCESS, **result.result})
+    if result.status == states.FAILURE:
+        return Response({'task_status': states.FAILURE, 'error': str(result.result)},
                         status=status.HTTP_400_BAD_REQUEST)
+    if result.status == 'PROGRESS':
+        return Response({'task_status': 'PROGRESS', **result.info})
+    return Response({'task_status': states.PENDING})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_course_readiness(request, course_id):
+    instructor = request.user
+    course = get_object_or_404(Course, id=course_id, instructor=instructor)
+    return Response(CourseReadiness.get_report(course))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def publish_course(request, course_id):
+    instructor = request.user
+    course = get_object_or_404(Course, id=course_id, instructor=instructor)
+
+    report = CourseReadiness.get_report(course, use_cache=False)
+    if not report['ready']:
+        errors = [violation['detail'] for violation in report['violations']]
+        return Response({'detail': errors[0], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
     course.active = True
     if not course.release_date:
@@ -499,8 +569,35 @@ def publish_course(request, course_id):
     return Response({'detail': 'Course published successfully'})
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notify_enrolled_learners(request, course_id):
+    """
+    Email the learners enrolled in the course, through the mail outbox.
+    """
+    instructor = request.user
+    course = get_object_or_404(Course, id=course_id, instructor=instructor)
+
+    subject = (request.data.get('subject') or '').strip()
+    message = (request.data.get('message') or '').strip()
+    if not subject or not message:
+        return Response({'detail': 'The subject and the message are required'}, status=status.HTTP_400_BAD_REQUEST)
+    subject = f'{course.title}: {subject}'
+    if '\r' in subject or '\n' in subject:
+        return Response({'detail': 'The subject must be a single line'}, status=status.HTTP_400_BAD_REQUEST)
+    max_length = OutgoingEmail._meta.get_field('subject').max_length
+    if len(subject) > max_length:
+        return Response({'detail': f'The subject is limited to {max_length - len(course.title) - 2} characters'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    recipients = CourseEnrollment.objects.filter(course=course, active=True).values_list('learner__email', flat=True)
+    emails = queue_emails(recipients, subject, message)
+    return Response({'queued': len(emails)}, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_safe
 def get_enrollment_analytics(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
@@ -536,6 +633,7 @@ def get_course_completion_analytics(request, course_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_safe
 def get_daily_activity_analytics(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
@@ -568,6 +666,7 @@ def get_daily_activity_analytics(request, course_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_safe
 def get_lesson_steps_engagement_analytics(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
@@ -628,6 +727,7 @@ def get_lesson_steps_engagement_analytics(request, course_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_safe
 def get_lessons_engagement_analytics(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
@@ -672,6 +772,7 @@ def get_lessons_engagement_analytics(request, course_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_safe
 def get_course_assessments_analytics(request, course_id):
     instructor = request.user
     course = get_object_or_404(Course, id=course_id, instructor=instructor)
@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from courses.models import Lesson
+
+MIN_CHAPTERS = 2
+MIN_LESSONS = 10
+MIN_ASSIGNMENT_STEPS = 10
+MIN_INTRO_LENGTH = 100
+DEFAULT_COURSE_IMAGE = 'courses/images/default.jpg'
+
+READINESS_CACHE_TIMEOUT = 3600
+
+
+def get_readiness_cache_key(course_id):
+    return f'course_readiness_{course_id}'
+
+
+def invalidate_readiness_report(course_id):
+    cache.delete(get_readiness_cache_key(course_id))
+
+
+class CourseReadiness:
+    """
+    Checks every publishing rule of a course at once, with one query for the chapters
+    and one grouped query for the lessons, and reports all the violations instead of the first one.
+    """
+
+    @classmethod
+    def get_report(cls, course, use_cache=True):
+        cache_key = get_readiness_cache_key(course.id)
+        if use_cache:
+            report = cache.get(cache_key)
+            if report is not None:
+                return report
+
+        report = cls.build_report(course)
+        cache.set(cache_key, report, READINESS_CACHE_TIMEOUT)
+        return report
+
+    @classmethod
+    def build_report(cls, course):
+        chapter_ids = list(course.chapter_set.values_list('id', flat=True))
+        lessons = cls.get_lesson_stats(course)
+
+        lessons_count = len(lessons)
+        assignment_steps_count = sum(lesson['assignment_steps_count'] for lesson in lessons)
+        chapters_with_lessons = {lesson['chapter'] for lesson in lessons}
+        empty_chapters = [chapter_id for chapter_id in chapter_ids if chapter_id not in chapters_with_lessons]
+        empty_lessons = [lesson['id'] for lesson in lessons if lesson['steps_count'] == 0]
+        lessons_missing_videos = [lesson['id'] for lesson in lessons if lesson['missing_videos_count'] > 0]
+
+        violations = []
+
+        def add_violation(code, detail, **extra):
+            violations.append({'code': code, 'detail': detail, **extra})
+
+        # Course should have at least 2 chapters, 10 lessons
+        # and 10 assignment steps (quiz, code challenge, sorting problem, text problem)
+        if len(chapter_ids) < MIN_CHAPTERS:
+            add_violation('min_chapters', f'The course must have at least {MIN_CHAPTERS} chapters to be published')
+        if lessons_count < MIN_LESSONS:
+            add_violation('min_lessons', f'The course must have at least {MIN_LESSONS} lessons to be published')
+        if assignment_steps_count < MIN_ASSIGNMENT_STEPS:
+            add_violation('min_assignment_steps',
+                          f'The course must have at least {MIN_ASSIGNMENT_STEPS} assignment steps to be published')
+
+        if empty_chapters:
+            add_violation('empty_chapters',
+                          'Course has empty chapters. Please add lessons to all chapters or remove the empty '
+                          'chapters before publishing.', chapters=empty_chapters)
+        if empty_lessons:
+            add_violation('empty_lessons',
+                          'Course has empty lessons. Please add lesson steps to all lessons or remove the empty '
+                          'lessons before publishing.', lessons=empty_lessons)
+        if lessons_missing_videos:
+            add_violation('missing_videos', 'All video steps should have a video URL before publishing the course',
+                          lessons=lessons_missing_videos)
+
+        if not course.image or course.image.name == DEFAULT_COURSE_IMAGE:
+            add_violation('missing_logo', 'Course logo must be uploaded before publishing the course')
+        if len(course.intro or '') < MIN_INTRO_LENGTH:
+            add_violation('short_intro', f'Course summary should be at least {MIN_INTRO_LENGTH} characters long')
+        if not course.category_id:
+            add_violation('missing_category', 'Category must be set for the course before publishing')
+
+        return {
+            'ready': not violations,
+            'violations': violations,
+            'stats': {
+                'chapters_count': len(chapter_ids),
+                'lessons_count': lessons_count,
+                'assignment_steps_count': assignment_steps_count,
+            },
+        }
+
+    @staticmethod
+    def get_lesson_stats(course):
+        assignment_step = (Q(baselessonstep__quiz_step__isnull=False)
+                           | Q(baselessonstep__code_challenge_step__isnull=False)
+                           | Q(baselessonstep__sorting_problem_step__isnull=False)
+                           | Q(baselessonstep__text_problem_step__isnull=False))
+        missing_video = (Q(baselessonstep__video_step__isnull=False)
+                         & (Q(baselessonstep__video_step__video_file=None)
+                            | Q(baselessonstep__video_step__video_file='')))
+
+        return list(
+            Lesson.objects.filter(chapter__course=course)
+            .order_by()
+            .values('id', 'chapter')
+            .annotate(steps_count=Count('baselessonstep'),
+                      assignment_steps_count=Count('baselessonstep', filter=assignment_step),
+                      missing_videos_count=Count('baselessonstep', filter=missing_video))
+        )
@@ -1,11 +1,12 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 
+from courses.signals import lesson_steps_changed
 from courses.models import Course, Chapter, Lesson, BaseLessonStep, QuizLessonStep, CodeChallengeLessonStep, \
-    SortingProblemLessonStep, TextProblemLessonStep
+    SortingProblemLessonStep, TextProblemLessonStep, VideoLessonStep
 from .models import CourseCompletionAnalytics
-from .tasks import update_learner_progress_for_deleted_item, refresh_learner_course_cache
+from .readiness import invalidate_readiness_report
+from .tasks import update_learner_progress_for_deleted_item, schedule_learner_course_cache_refresh
 
 
 @receiver(post_save, sender=Course)
@@ -33,7 +34,47 @@ def handle_step_delete(sender, instance, **kwargs):
 @receiver(post_save, sender=CodeChallengeLessonStep)
 @receiver(post_save, sender=SortingProblemLessonStep)
 @receiver(post_save, sender=TextProblemLessonStep)
+@receiver(post_save, sender=VideoLessonStep)
 def invalidate_course_cache(sender, instance, **kwargs):
-    course_id = instance.base_step.lesson.chapter.course.id
-    cache.delete(f"learner_course_{course_id}")
-    refresh_learner_course_cache.delay(course_id)
+    course_id = instance.base_step.lesson.chapter.course_id
+    schedule_learner_course_cache_refresh(course_id)
+
+
+@receiver(post_save, sender=Course)
+def invalidate_course_readiness(sender, instance, **kwargs):
+    invalidate_readiness_report(instance.id)
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def invalidate_chapter_course_readiness(sender, instance, **kwargs):
+    invalidate_readiness_report(instance.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_course_readiness(sender, instance, **kwargs):
+    course_id = Chapter.objects.filter(id=instance.chapter_id).values_list('course_id', flat=True).first()
+    if course_id:
+        invalidate_readiness_report(course_id)
+
+
+@receiver(post_save, sender=BaseLessonStep)
+@receiver(post_delete, sender=BaseLessonStep)
+@receiver(post_save, sender=VideoLessonStep)
+@receiver(post_save, sender=QuizLessonStep)
+@receiver(post_save, sender=CodeChallengeLessonStep)
+@receiver(post_save, sender=SortingProblemLessonStep)
+@receiver(post_save, sender=TextProblemLessonStep)
+def invalidate_step_course_readiness(sender, instance, **kwargs):
+    lesson_id = instance.lesson_id if sender is BaseLessonStep else instance.base_step.lesson_id
+    course_id = Lesson.objects.filter(id=lesson_id).values_list('chapter__course_id', flat=True).first()
+    if course_id:
+        invalidate_readiness_report(course_id)
+
+
+@receiver(lesson_steps_changed)
+def handle_lesson_steps_changed(sender, lesson, **kwargs):
+    course_id = lesson.chapter.course_id
+    invalidate_readiness_report(course_id)
+    schedule_learner_course_cache_refresh(course_id)
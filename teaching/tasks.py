@@ -2,10 +2,13 @@ from celery import shared_task
 from django.core.cache import cache
 from django.db import transaction
 
-from django.core.management import call_command
+from courses.cache_utils import refresh_learner_course_data
+from courses.course_copy import clone_course as clone_course_tree
+from courses.models import Course
 from learning.models import LearnerProgress
 
 BATCH_SIZE = 1000  # Adjust the batch size according to your needs
+REFRESH_DELAY = 10  # seconds
 
 
 @shared_task
@@ -41,6 +44,38 @@ def array_remove(array, element):
     return [x for x in array if x != element]
 
 
+def get_refresh_pending_key(course_id):
+    return f"learner_course_refresh_pending_{course_id}"
+
+
+def schedule_learner_course_cache_refresh(course_id):
+    """
+    Invalidate the learner course cache and refresh it REFRESH_DELAY seconds after the commit. The edits made in the
+    meantime are covered by the same refresh, so saving a lesson with many steps serializes the course once.
+    """
+    cache.delete(f"learner_course_{course_id}")
+    # Expires in case the task is lost, so the course can be refreshed again
+    if cache.add(get_refresh_pending_key(course_id), True, REFRESH_DELAY * 6):
+        transaction.on_commit(
+            lambda: refresh_learner_course_cache.apply_async((str(course_id),), countdown=REFRESH_DELAY))
+
+
 @shared_task
 def refresh_learner_course_cache(course_id):
-    call_command('refresh_learner_cached_course', course_id)
+    # Cleared before serializing, the edits made from now on schedule another refresh
+    cache.delete(get_refresh_pending_key(course_id))
+    course = Course.objects.filter(id=course_id).first()
+    if course is None:
+        return 'Deleted'
+    refresh_learner_course_data(course)
+    return 'Done'
+
+
+@shared_task(bind=True)
+def clone_course(self, course_id, instructor_id, new_course_id, title=None):
+    def report_progress(written, total):
+        self.update_state(state='PROGRESS', meta={'written': written, 'total': total, 'course_id': new_course_id})
+
+    course = clone_course_tree(course_id, instructor_id, new_course_id=new_course_id, title=title,
+                               progress_callback=report_progress)
+    return {'course_id': str(course.id)}
@@ -2,3 +2,4 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 admin.site.register(User)
+admin.site.register(OutgoingEmail)
@@ -1,16 +1,22 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 
-from .serializer_fields import ImageOrUrlField
+from courses.api.mixins import RemoteImageMixin
+from courses.api.serializer_fields import ImageOrUrlField, ImageVariantsField
 from courses.models import Course
 from users.api.mixins import PrivacyMixin
+from users.authentication import add_claims, is_token_revoked, AUTH_TIME_CLAIM
 from users.models import User
 
 
 class SimpleProfileSerializer(PrivacyMixin, serializers.ModelSerializer):
+    picture_srcset = ImageVariantsField(image_field='picture')
+
     class Meta:
         model = User
-        fields = ['id', 'first_name', 'last_name', 'is_private', 'short_bio', 'picture']
+        fields = ['id', 'first_name', 'last_name', 'is_private', 'short_bio', 'picture', 'picture_srcset']
 
 
 class ProfileCourseSerializer(serializers.ModelSerializer):
@@ -51,7 +57,7 @@ class SimpleCourseSerializer(serializers.ModelSerializer):
         fields = ['id', 'title']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(RemoteImageMixin, serializers.ModelSerializer):
     wishlist = SimpleCourseSerializer(many=True, read_only=True)
     enrolled_courses = SimpleCourseSerializer(many=True, read_only=True)
     picture = ImageOrUrlField(required=False, allow_null=True)
@@ -103,3 +109,23 @@ class SetNewPasswordSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     token = serializers.CharField(write_only=True, required=True)
     uidb64 = serializers.CharField(write_only=True, required=True)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Adds the claims read by users.authentication.ClaimsJWTAuthentication to the tokens, copied to the access tokens
+    created by the refresh.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if AUTH_TIME_CLAIM in refresh and is_token_revoked(refresh):
+            raise InvalidToken('Token is revoked')
+        return super().validate(attrs)
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users import authentication
+from users.models import User
+
+
+class ClaimsAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff@test.com', 'password', 'Test', 'Staff', is_staff=True,
+                                             email_confirmed=True)
+        self.client = APIClient()
+        # Any endpoint reading the claims only
+        self.url = reverse('code-evaluation-queues')
+        patcher = patch('learning.api.views.submission_scheduler.get_queue_depths', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+        authentication._local_cache.clear()
+
+    def login(self):
+        response = self.client.post(reverse('token_obtain_pair'), {'email': 'staff@test.com', 'password': 'password'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['tokens']
+
+    def get(self, access_token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+        return self.client.get(self.url)
+
+    def test_tokens_carry_the_claims(self):
+        access_token = AccessToken(self.login()['access'])
+
+        self.assertTrue(access_token['is_active'])
+        self.assertTrue(access_token['is_staff'])
+        self.assertFalse(access_token['is_superuser'])
+        self.assertIn('auth_time', access_token)
+
+    def test_authentication_without_query(self):
+        access_token = self.login()['access']
+
+        with self.assertNumQueries(0):
+            response = self.get(access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_fields_are_loaded_at_once(self):
+        user = authentication.build_user(self.user.id, {'is_active': True, 'is_staff': True, 'is_superuser': False})
+        self.assertEqual((user.is_active, user.is_staff, user.is_superuser), (True, True, False))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'staff@test.com')
+            self.assertEqual(user.first_name, 'Test')
+
+    def test_password_change_revokes_the_tokens(self):
+        tokens = self.login()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new password')
+            self.user.save()
+
+        self.assertEqual(self.get(tokens['access']).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_CLAIMS_TRUST_WINDOW=0)
+    def test_claims_are_checked_after_the_trust_window(self):
+        access_token = self.login()['access']
+        self.assertEqual(self.get(access_token).status_code, status.HTTP_200_OK)
+
+        # Without the signals, as if the revocation was evicted from the cache
+        User.objects.filter(id=self.user.id).update(is_staff=False)
+        cache.clear()
+        authentication._local_cache.clear()
+
+        self.assertEqual(self.get(access_token).status_code, status.HTTP_403_FORBIDDEN)
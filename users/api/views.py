@@ -16,7 +16,7 @@ from .serializers import RegisterSerializer, SetNewPasswordSerializer, DetailedP
 from rest_framework import generics, status, serializers
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
 
-from ..tasks import send_email
+from ..mail_outbox import queue_email
 
 
 def get_email_confirmation_url(user_id):
@@ -39,7 +39,7 @@ class RegisterView(generics.CreateAPIView):
         confirmation_url = get_email_confirmation_url(user.id)
         message = f'Please click on the link to confirm your email: {confirmation_url}'
         subject = 'Confirm your email'
-        send_email.delay(user.email, subject, message)
+        queue_email(user.email, subject, message)
 
 
 @api_view(['GET'])
@@ -71,7 +71,7 @@ def resend_confirm_email(request):
         confirmation_url = get_email_confirmation_url(user.id)
         message = f'Please click on the link to confirm your email: {confirmation_url}'
         subject = 'Confirm your email'
-        send_email.delay(user.email, subject, message)
+        queue_email(user.email, subject, message)
         return Response({'message': 'Confirmation email resent.'})
 
     except User.DoesNotExist:
@@ -118,7 +118,7 @@ def request_password_reset_email(request):
         token = PasswordResetTokenGenerator().make_token(user)
         frontend_url = f'{os.environ.get("FRONTEND_URL")}/reset-password'
         reset_url = f'{frontend_url}?uidb64={uidb64}&token={token}'
-        send_email.delay(email, 'Password Reset Request', f'Please follow the link to reset your password: {reset_url}')
+        queue_email(email, 'Password Reset Request', f'Please follow the link to reset your password: {reset_url}')
         return Response({'success': 'We have sent you a link to reset your password'}, status=status.HTTP_200_OK)
     except User.DoesNotExist:
         return Response({'error': 'User with the provided email does not exist.'}, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,140 @@
+"""
+JWT authentication without a user query per request.
+
+The tokens issued at login carry the claims read by the permissions (is_active, is_staff, is_superuser), the time of
+the login (auth_time) and a hash of the password. ClaimsJWTAuthentication trusts these claims for
+AUTH_CLAIMS_TRUST_WINDOW seconds after the login, then checks them against the auth state of the user, cached in
+memcached and for a few seconds in the process. Either way, request.user is a partial User with only the claims
+loaded, its other fields are loaded together from the database on the first access to one of them.
+
+Changing the password, the active or staff flags of a user, or deleting it, revokes the tokens issued before: the
+revocation time is cached and checked on every request.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User
+
+CLAIM_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+AUTH_TIME_CLAIM = 'auth_time'
+AUTH_HASH_CLAIM = 'auth_hash'
+
+AUTH_STATE_TIMEOUT = 60 * 60
+LOCAL_CACHE_TIMEOUT = 10  # seconds, delay before a revocation applies to the other processes
+LOCAL_CACHE_MAX_SIZE = 10000
+
+_local_cache = {}
+
+
+def get_auth_state_key(user_id):
+    return f'user_auth_state_{user_id}'
+
+
+def get_revoked_at_key(user_id):
+    return f'user_tokens_revoked_at_{user_id}'
+
+
+def get_local(key, load):
+    now = time.monotonic()
+    entry = _local_cache.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    value = load()
+    if len(_local_cache) >= LOCAL_CACHE_MAX_SIZE:
+        _local_cache.clear()
+    _local_cache[key] = (now + LOCAL_CACHE_TIMEOUT, value)
+    return value
+
+
+def get_auth_hash(password):
+    # Changes with the password, like the session auth hash
+    return salted_hmac('users.authentication', password or '').hexdigest()[:16]
+
+
+def add_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    token[AUTH_TIME_CLAIM] = time.time()
+    token[AUTH_HASH_CLAIM] = get_auth_hash(user.password)
+    return token
+
+
+def load_auth_state(user_id):
+    key = get_auth_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        values = User.objects.filter(id=user_id).values(*CLAIM_FIELDS, 'password').first()
+        if values is None:
+            return None
+        state = {field: values[field] for field in CLAIM_FIELDS}
+        state[AUTH_HASH_CLAIM] = get_auth_hash(values['password'])
+        cache.set(key, state, AUTH_STATE_TIMEOUT)
+    return state
+
+
+def get_auth_state(user_id):
+    """
+    :return: the claims of the user as currently stored, or None if it doesn't exist
+    """
+    return get_local(get_auth_state_key(user_id), lambda: load_auth_state(user_id))
+
+
+def revoke_user_tokens(user_id):
+    cache.set(get_revoked_at_key(user_id), time.time(), None)
+    cache.delete(get_auth_state_key(user_id))
+    _local_cache.pop(get_revoked_at_key(user_id), None)
+    _local_cache.pop(get_auth_state_key(user_id), None)
+
+
+def is_token_revoked(token):
+    user_id = token[api_settings.USER_ID_CLAIM]
+    key = get_revoked_at_key(user_id)
+    revoked_at = get_local(key, lambda: cache.get(key))
+    return revoked_at is not None and token.get(AUTH_TIME_CLAIM, 0) < revoked_at
+
+
+def build_user(user_id, claims):
+    """
+    A User with only the id and the claims loaded, as if fetched with .only(), see User.refresh_from_db.
+    """
+    values = {'id': uuid.UUID(str(user_id)), **{field: claims[field] for field in CLAIM_FIELDS}}
+    # In the order of the model fields, as expected by from_db
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        if AUTH_TIME_CLAIM not in validated_token:
+            # Issued before the claims were added
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if is_token_revoked(validated_token):
+            raise AuthenticationFailed(_('Token is revoked'), code='token_revoked')
+
+        if time.time() - validated_token[AUTH_TIME_CLAIM] < settings.AUTH_CLAIMS_TRUST_WINDOW:
+            claims = validated_token
+        else:
+            claims = get_auth_state(user_id)
+            if claims is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            # Covers the revocations lost by the cache
+            if claims[AUTH_HASH_CLAIM] != validated_token.get(AUTH_HASH_CLAIM):
+                raise AuthenticationFailed(_('Token is revoked'), code='token_revoked')
+
+        if not claims['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return build_user(user_id, claims)
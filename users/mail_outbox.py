@@ -0,0 +1,154 @@
+"""
+Outbox of the emails sent by the platform.
+
+The emails are saved to the OutgoingEmail table and sent by the send_outbox_emails task, queued once the transaction
+of the emails commits and run every minute by celery beat. It sends them in batches of MAIL_OUTBOX_BATCH_SIZE over a
+single SMTP connection, one message at a time, with at most MAIL_OUTBOX_RATE_LIMIT emails per minute, and retries
+the failed ones with an increasing delay.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection, EmailMessage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60  # seconds, doubled on every attempt
+SENT_RETENTION = datetime.timedelta(days=30)
+DRAIN_SCHEDULED_KEY = 'mail_outbox_drain_scheduled'
+DRAIN_SCHEDULED_TIMEOUT = 60
+
+
+def queue_email(to_email, subject, body):
+    return queue_emails([to_email], subject, body)[0]
+
+
+def queue_emails(recipients, subject, body):
+    """
+    Save an email to every recipient to the outbox, they're sent after the current transaction commits.
+    """
+    emails = OutgoingEmail.objects.bulk_create(
+        [OutgoingEmail(to_email=to_email, subject=subject, body=body) for to_email in recipients],
+        batch_size=1000)
+    transaction.on_commit(schedule_drain)
+    return emails
+
+
+def schedule_drain():
+    from users.tasks import send_outbox_emails
+
+    # A single task for the emails queued in the meantime, it sends all of them
+    if cache.add(DRAIN_SCHEDULED_KEY, True, DRAIN_SCHEDULED_TIMEOUT):
+        send_outbox_emails.delay()
+
+
+def get_rate_limit_key(now):
+    return f'mail_outbox_sent_{now:%Y%m%d%H%M}'
+
+
+def get_remaining_rate(now):
+    """
+    :return: the number of emails that can still be sent in the current minute
+    """
+    key = get_rate_limit_key(now)
+    cache.add(key, 0, 2 * 60)
+    return max(settings.MAIL_OUTBOX_RATE_LIMIT - (cache.get(key) or 0), 0)
+
+
+def record_sent(now, count):
+    key = get_rate_limit_key(now)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.set(key, count, 2 * 60)
+
+
+def build_message(email, connection):
+    return EmailMessage(subject=email.subject, body=email.body, to=[email.to_email], connection=connection)
+
+
+def mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)[:1000]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutgoingEmail.Status.FAILED
+        logger.error(f'Email {email.id} to {email.to_email} failed {email.attempts} times: {error}')
+    else:
+        email.send_after = now + datetime.timedelta(seconds=RETRY_DELAY * 2 ** (email.attempts - 1))
+    email.save(update_fields=['attempts', 'last_error', 'status', 'send_after'])
+
+
+def reopen(connection):
+    # The connection may be broken after a failure, a new one is tried for the next emails
+    connection.close()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning(f'Could not reopen the SMTP connection: {e}')
+
+
+def send_batch(emails, connection):
+    """
+    Send the emails one by one over the connection, each one marked as sent once accepted by the server. The SMTP
+    backend stops at the first failure of a batch after sending the emails before it, so they're never sent together.
+
+    :return: the number of sent emails
+    """
+    sent = 0
+    for email in emails:
+        now = timezone.now()
+        try:
+            connection.send_messages([build_message(email, connection)])
+        except Exception as e:
+            mark_failed(email, e, now)
+            reopen(connection)
+            continue
+
+        OutgoingEmail.objects.filter(id=email.id).update(
+            status=OutgoingEmail.Status.SENT, sent_at=now, attempts=F('attempts') + 1, last_error=None)
+        sent += 1
+    return sent
+
+
+def drain_outbox():
+    """
+    Send the pending emails, until none is left or the rate limit is reached.
+
+    :return: (number of emails sent, whether pending emails are left)
+    """
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    # Opened here, else every send_messages call would open and close its own connection
+    connection.open()
+    try:
+        while True:
+            now = timezone.now()
+            batch_size = min(settings.MAIL_OUTBOX_BATCH_SIZE, get_remaining_rate(now))
+            if batch_size == 0:
+                return sent, True
+
+            with transaction.atomic():
+                # Locked until sent, so the concurrent drains send other emails
+                emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                    status=OutgoingEmail.Status.PENDING, send_after__lte=now).order_by('id')[:batch_size])
+                if not emails:
+                    return sent, False
+                batch_sent = send_batch(emails, connection)
+
+            record_sent(now, len(emails))
+            sent += batch_sent
+    finally:
+        connection.close()
+
+
+def delete_sent_emails():
+    OutgoingEmail.objects.filter(status=OutgoingEmail.Status.SENT,
+                                 sent_at__lt=timezone.now() - SENT_RETENTION).delete()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='picture_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 import uuid
 
@@ -55,6 +56,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_private = models.BooleanField(default=False, null=False, blank=False)
     picture = models.ImageField(null=True, blank=True,
                                 upload_to='profiles/images/', default='profiles/images/user-default.png')
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)  # see courses.image_variants
     linked_in = models.CharField(max_length=200, null=True, blank=True)
     facebook = models.CharField(max_length=200, null=True, blank=True)
     personal_website = models.CharField(max_length=200, null=True, blank=True)
@@ -75,3 +77,38 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # The first access to a deferred field loads all of them, users.authentication only loads the token claims
+        if fields is not None:
+            fields = set(fields)
+            deferred_fields = self.get_deferred_fields()
+            if fields & deferred_fields:
+                fields |= deferred_fields
+        super().refresh_from_db(using, fields, **kwargs)
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email of the outbox, sent in batches by users.tasks.send_outbox_emails, see users.mail_outbox.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        SENT = 'sent', 'Sent'
+        FAILED = 'failed', 'Failed'
+
+    to_email = models.EmailField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    send_after = models.DateTimeField(default=timezone.now)  # postponed by the retries
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'send_after'])]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to_email} ({self.status})'
@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens, CLAIM_FIELDS
+from .models import User
+
+
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_auth_change(sender, instance, **kwargs):
+    """
+    The tokens carry the claims and a hash of the password, see users.authentication.
+    """
+    if instance._state.adding:
+        return
+
+    fields = [*CLAIM_FIELDS, 'password']
+    stored = User.objects.filter(id=instance.id).values(*fields).first()
+    if stored and any(stored[field] != getattr(instance, field) for field in fields):
+        transaction.on_commit(lambda: revoke_user_tokens(instance.id))
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: revoke_user_tokens(instance.id))
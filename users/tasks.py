@@ -1,15 +1,31 @@
 from celery import shared_task
-from django.conf.global_settings import EMAIL_HOST_USER
-from django.core.mail import send_mail
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+
+from users import mail_outbox
+
+logger = get_task_logger(__name__)
 
 
 @shared_task(bind=True)
 def send_email(self, target_mail, mail_subject, message):
-    send_mail(
-        subject=mail_subject,
-        message=message,
-        from_email=EMAIL_HOST_USER,
-        recipient_list=[target_mail],
-        fail_silently=False,
-        )
-    return 'Done'
+    # Kept for the tasks queued before the outbox, new emails are queued with mail_outbox.queue_email
+    mail_outbox.queue_email(target_mail, mail_subject, message)
+    return 'Queued'
+
+
+@shared_task
+def send_outbox_emails():
+    # Cleared first, the emails queued from now on schedule another run
+    cache.delete(mail_outbox.DRAIN_SCHEDULED_KEY)
+    sent, rate_limited = mail_outbox.drain_outbox()
+    if rate_limited:
+        # Continued in the next minute of the rate limit
+        send_outbox_emails.apply_async(countdown=60)
+    logger.info(f"Sent {sent} emails from the outbox")
+    return sent
+
+
+@shared_task
+def delete_sent_emails():
+    mail_outbox.delete_sent_emails()